@@ -0,0 +1,68 @@
+"""
+Delivery time of a burst of anomaly alerts through ingestion/alert_dispatcher.py,
+against a local webhook stub (tests/stubs.py).
+
+    python benchmarks/bench_alert_dispatch.py --cities 500 --rate 20
+
+Reports how many messages the burst was packed into, how long delivery took
+and the achieved send rate next to the configured limit. Correctness
+(ordering, retries, deadline, deduplication) is covered by
+tests/test_alert_dispatcher.py.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+
+from alert_dispatcher import AlertDispatcher, NotifiedState  # noqa: E402
+from tests.stubs import WebhookStub  # noqa: E402
+
+
+def make_rows(cities: int, day: date) -> list[dict]:
+    return [
+        {"DATE": day, "CITY": f"city_{i:05d}", "BOOKINGS_TOTAL": 100 + i, "ZSCORE": 3.0 + i / 100}
+        for i in range(cities)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", type=int, nargs="+", default=[50, 500, 5000], help="Anomalies per burst.")
+    parser.add_argument("--rate", type=float, default=20.0, help="Messages per second.")
+    args = parser.parse_args()
+
+    stub = WebhookStub()
+    results = []
+    for cities in args.cities:
+        stub.reset()
+        with tempfile.TemporaryDirectory() as tmp:
+            dispatcher = AlertDispatcher(
+                stub.url, state=NotifiedState(Path(tmp) / "notified.json"),
+                rate_per_second=args.rate, deadline_seconds=3600,
+            )
+            t0 = time.perf_counter()
+            result = dispatcher.dispatch(make_rows(cities, date.today()))
+            elapsed = time.perf_counter() - t0
+        results.append({
+            "anomalies": cities,
+            "messages": result.messages,
+            "sent": result.sent,
+            "seconds": round(elapsed, 3),
+            "messages_per_sec": round(result.messages / elapsed, 2) if elapsed else None,
+            "rate_limit": args.rate,
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+    stub.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
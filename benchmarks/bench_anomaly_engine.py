@@ -0,0 +1,103 @@
+"""
+Parity check and throughput benchmark for ingestion/anomaly_engine.py.
+
+    python benchmarks/bench_anomaly_engine.py --cities 1000 --days 3000
+
+Generates synthetic metrics_daily rows (with injected spikes and flat runs),
+scores them with the streaming engine, and, unless --skip-parity, runs
+dbt_project/models/marts/anomalies_daily.sql (full refresh, rendered as
+bench_pipeline.py does) on DuckDB over the same rows and asserts both agree
+row for row.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+
+from anomaly_engine import AnomalyEngine, score_metrics  # noqa: E402
+from benchmarks.bench_pipeline import DUCKDB_COMPAT, render_model  # noqa: E402
+
+
+def make_metrics(cities: int, days: int, seed: int = 42) -> pd.DataFrame:
+    """Date-major metrics_daily rows: Poisson counts, occasional spikes and constant stretches."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-01", periods=days, freq="D").date
+    totals = rng.poisson(50, size=(days, cities))
+    totals[rng.random((days, cities)) < 0.01] *= 4
+    # Flat runs exercise the sd30 == 0 branch
+    totals[: min(days, 40), : max(1, cities // 10)] = 7
+    return pd.DataFrame({
+        "date": np.repeat(dates, cities),
+        "city": np.tile([f"city_{i:05d}" for i in range(cities)], days),
+        "bookings_total": totals.ravel(),
+    })
+
+
+def check_parity(metrics: pd.DataFrame, engine_out: pd.DataFrame) -> int:
+    import duckdb
+
+    con = duckdb.connect()
+    for stmt in DUCKDB_COMPAT:
+        con.execute(stmt)
+    con.execute("create schema MARTS")
+    con.register("metrics", metrics)
+    con.execute("create table MARTS.metrics_daily as select *, localtimestamp as refreshed_at from metrics")
+    sql = render_model("anomalies_daily", incremental=False)
+    sql_out = con.execute(f"select * from ({sql}) order by city, date").df()
+    eng = engine_out.sort_values(["city", "date"]).reset_index(drop=True)
+    assert len(sql_out) == len(eng), (len(sql_out), len(eng))
+    assert (sql_out["is_anomaly"].to_numpy() == eng["is_anomaly"].to_numpy()).all(), "is_anomaly differs"
+    for col in ["ma30", "sd30", "zscore"]:
+        a = sql_out[col].astype(float).to_numpy()
+        b = eng[col].astype(float).to_numpy()
+        assert (np.isnan(a) == np.isnan(b)).all(), f"{col} nulls differ"
+        ok = np.isnan(a) | np.isclose(a, b, rtol=1e-9, atol=1e-9)
+        assert ok.all(), f"{col} differs in {int((~ok).sum())} rows"
+    return len(eng)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=3000)
+    parser.add_argument("--skip-parity", action="store_true")
+    args = parser.parse_args()
+
+    metrics = make_metrics(args.cities, args.days)
+    rows = list(zip(metrics["date"], metrics["city"], metrics["bookings_total"].tolist()))
+
+    # Streaming: rows arrive date by date, cities interleaved
+    engine = AnomalyEngine()
+    t0 = time.perf_counter()
+    flagged = sum(r.is_anomaly for r in engine.run(rows))
+    stream_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = score_metrics(metrics)
+    batch_s = time.perf_counter() - t0
+
+    result = {
+        "city_days": len(rows),
+        "anomalies": flagged,
+        "stream_seconds": round(stream_s, 3),
+        "stream_rows_per_sec": round(len(rows) / stream_s),
+        "batch_seconds": round(batch_s, 3),
+    }
+    if not args.skip_parity:
+        t0 = time.perf_counter()
+        result["parity_rows"] = check_parity(metrics, batch)
+        result["parity_seconds"] = round(time.perf_counter() - t0, 3)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Fetch time of ingestion/fetch_weather.py against a local Open-Meteo stub
+(tests/stubs.py) that answers each request after --latency seconds.
+
+    python benchmarks/bench_fetch_weather.py --cities 12 --days 200 --workers 1 4 8
+
+For each worker count: a cold fetch of every city through an empty
+ResponseCache (one request per calendar month), then a warm fetch of the same
+window from the cache. Correctness (retries, Retry-After, cache keys, bounded
+concurrency) is covered by tests/test_fetch_weather.py.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+
+from tests.stubs import ArchiveStub  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", type=int, default=12)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the stub takes per request.")
+    args = parser.parse_args()
+
+    stub = ArchiveStub(latency=args.latency)
+    # fetch_weather reads its URL at import time
+    os.environ["OPEN_METEO_URL"] = stub.url
+    from fetch_weather import ResponseCache, fetch_all
+
+    cities = {f"city_{i:03d}": {"lat": 25.0, "lon": 55.0, "tz": "Asia/Dubai"} for i in range(args.cities)}
+    end = date(2024, 12, 31)
+    start = end - timedelta(days=args.days)
+    results = []
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(Path(tmp))
+            for run in ("cold", "warm"):
+                stub.reset()
+                t0 = time.perf_counter()
+                frames = fetch_all(cities, start, end, cache=cache, max_workers=workers)
+                elapsed = time.perf_counter() - t0
+                results.append({
+                    "workers": workers,
+                    "run": run,
+                    "requests": stub.attempts,
+                    "rows": sum(len(f) for f in frames),
+                    "seconds": round(elapsed, 3),
+                    "requests_per_sec": round(stub.attempts / elapsed, 1) if elapsed else None,
+                })
+                print(json.dumps(results[-1]), file=sys.stderr)
+    stub.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
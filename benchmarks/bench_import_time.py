@@ -0,0 +1,96 @@
+"""
+Import-time report and regression check for the ingestion CLIs.
+
+    python benchmarks/bench_import_time.py [--runs 5] [--top 10] [--json out.json]
+
+Imports each entry point in a fresh interpreter under `python -X importtime`,
+reports the best-of-N cumulative import time and the heaviest modules it
+pulled in, and exits 1 if a module in FORBIDDEN was imported at load time
+(those must stay behind the code paths that use them).
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+# (label, directory put on sys.path, module to import)
+ENTRY_POINTS = [
+    ("alert_anomalies", BASE_DIR, "alert_anomalies"),
+    ("utils", BASE_DIR / "ingestion", "utils"),
+    ("generate_synthetic", BASE_DIR / "ingestion", "generate_synthetic"),
+    ("load_csvs", BASE_DIR / "ingestion", "load_csvs"),
+    ("fetch_weather", BASE_DIR / "ingestion", "fetch_weather"),
+]
+
+# Top-level packages an entry point must not import just by being loaded
+FORBIDDEN = {
+    # pyarrow (and numpy under it) reads the local metrics cache; drivers load only on refresh
+    "alert_anomalies": {"pandas", "snowflake", "duckdb", "faker"},
+    "utils": {"pandas", "numpy", "pyarrow", "snowflake", "duckdb"},
+    "generate_synthetic": {"faker", "snowflake", "duckdb"},
+    "load_csvs": {"snowflake", "duckdb", "faker"},
+    "fetch_weather": {"snowflake", "duckdb", "faker"},
+}
+
+# import time:      self [us] |  cumulative | imported package
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(path: Path, module: str) -> tuple[int, list[tuple[str, int]]]:
+    """Returns (cumulative us for module, [(top-level module, cumulative us)])."""
+    code = f"import sys; sys.path.insert(0, {str(path)!r}); import {module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=BASE_DIR,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    total, packages = 0, {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cumulative, name = int(m.group(2)), m.group(4)
+        top = name.split(".")[0]
+        packages[top] = max(packages.get(top, 0), cumulative)
+        if name == module:
+            total = cumulative
+    return total, sorted(packages.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point; best run is kept.")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest packages to list per entry point.")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for label, path, module in ENTRY_POINTS:
+        runs = [import_profile(path, module) for _ in range(args.runs)]
+        total, packages = min(runs, key=lambda r: r[0])
+        imported = {name for name, _ in packages}
+        leaked = sorted(FORBIDDEN.get(label, set()) & imported)
+        failed |= bool(leaked)
+        results[label] = {
+            "import_ms": round(total / 1000, 1),
+            "heaviest": [(name, round(us / 1000, 1)) for name, us in packages[: args.top]],
+            "forbidden_imports": leaked,
+        }
+        status = f"FAIL imports {', '.join(leaked)}" if leaked else "ok"
+        print(f"{label:<20} {total / 1000:>8.1f} ms  {status}")
+        for name, ms in results[label]["heaviest"]:
+            print(f"    {name:<28} {ms:>8.1f} ms")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+Throughput and peak-memory benchmark for load_csvs.load_table() on the local
+DuckDB backend, comparing whole-file reads with chunked streaming.
+
+    python benchmarks/bench_load_csvs.py --rows 1000000 10000000 --chunksize 250000 --memory-limit 256MB
+
+Each (rows, mode) case runs in a fresh subprocess. Memory is sampled every
+50 ms and split into:
+
+  - duckdb_peak_mb: DuckDB's buffer pool (staging table, target, MERGE).
+    It grows with the staged rows until DUCKDB_MEMORY_LIMIT (--memory-limit),
+    then DuckDB spills to DUCKDB_TEMP_DIR (spill_peak_mb). Without a limit
+    the whole staging table stays in memory, so chunked loads grow with the
+    file as fast as full ones.
+  - client_peak_mb: the rest of the RSS. In chunked mode this is roughly one
+    parsed chunk plus the interpreter while staging, but the MERGE also
+    allocates outside the buffer pool, so it still grows slowly with the row
+    count. It is not flat, just far below full mode.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+
+BOOKING_DATES = ["requested_at", "assigned_at", "completed_at", "canceled_at", "updated_at"]
+
+
+def write_bookings_csv(fp: Path, n: int, batch: int = 1_000_000, seed: int = 42) -> None:
+    """Writes n synthetic bookings to fp in batches, without holding them all in memory."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp.now().floor("s") - pd.Timedelta(days=180)
+    header = True
+    for lo in range(0, n, batch):
+        m = min(batch, n - lo)
+        requested = start + pd.to_timedelta(rng.integers(0, 180 * 86400, m), unit="s")
+        assigned = requested + pd.to_timedelta(rng.integers(0, 8 * 60 + 1, m), unit="m")
+        status = rng.choice(["completed", "canceled", "pending"], m, p=[0.7, 0.2, 0.1])
+        completed = pd.Series(assigned + pd.to_timedelta(rng.integers(60, 8 * 60 + 1, m), unit="m"))
+        canceled = pd.Series(assigned + pd.to_timedelta(rng.integers(5, 121, m), unit="m"))
+        pd.DataFrame({
+            "booking_id": [f"B{i:09d}" for i in range(lo + 1, lo + m + 1)],
+            "customer_id": [f"C{i:05d}" for i in rng.integers(1, 501, m)],
+            "worker_id": [f"W{i:05d}" for i in rng.integers(1, 201, m)],
+            "city": rng.choice(["Dubai", "Abu Dhabi", "Sharjah"], m),
+            "channel": rng.choice(["app", "web", "call_center"], m),
+            "status": status,
+            "price": rng.uniform(80, 400, m).round(2),
+            "requested_at": requested,
+            "assigned_at": assigned,
+            "completed_at": completed.where(status == "completed"),
+            "canceled_at": canceled.where(status == "canceled"),
+            "updated_at": requested + pd.to_timedelta(rng.integers(0, 3 * 24 * 60 + 1, m), unit="m"),
+        }).to_csv(fp, mode="w" if header else "a", header=header, index=False)
+        header = False
+
+
+class MemorySampler:
+    """Polls process RSS, DuckDB's buffer pool and its spill files in a background thread."""
+
+    QUERY = """
+        select (select coalesce(sum(memory_usage_bytes), 0) from duckdb_memory()),
+               (select coalesce(sum(size), 0) from duckdb_temporary_files())
+    """
+
+    def __init__(self, conn, interval: float = 0.05):
+        self.cur = conn.raw.cursor()
+        self.interval = interval
+        self.rss_peak = self.duckdb_peak = self.client_peak = self.spill_peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss() -> int:
+        # /proc/self/statm counts pages (Linux only)
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            duckdb_bytes, spill_bytes = self.cur.execute(self.QUERY).fetchone()
+            rss = self.rss()
+            self.rss_peak = max(self.rss_peak, rss)
+            self.duckdb_peak = max(self.duckdb_peak, duckdb_bytes)
+            self.spill_peak = max(self.spill_peak, spill_bytes)
+            self.client_peak = max(self.client_peak, rss - duckdb_bytes)
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.cur.close()
+
+
+def run_case(csv_fp: Path, chunksize: int | None, memory_limit: str) -> dict:
+    """Loads csv_fp into a fresh DuckDB file and reports rows/sec and peak memory (runs in the child)."""
+    os.environ["WAREHOUSE_BACKEND"] = "duckdb"
+    os.environ["DUCKDB_PATH"] = str(csv_fp.with_suffix(f".{chunksize or 'full'}.duckdb"))
+    os.environ["DUCKDB_TEMP_DIR"] = str(csv_fp.with_suffix(f".{chunksize or 'full'}.tmp"))
+    if memory_limit:
+        os.environ["DUCKDB_MEMORY_LIMIT"] = memory_limit
+    from utils import get_conn, ensure_tables
+    from load_csvs import read_source, load_table
+
+    conn = get_conn()
+    ensure_tables(conn)
+
+    t0 = time.perf_counter()
+    with MemorySampler(conn) as sampler:
+        load_table(
+            read_source(csv_fp, BOOKING_DATES, chunksize),
+            "RAW.BOOKINGS",
+            key_cols=["booking_id"],
+            incremental=False,
+        )
+    elapsed = time.perf_counter() - t0
+    conn.close()
+
+    conn = get_conn()
+    rows = conn.cursor().execute("select count(*) from RAW.BOOKINGS").fetchone()[0]
+    conn.close()
+    Path(os.environ["DUCKDB_PATH"]).unlink(missing_ok=True)
+
+    # Sampled rather than ru_maxrss: Linux carries the parent's peak (from
+    # generating the CSV) over fork/exec, which masked the difference between modes
+    return {
+        "rows": rows,
+        "mode": f"chunked({chunksize})" if chunksize else "full",
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / elapsed) if elapsed else None,
+        "memory_limit": memory_limit or None,
+        "peak_rss_mb": round(sampler.rss_peak / (1024 * 1024), 1),
+        "client_peak_mb": round(sampler.client_peak / (1024 * 1024), 1),
+        "duckdb_peak_mb": round(sampler.duckdb_peak / (1024 * 1024), 1),
+        "spill_peak_mb": round(sampler.spill_peak / (1024 * 1024), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--chunksize", type=int, default=250_000)
+    parser.add_argument("--memory-limit", default="256MB",
+                        help="DUCKDB_MEMORY_LIMIT for the load ('' leaves DuckDB's default of 80%% of RAM).")
+    parser.add_argument("--skip-full", action="store_true", help="Only run the chunked mode.")
+    parser.add_argument("--_case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._case:
+        fp, chunksize = args._case
+        print(json.dumps(run_case(Path(fp), int(chunksize) or None, args.memory_limit)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            csv_fp = Path(tmp) / f"bookings_{n}.csv"
+            print(f"Generating {n} bookings -> {csv_fp}", file=sys.stderr)
+            write_bookings_csv(csv_fp, n)
+            modes = [args.chunksize] if args.skip_full else [0, args.chunksize]
+            for chunksize in modes:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--_case", str(csv_fp), str(chunksize), "--memory-limit", args.memory_limit],
+                    check=True, capture_output=True, text=True,
+                )
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                result["csv_mb"] = round(csv_fp.stat().st_size / (1024 * 1024), 1)
+                print(json.dumps(result), file=sys.stderr)
+                results.append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
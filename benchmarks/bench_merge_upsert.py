@@ -0,0 +1,346 @@
+"""
+Replay harness and throughput benchmark for utils.merge_upsert*() on the local
+DuckDB backend.
+
+    python benchmarks/bench_merge_upsert.py --streams 20 --batches 40
+    python benchmarks/bench_merge_upsert.py --skip-replay --table-rows 100000 1000000 --batch-rows 1000 100000
+
+Replay: seeded change streams for RAW.BOOKINGS are merged batch by batch, and
+after every batch the target (plus the inserted/updated counts and the
+OPS.INGESTION_WATERMARKS entry) must equal what ReferenceTable, a plain
+Python model of the merge semantics, says. Streams mix new keys, in-order
+updates, late updates (older updated_at than stored), duplicate keys within a
+batch, batches arriving out of updated_at order, NULL updated_at and re-sent
+unchanged rows. Batches rotate through the three write paths: merge_upsert()
+on a DataFrame, merge_upsert_chunks() on Arrow chunks (a key may be split
+across chunks) and merge_upsert_files() on Parquet files; every stream runs
+with detect_changes on and off.
+
+Throughput: for each table size the target is preloaded, then for each batch
+size --repeat batches of half updates and half new keys are merged; the
+median seconds and rows/sec are reported.
+
+Any change to the merge path should leave the replay green; exit status 1 on
+the first mismatch.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+os.environ["WAREHOUSE_BACKEND"] = "duckdb"
+os.environ.setdefault("DUCKDB_PATH", ":memory:")
+
+from utils import get_watermark, merge_upsert, merge_upsert_chunks, merge_upsert_files, pooled_conn  # noqa: E402
+
+TARGET = "RAW.BOOKINGS"
+KEY = "booking_id"
+UPDATED = "updated_at"
+COLUMNS = [KEY, "customer_id", "city", "status", "price", UPDATED]
+CONTENT = [c for c in COLUMNS if c not in (KEY, UPDATED)]
+WATERMARK_SOURCE = "BENCH_MERGE_UPSERT"
+PATHS = ["frame", "arrow_chunks", "parquet_files"]
+
+
+class ReferenceTable:
+    """
+    What merge_upsert() must leave in the target:
+
+    - within a batch, only the row with the latest updated_at per key counts
+      (NULL sorts last);
+    - a new key is inserted;
+    - an existing row is replaced only if the staged updated_at >= the stored
+      one (SQL comparison, so a NULL on either side never replaces), and, with
+      detect_changes, only if some non-key column other than updated_at differs;
+    - the watermark is the max non-NULL updated_at ever staged.
+    """
+
+    def __init__(self, detect_changes: bool = True):
+        self.detect_changes = detect_changes
+        self.rows: dict[str, dict] = {}
+        self.watermark: pd.Timestamp | None = None
+
+    def apply(self, batch: list[dict]) -> tuple[int, int]:
+        latest: dict[str, dict] = {}
+        for row in batch:
+            cur = latest.get(row[KEY])
+            if cur is None or _newer(row[UPDATED], cur[UPDATED]):
+                latest[row[KEY]] = row
+        inserted = updated = 0
+        for key, row in latest.items():
+            stored = self.rows.get(key)
+            if stored is None:
+                self.rows[key] = row
+                inserted += 1
+                continue
+            if row[UPDATED] is None or stored[UPDATED] is None or row[UPDATED] < stored[UPDATED]:
+                continue
+            if self.detect_changes and all(row[c] == stored[c] for c in CONTENT):
+                continue
+            self.rows[key] = row
+            updated += 1
+        stamps = [r[UPDATED] for r in batch if r[UPDATED] is not None]
+        if stamps and (self.watermark is None or max(stamps) > self.watermark):
+            self.watermark = max(stamps)
+        return inserted, updated
+
+
+def _newer(a, b) -> bool:
+    if a is None:
+        return False
+    return b is None or a > b
+
+
+class StreamGenerator:
+    """
+    Seeded batches of booking changes. Within one batch a key never appears
+    twice with the same updated_at and different content (the merge keeps an
+    arbitrary one of such ties); exact duplicate rows are allowed.
+    """
+
+    def __init__(self, seed: int, keys: int, batch_rows: int, null_rate: float = 0.03):
+        self.rng = np.random.default_rng(seed)
+        self.keys = keys
+        self.batch_rows = batch_rows
+        self.null_rate = null_rate
+        self.clock = pd.Timestamp("2026-01-01")
+        self.sent: dict[str, dict] = {}
+
+    def _row(self, key: str, ts: pd.Timestamp | None) -> dict:
+        rng = self.rng
+        return {
+            KEY: key,
+            "customer_id": f"C{rng.integers(1, 500):05d}",
+            "city": ["Dubai", "Abu Dhabi", "Sharjah"][rng.integers(0, 3)],
+            "status": ["completed", "canceled", "pending"][rng.integers(0, 3)],
+            "price": Decimal(f"{rng.uniform(80, 400):.2f}"),
+            UPDATED: ts,
+        }
+
+    def batch(self) -> list[dict]:
+        rng = self.rng
+        # Batches may be delivered out of order: this one is stamped around a
+        # clock that mostly moves forward but sometimes jumps back
+        self.clock += pd.Timedelta(minutes=int(rng.integers(-240, 600)))
+        rows: list[dict] = []
+        used: dict[str, set] = {}
+
+        def stamp(base_minutes: int) -> pd.Timestamp | None:
+            if rng.random() < self.null_rate:
+                return None
+            return self.clock + pd.Timedelta(minutes=base_minutes)
+
+        while len(rows) < self.batch_rows:
+            key = f"B{rng.integers(1, self.keys + 1):07d}"
+            kind = rng.random()
+            if kind < 0.6 or key not in self.sent:
+                row = self._row(key, stamp(int(rng.integers(0, 60))))
+            elif kind < 0.75:
+                # Late update: older than what was last sent for the key
+                prev = self.sent[key][UPDATED] or self.clock
+                row = self._row(key, prev - pd.Timedelta(minutes=int(rng.integers(1, 1000))))
+            elif kind < 0.9:
+                # Re-send of the last version, same content, maybe a newer stamp
+                row = dict(self.sent[key])
+                if rng.random() < 0.5 and row[UPDATED] is not None:
+                    row[UPDATED] = row[UPDATED] + pd.Timedelta(minutes=int(rng.integers(1, 30)))
+            else:
+                # Same key several times in this batch
+                for _ in range(int(rng.integers(2, 4))):
+                    dup = self._row(key, stamp(int(rng.integers(0, 600))))
+                    if dup[UPDATED] not in used.setdefault(key, set()):
+                        used[key].add(dup[UPDATED])
+                        rows.append(dup)
+                if rows and rng.random() < 0.5:
+                    rows.append(dict(rows[-1]))
+                continue
+            if row[UPDATED] in used.setdefault(key, set()):
+                continue
+            used[key].add(row[UPDATED])
+            rows.append(row)
+        for row in rows:
+            self.sent[row[KEY]] = row
+        order = rng.permutation(len(rows))
+        return [rows[i] for i in order]
+
+
+def _frame(rows: list[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df["price"] = df["price"].astype(float)
+    df[UPDATED] = pd.to_datetime(df[UPDATED])
+    return df
+
+
+def merge_batch(conn, rows: list[dict], path: str, detect_changes: bool, workdir: Path):
+    df = _frame(rows)
+    kwargs = dict(key_columns=[KEY], updated_col=UPDATED, watermark_source=WATERMARK_SOURCE,
+                  detect_changes=detect_changes)
+    if path == "frame":
+        return merge_upsert(conn, TARGET, df, **kwargs)
+    import pyarrow as pa
+
+    parts = np.array_split(np.arange(len(df)), 3)
+    if path == "arrow_chunks":
+        chunks = [pa.Table.from_pandas(df.iloc[p], preserve_index=False) for p in parts]
+        return merge_upsert_chunks(conn, TARGET, chunks, **kwargs)
+    import pyarrow.parquet as pq
+
+    files = []
+    for i, p in enumerate(parts[:2] if len(df) > 1 else parts[:1]):
+        # Fresh names: duckdb caches Parquet metadata by path
+        fp = workdir / f"batch-{uuid.uuid4().hex[:8]}-{i}.parquet"
+        idx = p if i == 0 else np.concatenate([p, parts[2]])
+        pq.write_table(pa.Table.from_pandas(df.iloc[idx], preserve_index=False), fp)
+        files.append(fp)
+    return merge_upsert_files(conn, TARGET, files, **kwargs)
+
+
+def reset(conn) -> None:
+    conn.raw.execute(f"delete from {TARGET}")
+    conn.raw.execute(f"delete from OPS.INGESTION_WATERMARKS where source_name = '{WATERMARK_SOURCE}'")
+
+
+def target_rows(conn) -> tuple[dict[str, dict], list[str]]:
+    """Target rows by key, and the keys stored more than once."""
+    cur = conn.raw.execute(f"select {', '.join(COLUMNS)} from {TARGET}")
+    out, duplicates = {}, []
+    for values in cur.fetchall():
+        row = dict(zip(COLUMNS, values))
+        row[UPDATED] = None if row[UPDATED] is None else pd.Timestamp(row[UPDATED])
+        if row[KEY] in out:
+            duplicates.append(row[KEY])
+        out[row[KEY]] = row
+    return out, duplicates
+
+
+def diff(actual: dict, expected: dict, limit: int = 5) -> list[str]:
+    lines = []
+    for key in sorted(set(actual) | set(expected)):
+        a, e = actual.get(key), expected.get(key)
+        if a != e:
+            lines.append(f"    {key}: target={a} reference={e}")
+            if len(lines) >= limit:
+                break
+    return lines
+
+
+def replay(args) -> bool:
+    ok = True
+    with pooled_conn() as conn, tempfile.TemporaryDirectory() as tmp:
+        for stream in range(args.streams):
+            for detect_changes in (True, False):
+                reset(conn)
+                gen = StreamGenerator(args.seed + stream, args.keys, args.replay_batch_rows)
+                ref = ReferenceTable(detect_changes)
+                for b in range(args.batches):
+                    rows = gen.batch()
+                    path = PATHS[b % len(PATHS)]
+                    result = merge_batch(conn, rows, path, detect_changes, Path(tmp))
+                    expected_counts = ref.apply(rows)
+                    where = f"stream {stream} batch {b} ({path}, detect_changes={detect_changes})"
+                    problems = []
+                    actual, duplicates = target_rows(conn)
+                    if duplicates:
+                        problems.append(f"  keys stored more than once: {sorted(set(duplicates))[:5]}")
+                    if actual != ref.rows:
+                        problems += ["  target differs from reference:"] + diff(actual, ref.rows)
+                    counts = (result.rows_inserted, result.rows_updated)
+                    if counts != expected_counts:
+                        problems.append(f"  inserted/updated {counts}, reference {expected_counts}")
+                    watermark = get_watermark(conn, WATERMARK_SOURCE)
+                    if watermark != ref.watermark:
+                        problems.append(f"  watermark {watermark}, reference {ref.watermark}")
+                    if problems:
+                        print(f"FAIL {where}", *problems, sep="\n", file=sys.stderr)
+                        return False
+            print(f"  stream {stream}: {args.batches} batches x {args.replay_batch_rows} rows, "
+                  f"{len(ref.rows)} keys, ok", file=sys.stderr)
+    return ok
+
+
+def throughput(args) -> list[dict]:
+    results = []
+    rng = np.random.default_rng(args.seed)
+    with pooled_conn() as conn:
+        for table_rows in args.table_rows:
+            reset(conn)
+            base = pd.DataFrame({
+                KEY: [f"B{i:09d}" for i in range(table_rows)],
+                "customer_id": [f"C{i:05d}" for i in rng.integers(1, 500, table_rows)],
+                "city": rng.choice(["Dubai", "Abu Dhabi", "Sharjah"], table_rows),
+                "status": rng.choice(["completed", "canceled", "pending"], table_rows),
+                "price": rng.uniform(80, 400, table_rows).round(2),
+                UPDATED: pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 86400, table_rows), unit="s"),
+            })
+            merge_upsert(conn, TARGET, base, key_columns=[KEY])
+            next_key = table_rows
+            for batch_rows in args.batch_rows:
+                timings = []
+                for rep in range(args.repeat):
+                    # Half updates of existing keys (newer, changed), half new keys
+                    upd = base.sample(n=min(batch_rows // 2, table_rows), random_state=int(rng.integers(1 << 31)))
+                    upd = upd.assign(status="completed", price=upd["price"] + 1,
+                                     updated_at=pd.Timestamp("2026-02-01") + pd.Timedelta(days=rep))
+                    new = base.sample(n=batch_rows - len(upd), replace=True, random_state=int(rng.integers(1 << 31)))
+                    new = new.assign(**{KEY: [f"B{i:09d}" for i in range(next_key, next_key + len(new))]})
+                    next_key += len(new)
+                    batch = pd.concat([upd, new], ignore_index=True)
+                    t0 = time.perf_counter()
+                    result = merge_upsert(conn, TARGET, batch, key_columns=[KEY])
+                    timings.append(time.perf_counter() - t0)
+                seconds = float(np.median(timings))
+                results.append({
+                    "table_rows": table_rows,
+                    "batch_rows": batch_rows,
+                    "seconds": round(seconds, 4),
+                    "rows_per_sec": round(batch_rows / seconds),
+                    "rows_inserted": result.rows_inserted,
+                    "rows_updated": result.rows_updated,
+                })
+                print(f"  table {table_rows:>9} batch {batch_rows:>8}  {seconds:8.3f}s  "
+                      f"{batch_rows / seconds:>12,.0f} rows/s", file=sys.stderr)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=10, help="Replay streams (seeds).")
+    parser.add_argument("--batches", type=int, default=30, help="Batches per stream.")
+    parser.add_argument("--replay-batch-rows", type=int, default=300)
+    parser.add_argument("--keys", type=int, default=2000, help="Distinct booking ids per stream.")
+    parser.add_argument("--table-rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Timed merges per case (median is reported).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-replay", action="store_true")
+    parser.add_argument("--skip-throughput", action="store_true")
+    parser.add_argument("--output", type=Path, help="Write throughput results as JSON.")
+    args = parser.parse_args()
+
+    if not args.skip_replay:
+        print("replay:", file=sys.stderr)
+        if not replay(args):
+            sys.exit(1)
+        print("replay: target, counts and watermark match the reference", file=sys.stderr)
+    if not args.skip_throughput:
+        print("throughput:", file=sys.stderr)
+        results = throughput(args)
+        print(json.dumps(results, indent=2))
+        if args.output:
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
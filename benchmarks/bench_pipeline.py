@@ -0,0 +1,320 @@
+"""
+End-to-end ELT benchmark on the local DuckDB backend.
+
+    python benchmarks/bench_pipeline.py --scales 5000 1000000 10000000
+    python benchmarks/bench_pipeline.py --scales 5000 --compare benchmarks/results/<old>.json
+
+For each scale (number of bookings) a fresh subprocess, with its own data
+directory and DuckDB file:
+
+  generate         generate_synthetic.py --engine numpy (sharded above --shard-rows)
+  load_csvs        load_csvs.py into RAW on DuckDB
+  fetch_weather    fetch_weather.py against an in-process stub of the archive API
+  marts            the dbt models stg_bookings_base, stg_weather, fact_bookings,
+                   metrics_daily and anomalies_daily, rendered from dbt_project/
+                   and run on DuckDB, first as a full refresh and then once more
+                   incrementally (no new data, so only the lookback is rebuilt)
+
+Each stage records seconds, rows, rows/sec and peak RSS so far. Results go to
+a JSON file (default benchmarks/results/<commit>.json) together with the git
+commit and library versions; --compare prints per-stage ratios against an
+earlier results file.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+MODELS_DIR = BASE_DIR / "dbt_project" / "models"
+RESULTS_DIR = BASE_DIR / "benchmarks" / "results"
+
+# Built in dependency order: (model, materialization, unique key)
+MODELS = [
+    ("stg_bookings_base", "view", None),
+    ("stg_weather", "view", None),
+    ("fact_bookings", "incremental", ["booking_id"]),
+    ("metrics_daily", "incremental", ["date"]),
+    ("anomalies_daily", "incremental", ["date"]),
+]
+
+# Snowflake functions and types the models use, as DuckDB equivalents
+DUCKDB_COMPAT = [
+    "create type if not exists timestamp_ntz as timestamp",
+    "create or replace macro to_date(x) as cast(x as date)",
+    "create or replace macro dateadd(part, n, x) as x + n * cast('1 ' || part as interval)",
+]
+_SQL_REWRITES = [
+    (re.compile(r"\bnumber\(", re.I), "decimal("),
+    (re.compile(r"\bcurrent_timestamp\(\)", re.I), "current_timestamp"),
+]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _columns_in_relation(con, relation: str) -> list:
+    """adapter.get_columns_in_relation() for models that inspect their own table."""
+    from types import SimpleNamespace
+
+    schema, table = relation.split(".")
+    rows = con.execute(
+        "select column_name from information_schema.columns where table_schema = ? and table_name = ?",
+        [schema, table],
+    ).fetchall()
+    return [SimpleNamespace(name=r[0]) for r in rows]
+
+
+def render_model(name: str, incremental: bool, con=None, config: dict | None = None) -> str:
+    """
+    Renders dbt_project/models/**/<name>.sql for DuckDB (refs -> MARTS.<model>).
+    The model's config() arguments are stored in `config` when given; con is
+    only needed by models that inspect their own columns on incremental runs.
+    """
+    path = next(MODELS_DIR.rglob(f"{name}.sql"))
+    config = {} if config is None else config
+    return _render(path.read_text(), name, incremental, con, config)
+
+
+def _render(text: str, name: str, incremental: bool, con, config: dict) -> str:
+    import jinja2
+    from types import SimpleNamespace
+
+    vars_ = {"fact_bookings_lookback_hours": 72, "metrics_lookback_hours": 72}
+    sql = jinja2.Template(text).render(
+        config=lambda **kw: config.update(kw) or "",
+        ref=lambda model: f"MARTS.{model}",
+        source=lambda schema, table: f"{schema.upper()}.{table.upper()}",
+        var=lambda key, default=None: vars_.get(key, default),
+        is_incremental=lambda: incremental,
+        adapter=SimpleNamespace(get_columns_in_relation=lambda relation: _columns_in_relation(con, relation)),
+        this=f"MARTS.{name}",
+    )
+    for pattern, repl in _SQL_REWRITES:
+        sql = pattern.sub(repl, sql)
+    return sql
+
+
+def build_model(con, name: str, materialized: str, unique_key: list[str] | None, incremental: bool) -> int:
+    """
+    Builds one model the way dbt would: views are replaced; incremental models
+    are created on a full refresh, else their new rows replace matching keys
+    (delete+insert, which is also what merge amounts to here), then their
+    post_hook runs. Returns rows written.
+    """
+    target = f"MARTS.{name}"
+    incremental = incremental and materialized == "incremental"
+    config: dict = {}
+    sql = render_model(name, incremental, con, config)
+    if materialized == "view":
+        con.execute(f"create or replace view {target} as {sql}")
+        return 0
+    if not incremental:
+        con.execute(f"create or replace table {target} as {sql}")
+        rows = con.execute(f"select count(*) from {target}").fetchone()[0]
+    else:
+        con.execute(f"create or replace temp table {name}__dbt_tmp as {sql}")
+        keys = ", ".join(unique_key)
+        con.execute(f"delete from {target} where ({keys}) in (select ({keys}) from {name}__dbt_tmp)")
+        con.execute(f"insert into {target} by name select * from {name}__dbt_tmp")
+        rows = con.execute(f"select count(*) from {name}__dbt_tmp").fetchone()[0]
+        con.execute(f"drop table {name}__dbt_tmp")
+    hooks = config.get("post_hook") or []
+    for hook in [hooks] if isinstance(hooks, str) else hooks:
+        con.execute(_render(hook, name, incremental, con, {}))
+    return rows
+
+
+def start_weather_stub() -> str:
+    """Serves archive-API shaped responses on localhost; returns its URL."""
+    import http.server
+    import threading
+    from datetime import date, timedelta
+    from urllib.parse import parse_qs, urlparse
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            start, end = date.fromisoformat(q["start_date"]), date.fromisoformat(q["end_date"])
+            days = [(start + timedelta(days=d)).isoformat() for d in range((end - start).days + 1)]
+            n = len(days)
+            body = json.dumps({"daily": {
+                "time": days,
+                "temperature_2m_max": [35.0] * n,
+                "temperature_2m_min": [25.0] * n,
+                "precipitation_sum": [0.0] * n,
+                "windspeed_10m_max": [12.0] * n,
+            }}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1/era5"
+
+
+def run_scale(bookings: int, workdir: Path, fmt: str, shard_rows: int, chunksize: int | None) -> dict:
+    """Runs every stage for one scale (in the child process) and returns its results."""
+    os.environ.update(
+        WAREHOUSE_BACKEND="duckdb",
+        DUCKDB_PATH=str(workdir / "warehouse.duckdb"),
+        DATA_DIR=str(workdir / "data"),
+        WEATHER_CACHE_DIR=str(workdir / "cache"),
+        OPEN_METEO_URL=start_weather_stub(),
+    )
+    sys.path.insert(0, str(BASE_DIR / "ingestion"))
+    import generate_synthetic
+    import load_csvs
+    import fetch_weather
+    from utils import pooled_conn
+
+    stages = {}
+
+    def record(stage: str, seconds: float, rows: int) -> None:
+        stages[stage] = {
+            "seconds": round(seconds, 3),
+            "rows": rows,
+            "rows_per_sec": round(rows / seconds) if seconds and rows else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"  {bookings:>10} {stage:<30} {seconds:>9.3f}s {rows:>10} rows", file=sys.stderr)
+
+    shards = -(-bookings // shard_rows) if bookings > shard_rows else 0
+    argv = [
+        "--engine", "numpy", "--format", fmt, "--bookings", str(bookings),
+        "--customers", str(max(500, bookings // 100)), "--workers", str(max(200, bookings // 250)),
+    ] + (["--shards", str(shards)] if shards else [])
+    t0 = time.perf_counter()
+    assert generate_synthetic.main(argv) == 0
+    record("generate", time.perf_counter() - t0, bookings)
+
+    merges: list = []
+    t0 = time.perf_counter()
+    assert load_csvs.main(["--chunksize", str(chunksize)] if chunksize else [], results=merges) == 0
+    record("load_csvs", time.perf_counter() - t0, sum(m.rows_staged for m in merges))
+
+    merges = []
+    t0 = time.perf_counter()
+    assert fetch_weather.main([], results=merges) == 0
+    record("fetch_weather", time.perf_counter() - t0, sum(m.rows_staged for m in merges))
+
+    with pooled_conn(ensure_tables=False) as conn:
+        con = conn.raw
+        for stmt in DUCKDB_COMPAT:
+            con.execute(stmt)
+        con.execute("create schema if not exists MARTS")
+        for incremental in (False, True):
+            for name, materialized, unique_key in MODELS:
+                if materialized == "view" and incremental:
+                    continue
+                t0 = time.perf_counter()
+                rows = build_model(con, name, materialized, unique_key, incremental)
+                stage = f"{name}{' (incremental)' if incremental else ''}"
+                if materialized != "view":
+                    record(stage, time.perf_counter() - t0, rows)
+
+    return {
+        "bookings": bookings,
+        "format": fmt,
+        "shards": shards,
+        "chunksize": chunksize,
+        "total_seconds": round(sum(s["seconds"] for s in stages.values()), 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def environment() -> dict:
+    def git(*args):
+        out = subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True)
+        return out.stdout.strip() if out.returncode == 0 else None
+
+    import duckdb
+    import pandas as pd
+    import pyarrow as pa
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "duckdb": duckdb.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Prints seconds per stage against a baseline results file (ratio < 1 is faster)."""
+    old = {r["bookings"]: r for r in baseline["scales"]}
+    print(f"\nvs {baseline['environment'].get('commit')} (ratio = current / baseline seconds)")
+    for result in current["scales"]:
+        base = old.get(result["bookings"])
+        if not base:
+            continue
+        for stage, s in result["stages"].items():
+            b = base["stages"].get(stage)
+            if b and b["seconds"]:
+                print(f"  {result['bookings']:>10} {stage:<30} {b['seconds']:>9.3f}s -> {s['seconds']:>9.3f}s"
+                      f"  x{s['seconds'] / b['seconds']:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[5_000, 1_000_000, 10_000_000],
+                        help="Numbers of bookings to benchmark.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="parquet")
+    parser.add_argument("--shard-rows", type=int, default=1_000_000,
+                        help="Bookings per shard file; larger scales are generated in parallel shards.")
+    parser.add_argument("--chunksize", type=int, default=None, help="load_csvs --chunksize.")
+    parser.add_argument("--output", type=Path, help="Results file (default benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", type=Path, help="Earlier results file to compare against.")
+    parser.add_argument("--_scale", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._scale:
+        bookings, workdir = args._scale
+        result = run_scale(int(bookings), Path(workdir), args.format, args.shard_rows, args.chunksize)
+        print(json.dumps(result))
+        return
+
+    results = {"environment": environment(), "scales": []}
+    for bookings in args.scales:
+        # A fresh process per scale keeps peak RSS and DuckDB state isolated
+        with tempfile.TemporaryDirectory() as tmp:
+            cmd = [sys.executable, __file__, "--_scale", str(bookings), tmp,
+                   "--format", args.format, "--shard-rows", str(args.shard_rows)]
+            if args.chunksize:
+                cmd += ["--chunksize", str(args.chunksize)]
+            out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True, cwd=tmp)
+        results["scales"].append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    output = args.output or RESULTS_DIR / f"{results['environment']['commit'] or 'results'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {output}", file=sys.stderr)
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
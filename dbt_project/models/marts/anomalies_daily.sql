@@ -1,20 +1,95 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key='date',
+    incremental_strategy='delete+insert',
+    on_schema_change='append_new_columns',
+    post_hook="
+        {% if is_incremental() %}
+        -- Dates metrics_daily no longer has: delete+insert only replaces dates it outputs
+        delete from {{ this }}
+        where date not in (select date from {{ ref('metrics_daily') }})
+        {% endif %}
+    "
+) }}
 
-with base as (
+{% if is_incremental() %}
+{#- Tables built before metrics_refreshed_at existed get it from
+    on_schema_change only after this query runs, so their first incremental
+    run rescores every row -#}
+{%- set has_metrics_refreshed_at = 'metrics_refreshed_at' in (adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list) -%}
+{% endif %}
+
+with m as (
     select
         date,
         city,
         bookings_total,
+        refreshed_at,
+        row_number() over (partition by city order by date) as rn
+    from {{ ref('metrics_daily') }}
+),
+
+{% if is_incremental() and has_metrics_refreshed_at %}
+-- Dates metrics_daily rebuilt since this model last ran, and dates it dropped.
+-- A changed or removed row shifts the 30-row window of every later row in its
+-- city, so every city is rescored from the earliest of these dates on.
+rebuilt as (
+    select date
+    from m
+    where refreshed_at > (
+        select coalesce(max(metrics_refreshed_at), '1900-01-01'::timestamp_ntz)
+        from {{ this }}
+    )
+    union
+    select date from {{ this }} where date not in (select date from m)
+),
+
+rescore_from as (
+    select min(date) as date from rebuilt
+),
+
+-- Rows being rescored plus the 30 preceding rows each window reads
+scoped as (
+    select m.*
+    from m
+    join (
+        select city, min(rn) as first_rn
+        from m
+        where date >= (select date from rescore_from)
+        group by city
+    ) s
+        on m.city = s.city
+        and m.rn >= s.first_rn - 30
+),
+{% else %}
+scoped as (
+    select * from m
+),
+{% endif %}
+
+base as (
+    select
+        date,
+        city,
+        bookings_total,
+        refreshed_at,
         avg(bookings_total) over (partition by city order by date rows between 30 preceding and 1 preceding) as ma30,
         stddev(bookings_total) over (partition by city order by date rows between 30 preceding and 1 preceding) as sd30
-    from {{ ref('metrics_daily') }}
+    from scoped
 )
 select
-    date,
-    city,
-    bookings_total,
-    ma30,
-    sd30,
-    case when sd30 is null or sd30 = 0 then 0 else (bookings_total - ma30) / sd30 end as zscore,
-    case when sd30 is not null and sd30 <> 0 and abs((bookings_total - ma30) / sd30) >= 3 then true else false end as is_anomaly
-from base
+    b.date,
+    b.city,
+    b.bookings_total,
+    b.ma30,
+    b.sd30,
+    case when b.sd30 is null or b.sd30 = 0 then 0 else (b.bookings_total - b.ma30) / b.sd30 end as zscore,
+    case when b.sd30 is not null and b.sd30 <> 0 and abs((b.bookings_total - b.ma30) / b.sd30) >= 3 then true else false end as is_anomaly,
+    b.refreshed_at as metrics_refreshed_at,
+    -- When this row was (re)computed: windows shift rows whose metrics did not
+    -- change, so metrics_refreshed_at alone does not say the z-score moved
+    cast(current_timestamp() as timestamp_ntz) as refreshed_at
+from base b
+{% if is_incremental() and has_metrics_refreshed_at %}
+where b.date >= (select date from rescore_from)
+{% endif %}
@@ -1,10 +1,31 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key='worker_id',
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns'
+) }}
+
+{% if is_incremental() %}
+{#- Tables built before snapshotted_at existed get it from on_schema_change only
+    after this query runs, so their first incremental run merges every row -#}
+{%- set has_snapshotted_at = 'snapshotted_at' in (adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list) -%}
+{% endif %}
+
+-- One row per worker; an incremental run only replaces the current row of
+-- workers whose history opened a new version since the last run
 select
   worker_id,
   worker_name,
   worker_type,
   city,
   is_active,
-  valid_from
+  valid_from,
+  snapshotted_at
 from {{ ref('dim_worker_history') }}
 where is_current = 1
+{% if is_incremental() and has_snapshotted_at %}
+  and snapshotted_at > (
+      select coalesce(max(snapshotted_at), '1900-01-01'::timestamp_ntz)
+      from {{ this }}
+  )
+{% endif %}
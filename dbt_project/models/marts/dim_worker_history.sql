@@ -1,11 +1,41 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key=['worker_id', 'valid_from'],
+    incremental_strategy='merge',
+    on_schema_change='append_new_columns'
+) }}
+
+{% if is_incremental() %}
+{#- Tables built before snapshotted_at existed get it from on_schema_change only
+    after this query runs, so their first incremental run merges every row -#}
+{%- set has_snapshotted_at = 'snapshotted_at' in (adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list) -%}
+{% endif %}
+
+{% if is_incremental() and has_snapshotted_at %}
+-- Workers the snapshot opened a version for since the last run. The same run
+-- set dbt_valid_to on their previous version, so merging these workers' rows
+-- (on worker_id, valid_from) inserts the new versions and closes the old ones.
+with changed_workers as (
+    select distinct worker_id
+    from {{ ref('workers_snapshot') }}
+    where snapshotted_at > (
+        select coalesce(max(snapshotted_at), '1900-01-01'::timestamp_ntz)
+        from {{ this }}
+    )
+)
+{% endif %}
+
 select
-  worker_id,
-  worker_name,
-  worker_type,
-  city,
-  is_active,
-  dbt_valid_from as valid_from,
-  dbt_valid_to as valid_to,
-  case when dbt_valid_to is null then 1 else 0 end as is_current
-from {{ ref('workers_snapshot') }}
+    s.worker_id,
+    s.worker_name,
+    s.worker_type,
+    s.city,
+    s.is_active,
+    s.dbt_valid_from as valid_from,
+    s.dbt_valid_to as valid_to,
+    case when s.dbt_valid_to is null then 1 else 0 end as is_current,
+    s.snapshotted_at
+from {{ ref('workers_snapshot') }} s
+{% if is_incremental() and has_snapshotted_at %}
+where s.worker_id in (select worker_id from changed_workers)
+{% endif %}
@@ -2,12 +2,35 @@
     materialized='incremental',
     unique_key='booking_id',
     incremental_strategy='merge',
-    cluster_by=['requested_date','city']
+    cluster_by=['requested_date','city'],
+    on_schema_change='append_new_columns'
 ) }}
 
-with b as (
-    -- No incremental filter; MERGE handles updates vs inserts
-    select * from {{ ref('stg_bookings') }}
+{% set lookback_hours = var('fact_bookings_lookback_hours', 72) %}
+
+{% if is_incremental() %}
+{#- Tables built before previous_requested_date existed get it from
+    on_schema_change only after this query runs -#}
+{%- set has_previous_date = 'previous_requested_date' in (adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list) -%}
+{% endif %}
+
+with src as (
+    select * from {{ ref('stg_bookings_base') }}
+    {% if is_incremental() %}
+    -- Only bookings changed since the last build, minus a lookback for late-arriving updates
+    where updated_at >= (
+        select coalesce(dateadd('hour', -{{ lookback_hours }}, max(updated_at)), '1900-01-01'::timestamp_ntz)
+        from {{ this }}
+    )
+    {% endif %}
+),
+b as (
+    -- Same dedup as stg_bookings, but over the slice only. A booking's latest
+    -- version always falls inside the slice, so MERGE sees one row per key.
+    select booking_id, customer_id, worker_id, city, channel, status, price,
+           requested_at, assigned_at, completed_at, canceled_at, updated_at
+    from src
+    qualify row_number() over (partition by booking_id order by updated_at desc nulls last) = 1
 ),
 joined as (
     select
@@ -27,7 +50,21 @@ joined as (
         case when b.completed_at is not null then datediff('minute', b.assigned_at, b.completed_at) end as minutes_to_complete,
         case when b.status = 'completed' then 1 else 0 end as is_completed,
         case when b.status = 'canceled' then 1 else 0 end as is_canceled,
-        to_date(b.requested_at) as requested_date
+        to_date(b.requested_at) as requested_date,
+        -- The date this booking was counted under before requested_at last
+        -- moved it, so metrics_daily also re-aggregates the date it left
+        {% if is_incremental() %}
+        case
+            when t.requested_date is distinct from to_date(b.requested_at) then t.requested_date
+            {% if has_previous_date %}else t.previous_requested_date{% endif %}
+        end as previous_requested_date
+        {% else %}
+        cast(null as date) as previous_requested_date
+        {% endif %}
     from b
+    {% if is_incremental() %}
+    left join {{ this }} t
+        on t.booking_id = b.booking_id
+    {% endif %}
 )
 select * from joined
@@ -1,8 +1,62 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    unique_key='date',
+    incremental_strategy='delete+insert',
+    on_schema_change='append_new_columns',
+    post_hook="
+        {% if is_incremental() %}
+        -- Dates every booking moved away from: delete+insert only replaces dates it outputs
+        delete from {{ this }}
+        where date not in (select requested_date from {{ ref('fact_bookings') }} where requested_date is not null)
+        {% endif %}
+    "
+) }}
 
+{% set lookback_hours = var('metrics_lookback_hours', 72) %}
+
+{% if is_incremental() %}
+{#- Tables built before the change-tracking columns existed get them from
+    on_schema_change only after this query runs, so their first incremental
+    run re-aggregates every date -#}
+{%- set has_watermarks = 'bookings_updated_at' in (adapter.get_columns_in_relation(this) | map(attribute='name') | map('lower') | list) -%}
+{% endif %}
+
+{% if is_incremental() and has_watermarks %}
+-- Dates touched since the last run: bookings changed (by updated_at, with a
+-- lookback for late updates), including the date a booking moved away from,
+-- or weather loaded for that date. Only these dates are re-aggregated;
+-- delete+insert replaces every city for them.
+with changed_bookings as (
+    select requested_date, previous_requested_date
+    from {{ ref('fact_bookings') }}
+    where updated_at >= (
+        select coalesce(dateadd('hour', -{{ lookback_hours }}, max(bookings_updated_at)), '1900-01-01'::timestamp_ntz)
+        from {{ this }}
+    )
+),
+
+changed_dates as (
+    select requested_date as date from changed_bookings
+    union
+    select previous_requested_date from changed_bookings where previous_requested_date is not null
+    union
+    select distinct date
+    from {{ ref('stg_weather') }}
+    where updated_at > (
+        select coalesce(max(weather_updated_at), '1900-01-01'::timestamp_ntz)
+        from {{ this }}
+    )
+),
+
+f as (
+    select * from {{ ref('fact_bookings') }}
+    where requested_date in (select date from changed_dates)
+),
+{% else %}
 with f as (
     select * from {{ ref('fact_bookings') }}
 ),
+{% endif %}
 
 agg as (
     select
@@ -12,7 +66,8 @@ agg as (
         sum(f.is_completed) as bookings_completed,
         sum(f.is_canceled) as bookings_canceled,
         avg(f.minutes_to_assign) as avg_minutes_to_assign,
-        avg(f.minutes_to_complete) as avg_minutes_to_complete
+        avg(f.minutes_to_complete) as avg_minutes_to_complete,
+        max(f.updated_at) as bookings_updated_at
     from f
     group by 1, 2
 ),
@@ -37,7 +92,11 @@ select
     w.temp_max,
     w.temp_min,
     w.precipitation,
-    w.windspeed_max
+    w.windspeed_max,
+    -- Change tracking for incremental runs of this model and anomalies_daily
+    s.bookings_updated_at,
+    w.updated_at as weather_updated_at,
+    cast(current_timestamp() as timestamp_ntz) as refreshed_at
 from scored s
 left join {{ ref('stg_weather') }} w
     on s.city = w.city
@@ -1,18 +1,5 @@
 with src as (
-    select
-        trim(booking_id) as booking_id,
-        trim(customer_id) as customer_id,
-        trim(worker_id) as worker_id,
-        city,
-        channel,
-        lower(status) as status,
-        price::number(10,2) as price,
-        cast(requested_at as timestamp_ntz) as requested_at,
-        cast(assigned_at as timestamp_ntz) as assigned_at,
-        cast(completed_at as timestamp_ntz) as completed_at,
-        cast(canceled_at as timestamp_ntz) as canceled_at,
-        cast(updated_at as timestamp_ntz) as updated_at
-    from {{ source('raw','bookings') }}
+    select * from {{ ref('stg_bookings_base') }}
 ),
 dedup as (
     select *,
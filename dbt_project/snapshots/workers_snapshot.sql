@@ -14,6 +14,10 @@ select
   city,
   is_active,
   created_at,
-  updated_at
+  updated_at,
+  -- When this version was captured; a new version and the closing of the
+  -- previous one happen in the same snapshot run, so dim_worker_history
+  -- finds every changed worker through this column alone
+  cast(current_timestamp() as timestamp_ntz) as snapshotted_at
 from {{ source('raw','workers') }}
 {% endsnapshot %}
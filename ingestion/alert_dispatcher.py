@@ -0,0 +1,246 @@
+"""
+Delivery of anomaly alerts to a Slack incoming webhook.
+
+    dispatcher = AlertDispatcher(os.environ["SLACK_WEBHOOK_URL"])
+    result = dispatcher.dispatch(MetricsCache().anomalies(days=2))
+
+- Only anomalies whose (date, city) key is not yet in the notified-state file
+  (ALERT_STATE_PATH, default data/cache/alerts/notified.json) are sent, and a
+  key is recorded only once the message carrying it was accepted.
+- New anomalies are packed into as few messages as fit ALERT_MAX_CHARS /
+  ALERT_MAX_LINES (Slack truncates long webhook messages).
+- Messages are posted concurrently, spaced by a rate limiter
+  (ALERT_RATE_PER_SECOND; Slack allows about one per second per webhook),
+  with exponential backoff on 429/5xx and connection errors; Retry-After is
+  honoured. Everything gives up after ALERT_DEADLINE_SECONDS so a slow
+  webhook cannot stall the job: each request's timeout is clamped to the
+  time left. A message whose request went out but got no answer (timeout,
+  dropped connection) may still have reached Slack, so it is reported as
+  unknown and recorded rather than resent.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+from resilience import RETRY_STATUSES, atomic_write, backoff_delay
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+STATE_PATH = Path(os.environ.get("ALERT_STATE_PATH", PROJECT_ROOT / "data" / "cache" / "alerts" / "notified.json"))
+STATE_RETENTION_DAYS = int(os.environ.get("ALERT_STATE_DAYS", "90"))
+
+MAX_CHARS = int(os.environ.get("ALERT_MAX_CHARS", "3500"))
+MAX_LINES = int(os.environ.get("ALERT_MAX_LINES", "40"))
+RATE_PER_SECOND = float(os.environ.get("ALERT_RATE_PER_SECOND", "1.0"))
+MAX_RETRIES = int(os.environ.get("ALERT_MAX_RETRIES", "4"))
+BACKOFF_SECONDS = float(os.environ.get("ALERT_BACKOFF_SECONDS", "1.0"))
+TIMEOUT_SECONDS = float(os.environ.get("ALERT_TIMEOUT_SECONDS", "10"))
+DEADLINE_SECONDS = float(os.environ.get("ALERT_DEADLINE_SECONDS", "60"))
+
+
+def alert_key(row: dict) -> str:
+    return f"{row['DATE']}|{row['CITY']}"
+
+
+def format_line(row: dict) -> str:
+    return f"- {row['DATE']} | {row['CITY']} | bookings={row['BOOKINGS_TOTAL']} | z={row['ZSCORE']:.2f}"
+
+
+class NotifiedState:
+    """(date, city) keys already alerted on, persisted as JSON {key: notified_at}."""
+
+    def __init__(self, path: Path = STATE_PATH, retention_days: int = STATE_RETENTION_DAYS):
+        self.path = Path(path)
+        self.retention_days = retention_days
+        try:
+            self._keys: dict[str, str] = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            self._keys = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def mark(self, keys) -> None:
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._keys.update({k: now for k in keys})
+
+    def save(self) -> None:
+        # Keys of dates past retention can no longer come back from the lookback window
+        cutoff = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        self._keys = {k: v for k, v in self._keys.items() if k.split("|", 1)[0] >= cutoff}
+        atomic_write(self.path, lambda p: p.write_text(json.dumps(self._keys, sort_keys=True), encoding="utf-8"))
+
+
+def chunk_rows(
+    rows: list[dict],
+    header: str = "Anomalies detected",
+    max_chars: int = MAX_CHARS,
+    max_lines: int = MAX_LINES,
+) -> list[tuple[str, list[dict]]]:
+    """Packs rows, in order, into (message text, rows in it) pairs within the size limits."""
+    chunks: list[list[dict]] = []
+    size = 0
+    for row in rows:
+        length = len(format_line(row)) + 1
+        if not chunks or len(chunks[-1]) >= max_lines or size + length > max_chars:
+            chunks.append([])
+            size = len(header) + 16
+        chunks[-1].append(row)
+        size += length
+    messages = []
+    for i, chunk in enumerate(chunks, 1):
+        title = f"{header} ({i}/{len(chunks)}):" if len(chunks) > 1 else f"{header}:"
+        messages.append(("\n".join([title] + [format_line(r) for r in chunk]), chunk))
+    return messages
+
+
+class RateLimiter:
+    """Hands out send slots at most rate_per_second apart, in the order they were requested."""
+
+    def __init__(self, rate_per_second: float = RATE_PER_SECOND):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._next = 0.0
+
+    async def acquire(self, deadline: float | None = None) -> bool:
+        """Waits for the next slot; False (without waiting) if it would come after deadline."""
+        now = time.monotonic()
+        slot = max(now, self._next)
+        if deadline is not None and slot >= deadline:
+            return False
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        return True
+
+
+def _post(url: str, text: str, timeout: float) -> tuple[int, str | None]:
+    """POSTs one message; returns (HTTP status, Retry-After header)."""
+    req = urllib.request.Request(
+        url,
+        data=json.dumps({"text": text}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, None
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("Retry-After")
+
+
+SENT, FAILED, UNKNOWN = "sent", "failed", "unknown"
+
+
+@dataclass
+class DispatchResult:
+    sent: int = 0
+    failed: int = 0
+    # Posted but never answered; recorded, not resent
+    unknown: int = 0
+    skipped: int = 0
+    messages: int = 0
+
+
+class AlertDispatcher:
+    def __init__(
+        self,
+        webhook_url: str,
+        state: NotifiedState | None = None,
+        rate_per_second: float = RATE_PER_SECOND,
+        max_retries: int = MAX_RETRIES,
+        backoff_seconds: float = BACKOFF_SECONDS,
+        timeout_seconds: float = TIMEOUT_SECONDS,
+        deadline_seconds: float = DEADLINE_SECONDS,
+    ):
+        self.webhook_url = webhook_url
+        self.state = state if state is not None else NotifiedState()
+        self.rate_per_second = rate_per_second
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.deadline_seconds = deadline_seconds
+
+    async def _send(self, limiter: RateLimiter, text: str, deadline: float) -> str:
+        """
+        Posts text until accepted, rejected or out of retries/time; returns
+        SENT, FAILED (not delivered) or UNKNOWN (the request went out but got
+        no answer, so Slack may well have it; retrying could post it twice).
+        """
+        for attempt in range(self.max_retries + 1):
+            if not await limiter.acquire(deadline):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # Clamped so no request thread outlives the deadline
+                status, retry_after = await asyncio.to_thread(
+                    _post, self.webhook_url, text, min(self.timeout_seconds, remaining)
+                )
+            except urllib.error.URLError as e:
+                # urlopen wraps errors raised before the request was sent (DNS, connect)
+                status, retry_after = None, None
+                print(f"Slack post failed (attempt {attempt + 1}): {e}")
+            except OSError as e:
+                print(f"Slack post got no answer (attempt {attempt + 1}): {e}")
+                return UNKNOWN
+            else:
+                if status < 300:
+                    return SENT
+                print(f"Slack post failed (attempt {attempt + 1}): HTTP {status}")
+                if status not in RETRY_STATUSES:
+                    return FAILED
+            if attempt == self.max_retries:
+                break
+            delay = backoff_delay(attempt, self.backoff_seconds, retry_after)
+            if time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+        return FAILED
+
+    async def _send_all(self, texts: list[str]) -> list[str]:
+        # Every _send stops by itself at the deadline, so nothing is left
+        # running (or blocking asyncio.run's executor shutdown) after it
+        deadline = time.monotonic() + self.deadline_seconds
+        limiter = RateLimiter(self.rate_per_second)
+        outcomes = await asyncio.gather(*(self._send(limiter, t, deadline) for t in texts))
+        given_up = sum(o != SENT for o in outcomes)
+        if given_up and time.monotonic() >= deadline:
+            print(f"Slack delivery deadline of {self.deadline_seconds:g}s reached; {given_up} message(s) not confirmed")
+        return outcomes
+
+    def send_text(self, text: str) -> bool:
+        """Posts a single message (no deduplication)."""
+        return asyncio.run(self._send_all([text]))[0] == SENT
+
+    def dispatch(self, rows: list[dict]) -> DispatchResult:
+        """
+        Sends the rows not yet notified and records the ones delivered or
+        possibly delivered (unknown). Rows are expected in display order
+        (MetricsCache.anomalies()).
+        """
+        new = [r for r in rows if alert_key(r) not in self.state]
+        result = DispatchResult(skipped=len(rows) - len(new))
+        if not new:
+            return result
+        messages = chunk_rows(new)
+        outcomes = asyncio.run(self._send_all([text for text, _ in messages]))
+        for outcome, (_, chunk) in zip(outcomes, messages):
+            if outcome == FAILED:
+                result.failed += len(chunk)
+                continue
+            # An unconfirmed message is recorded too: resending it risks a duplicate alert
+            self.state.mark(alert_key(r) for r in chunk)
+            if outcome == SENT:
+                result.sent += len(chunk)
+            else:
+                result.unknown += len(chunk)
+        result.messages = len(messages)
+        self.state.save()
+        return result
@@ -0,0 +1,122 @@
+"""
+Streaming re-implementation of dbt_project/models/marts/anomalies_daily.sql.
+
+Per city, ordered by date, each row is scored against the previous `window`
+rows (SQL: rows between 30 preceding and 1 preceding):
+
+    ma30      = avg of the window, None if it is empty
+    sd30      = sample stddev of the window, None with fewer than 2 rows
+    zscore    = 0 if sd30 is None or 0, else (bookings_total - ma30) / sd30
+    is_anomaly = sd30 not None/0 and |zscore| >= threshold
+
+Rolling sums are kept per city so each update is O(1). bookings_total is a
+count, so the sums stay exact Python ints and a constant window gives sd30 == 0
+exactly, as in SQL, instead of a float-drift residue that would look like a spike.
+"""
+from __future__ import annotations
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+WINDOW = 30
+THRESHOLD = 3.0
+
+
+@dataclass
+class AnomalyRow:
+    date: object
+    city: str
+    bookings_total: int
+    ma30: float | None
+    sd30: float | None
+    zscore: float
+    is_anomaly: bool
+
+
+class RollingWindow:
+    """Mean and sample stddev over the last `size` values, O(1) per push."""
+
+    __slots__ = ("size", "values", "s1", "s2")
+
+    def __init__(self, size: int = WINDOW):
+        self.size = size
+        self.values: deque = deque()
+        self.s1 = 0
+        self.s2 = 0
+
+    def push(self, x) -> None:
+        self.values.append(x)
+        self.s1 += x
+        self.s2 += x * x
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            self.s1 -= old
+            self.s2 -= old * old
+
+    def mean(self) -> float | None:
+        n = len(self.values)
+        return self.s1 / n if n else None
+
+    def stddev(self) -> float | None:
+        n = len(self.values)
+        if n < 2:
+            return None
+        # n*s2 - s1^2 is exact for integer inputs; clamp guards float inputs
+        num = n * self.s2 - self.s1 * self.s1
+        return math.sqrt(max(num, 0) / (n * (n - 1)))
+
+
+class AnomalyEngine:
+    """
+    Scores metrics_daily rows as they arrive. Rows for a city must arrive in
+    increasing date order; cities may be interleaved.
+    """
+
+    def __init__(self, window: int = WINDOW, threshold: float = THRESHOLD):
+        self.window = window
+        self.threshold = threshold
+        self._windows: dict[str, RollingWindow] = {}
+        self._last_date: dict[str, object] = {}
+
+    def update(self, date, city: str, bookings_total) -> AnomalyRow:
+        last = self._last_date.get(city)
+        if last is not None and date <= last:
+            raise ValueError(f"{city}: {date} arrived after {last}; rows must be in date order per city")
+        self._last_date[city] = date
+
+        w = self._windows.get(city)
+        if w is None:
+            w = self._windows[city] = RollingWindow(self.window)
+
+        # Score against the preceding rows, then add this row to the window
+        ma = w.mean()
+        sd = w.stddev()
+        if sd is None or sd == 0:
+            z, flagged = 0.0, False
+        else:
+            z = (bookings_total - ma) / sd
+            flagged = abs(z) >= self.threshold
+        w.push(bookings_total)
+        return AnomalyRow(date, city, bookings_total, ma, sd, z, flagged)
+
+    def run(self, rows: Iterable[tuple]) -> Iterator[AnomalyRow]:
+        """Scores (date, city, bookings_total) tuples in arrival order."""
+        for date, city, total in rows:
+            yield self.update(date, city, total)
+
+
+def score_metrics(df, window: int = WINDOW, threshold: float = THRESHOLD):
+    """
+    Batch helper: scores a metrics_daily DataFrame (date, city, bookings_total)
+    and returns the anomalies_daily columns as a DataFrame.
+    """
+    import pandas as pd
+
+    ordered = df.sort_values(["city", "date"], kind="stable")
+    engine = AnomalyEngine(window, threshold)
+    rows = engine.run(zip(ordered["date"], ordered["city"], ordered["bookings_total"].tolist()))
+    return pd.DataFrame(
+        [(r.date, r.city, r.bookings_total, r.ma30, r.sd30, r.zscore, r.is_anomaly) for r in rows],
+        columns=["date", "city", "bookings_total", "ma30", "sd30", "zscore", "is_anomaly"],
+    )
@@ -0,0 +1,126 @@
+"""
+Arrow/Parquet interchange between generate_synthetic.py, load_csvs.py and merge_upsert().
+
+Schemas are derived from warehouse.TABLES so the files carry the same types as
+RAW (timestamps, booleans, number(10,2) as decimal) and never need re-parsing.
+Low-cardinality columns stay dictionary-encoded end to end (pandas categoricals
+in memory, Arrow dictionaries in files and staging chunks), and integer
+surrogate ids are only formatted into their string form when converted here.
+"""
+from __future__ import annotations
+import re
+from pathlib import Path
+from typing import Iterator
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from warehouse import TABLES, parse_table_identifier
+
+_NUMBER = re.compile(r"^number\((\d+),\s*(\d+)\)$", re.I)
+_ARROW_TYPES = {
+    "string": pa.string(),
+    "timestamp_ntz": pa.timestamp("us"),
+    "boolean": pa.bool_(),
+    "float": pa.float64(),
+    "date": pa.date32(),
+}
+
+# Few distinct values per column: kept as category / dictionary<int32, string>
+DICTIONARY_COLUMNS = {"CITY", "CHANNEL", "STATUS", "WORKER_TYPE"}
+
+
+def _arrow_type(sql_type: str) -> pa.DataType:
+    m = _NUMBER.match(sql_type)
+    if m:
+        return pa.decimal128(int(m.group(1)), int(m.group(2)))
+    return _ARROW_TYPES[sql_type.lower()]
+
+
+def arrow_schema(target_table: str) -> pa.Schema:
+    """Returns the Arrow schema of a RAW table, e.g. arrow_schema('RAW.BOOKINGS')."""
+    _, schema, table = parse_table_identifier(target_table)
+    name = f"{schema or 'RAW'}.{table}".upper()
+    for table_name, columns, _ in TABLES:
+        if table_name == name:
+            return pa.schema([
+                (c, pa.dictionary(pa.int32(), pa.string()) if c.upper() in DICTIONARY_COLUMNS else _arrow_type(t))
+                for c, t in columns
+            ])
+    raise ValueError(f"Unknown table: {target_table}")
+
+
+def format_ids(values, prefix: str, width: int) -> pa.Array:
+    """Formats integer surrogate ids as prefix + zero-padded number, e.g. 42 -> 'B000042'."""
+    if not isinstance(values, (pa.Array, pa.ChunkedArray)):
+        values = pa.array(values, type=pa.int64())
+    digits = pc.utf8_lpad(pc.cast(values, pa.string()), width, "0")
+    return pc.binary_join_element_wise(prefix, digits, "")
+
+
+def with_formatted_ids(df: pd.DataFrame, id_formats: dict[str, tuple[str, int]]) -> pd.DataFrame:
+    """Copy of df with its integer id columns (column -> (prefix, width)) formatted as strings."""
+    out = df.copy(deep=False)
+    for col, (prefix, width) in id_formats.items():
+        if col in out.columns and pd.api.types.is_integer_dtype(out[col]):
+            out[col] = format_ids(out[col].to_numpy(), prefix, width).to_numpy(zero_copy_only=False)
+    return out
+
+
+def to_arrow(
+    df: pd.DataFrame,
+    target_table: str,
+    id_formats: dict[str, tuple[str, int]] | None = None,
+) -> pa.Table:
+    """
+    Converts df to an Arrow table typed like target_table (columns not in df are
+    skipped). Integer columns named in id_formats are formatted with format_ids().
+    """
+    schema = arrow_schema(target_table)
+    fields = [f for f in schema if f.name in df.columns]
+    table = pa.Table.from_pandas(df[[f.name for f in fields]], preserve_index=False)
+    for col, (prefix, width) in (id_formats or {}).items():
+        if col in table.column_names and pa.types.is_integer(table.schema.field(col).type):
+            i = table.column_names.index(col)
+            table = table.set_column(i, col, format_ids(table[col], prefix, width))
+    # safe=False: float prices like 123.450000001 round into decimal(10,2)
+    return table.cast(pa.schema(fields), safe=False)
+
+
+def write_parquet(
+    df: pd.DataFrame,
+    fp: Path,
+    target_table: str,
+    id_formats: dict[str, tuple[str, int]] | None = None,
+) -> None:
+    pq.write_table(to_arrow(df, target_table, id_formats), fp, compression="zstd")
+
+
+def read_parquet(fp: Path, batch_rows: int | None = None) -> Iterator[pa.Table]:
+    """Yields the file at fp as Arrow tables, batch_rows at a time if given."""
+    if not batch_rows:
+        yield pq.read_table(fp)
+        return
+    pf = pq.ParquetFile(fp)
+    for batch in pf.iter_batches(batch_size=batch_rows):
+        yield pa.Table.from_batches([batch])
+
+
+def is_arrow(obj) -> bool:
+    return isinstance(obj, pa.Table)
+
+
+def upper_columns(table: pa.Table) -> pa.Table:
+    return table.rename_columns([c.upper() for c in table.column_names])
+
+
+def max_timestamp(table: pa.Table, column: str) -> pd.Timestamp | None:
+    value = pc.max(table[column]).as_py()
+    return None if value is None else pd.Timestamp(value)
+
+
+def filter_since(table: pa.Table, watermark: pd.Timestamp, column: str) -> pa.Table:
+    """Arrow counterpart of utils.filter_since_watermark()."""
+    col = table[column]
+    bound = pa.scalar(watermark.to_pydatetime(), type=col.type)
+    return table.filter(pc.or_kleene(pc.greater_equal(col, bound), pc.is_null(col)))
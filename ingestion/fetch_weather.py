@@ -1,7 +1,19 @@
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import pandas as pd
 import requests
 from datetime import date, timedelta, datetime
-from utils import get_conn, ensure_tables, merge_upsert
+from utils import pooled_conn, merge_upsert, backend_for, PROJECT_ROOT
+from instrumentation import in_current_span, span
+from resilience import RETRY_STATUSES, atomic_write, backoff_delay
 
 CITY_COORDS = {
     "Dubai": {"lat": 25.276987, "lon": 55.296249, "tz": "Asia/Dubai"},
@@ -9,37 +21,137 @@ CITY_COORDS = {
     "Sharjah": {"lat": 25.346255, "lon": 55.421060, "tz": "Asia/Dubai"},
 }
 
+ARCHIVE_URL = os.environ.get("OPEN_METEO_URL", "https://archive-api.open-meteo.com/v1/era5")
+DAILY_PARAMS = "temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max"
+CACHE_DIR = Path(os.environ.get("WEATHER_CACHE_DIR", PROJECT_ROOT / "data" / "cache" / "weather"))
 
-def fetch_city_daily(city: str, lat: float, lon: float, tz: str, start: date, end: date) -> pd.DataFrame:
-    url = "https://archive-api.open-meteo.com/v1/era5"
-    daily_params = "temperature_2m_max,temperature_2m_min,precipitation_sum,windspeed_10m_max"
+MAX_RETRIES = int(os.environ.get("WEATHER_MAX_RETRIES", "5"))
+BACKOFF_SECONDS = float(os.environ.get("WEATHER_BACKOFF_SECONDS", "1.0"))
+MAX_CONCURRENCY = int(os.environ.get("WEATHER_CONCURRENCY", "4"))
 
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": start.isoformat(),
-        "end_date": end.isoformat(),
-        "daily": daily_params,
-        "timezone": tz,
-    }
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    """One requests.Session per thread; sessions are not safe to share across threads."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of Open-Meteo responses. The file name is a
+    hash of everything that determines the response (city, coordinates, date
+    range, request params), so a hit is always safe to reuse.
+    """
+
+    def __init__(self, root: Path = CACHE_DIR):
+        self.root = Path(root)
+
+    def _path(self, key: dict) -> Path:
+        digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        return self.root / digest[:2] / f"{digest}.json"
+
+    def get(self, key: dict) -> dict | None:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, key: dict, payload: dict) -> None:
+        atomic_write(self._path(key), lambda p: p.write_text(json.dumps(payload), encoding="utf-8"))
+
+
+def _get_json(params: dict) -> dict:
+    """GET ARCHIVE_URL with exponential backoff (plus jitter) on 429/5xx and connection errors."""
+    with span("http_fetch", start_date=params.get("start_date"), end_date=params.get("end_date")) as sp:
+        for attempt in range(MAX_RETRIES + 1):
+            sp.set(attempts=attempt + 1)
+            retry_after = None
+            try:
+                r = _session().get(ARCHIVE_URL, params=params, timeout=30)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == MAX_RETRIES:
+                    raise
+            else:
+                sp.set(status=r.status_code)
+                if r.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    try:
+                        r.raise_for_status()
+                    except Exception:
+                        print(f"Request failed: {r.url}")
+                        raise
+                    return r.json()
+                retry_after = r.headers.get("Retry-After")
+            time.sleep(backoff_delay(attempt, BACKOFF_SECONDS, retry_after))
+    raise AssertionError("unreachable")
 
-    r = requests.get(url, params=params, timeout=30)
-    try:
-        r.raise_for_status()
-    except Exception:
-        print(f"Request failed for {city}: {r.url}")
-        raise
-
-    j = r.json()
-    daily = j.get("daily")
-    if not daily or "time" not in daily:
-        return pd.DataFrame()
 
-    # Build DataFrame from the 'daily' dict
-    df = pd.DataFrame(daily)
+def _month_blocks(start: date, end: date) -> list[tuple[date, date]]:
+    """Splits [start, end] on calendar-month boundaries."""
+    blocks = []
+    cur = start
+    while cur <= end:
+        next_month = (cur.replace(day=1) + timedelta(days=32)).replace(day=1)
+        block_end = min(end, next_month - timedelta(days=1))
+        blocks.append((cur, block_end))
+        cur = block_end + timedelta(days=1)
+    return blocks
 
-    # Convert time → date
-    df["date"] = pd.to_datetime(df["time"], errors="coerce").dt.date
+
+def fetch_city_daily(
+    city: str,
+    lat: float,
+    lon: float,
+    tz: str,
+    start: date,
+    end: date,
+    cache: ResponseCache | None = None,
+) -> pd.DataFrame:
+    """
+    Fetches daily weather for one city. With a cache, the range is requested in
+    calendar-month blocks so each block is only ever requested once (only the
+    trailing partial month changes as the window moves forward); without one,
+    it is a single request.
+    """
+    frames, cache_hits = [], 0
+    blocks = _month_blocks(start, end) if cache else [(start, end)]
+    with span("fetch_city_daily", city=city, blocks=len(blocks)) as sp:
+        for block_start, block_end in blocks:
+            params = {
+                "latitude": lat,
+                "longitude": lon,
+                "start_date": block_start.isoformat(),
+                "end_date": block_end.isoformat(),
+                "daily": DAILY_PARAMS,
+                "timezone": tz,
+            }
+            key = {"city": city, "url": ARCHIVE_URL, **params}
+            j = cache.get(key) if cache else None
+            cache_hits += j is not None
+            if j is None:
+                j = _get_json(params)
+                daily = j.get("daily")
+                # Only cache complete answers; an empty block may just not be published yet
+                if cache and daily and daily.get("time") and all(
+                    v is not None for v in daily.get("temperature_2m_max", [])
+                ):
+                    cache.put(key, j)
+
+            daily = j.get("daily")
+            if daily and "time" in daily:
+                # Build DataFrame from the 'daily' dict
+                frames.append(pd.DataFrame(daily))
+        sp.set(cache_hits=cache_hits, rows=sum(len(f) for f in frames))
+
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+
+    # Convert time → date (datetime64 midnight; becomes date32 in columnar.to_arrow)
+    df["date"] = pd.to_datetime(df["time"], errors="coerce")
 
     # Rename columns to match our schema
     df = df.rename(
@@ -54,9 +166,10 @@ def fetch_city_daily(city: str, lat: float, lon: float, tz: str, start: date, en
     # Keep relevant columns
     df = df[["date", "temp_max", "temp_min", "precipitation", "windspeed_max"]]
 
-    # Add metadata
-    df["city"] = city
-    df["updated_at"] = datetime.utcnow()
+    # Add metadata; known cities share one category list so frames concat as categoricals
+    categories = list(CITY_COORDS) if city in CITY_COORDS else [city]
+    df["city"] = pd.Categorical.from_codes([categories.index(city)] * len(df), categories=categories)
+    df["updated_at"] = pd.Timestamp(datetime.utcnow())
 
     # Final column order
     return df[[
@@ -70,48 +183,141 @@ def fetch_city_daily(city: str, lat: float, lon: float, tz: str, start: date, en
     ]]
 
 
-if __name__ == "__main__":
+def stored_dates(conn, start: date, end: date) -> dict[str, set[date]]:
+    """
+    Returns {city: dates} already in RAW.WEATHER within [start, end].
+    Days stored without a temperature (not yet published by ERA5) count as missing.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"select city, date from {backend_for(conn).qualify('RAW.WEATHER')} "
+            f"where date between '{start.isoformat()}' and '{end.isoformat()}' "
+            "and temp_max is not null"
+        )
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    have: dict[str, set[date]] = {}
+    for city, d in rows:
+        have.setdefault(city, set()).add(pd.Timestamp(d).date())
+    return have
+
+
+def missing_ranges(have: set[date], start: date, end: date) -> list[tuple[date, date]]:
+    """Contiguous [from, to] ranges within [start, end] that are not in have, holes included."""
+    ranges = []
+    gap_start = None
+    d = start
+    while d <= end:
+        if d not in have:
+            gap_start = gap_start or d
+        elif gap_start:
+            ranges.append((gap_start, d - timedelta(days=1)))
+            gap_start = None
+        d += timedelta(days=1)
+    if gap_start:
+        ranges.append((gap_start, end))
+    return ranges
+
+
+def fetch_all(
+    cities: dict,
+    start: date,
+    end: date,
+    cache: ResponseCache | None = None,
+    max_workers: int = MAX_CONCURRENCY,
+    ranges: dict[str, list[tuple[date, date]]] | None = None,
+) -> list[pd.DataFrame]:
+    """
+    Fetches every city concurrently with at most max_workers requests in flight.
+    ranges optionally limits a city to specific [from, to] ranges (see missing_ranges());
+    cities absent from it get the full [start, end] window.
+    Errors are reported per city; returns the non-empty frames.
+    """
+    tasks = [
+        (city, meta, r_start, r_end)
+        for city, meta in cities.items()
+        for r_start, r_end in (ranges.get(city, [(start, end)]) if ranges is not None else [(start, end)])
+    ]
+
+    def one(task):
+        city, meta, r_start, r_end = task
+        try:
+            df = fetch_city_daily(city, meta["lat"], meta["lon"], meta["tz"], r_start, r_end, cache=cache)
+        except Exception as e:
+            print(f"Error fetching {city} {r_start}..{r_end}: {e}")
+            return None
+        if df.empty:
+            print(f"No data for {city} {r_start}..{r_end}")
+            return None
+        print(f"Fetched {len(df)} rows for {city} {r_start}..{r_end}")
+        return df
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        return [df for df in pool.map(in_current_span(one), tasks) if df is not None]
+
+
+def main(argv: list[str] | None = None, results: list | None = None) -> int:
+    """
+    CLI entry point; also called in-process by the orchestration flow, which
+    passes `results` to collect the RAW.WEATHER MergeResult.
+    """
+    parser = argparse.ArgumentParser(description="Fetch daily weather into RAW.WEATHER.")
+    parser.add_argument(
+        "--full-window",
+        action="store_true",
+        help="Refetch the whole window instead of only dates missing from RAW.WEATHER.",
+    )
+    args = parser.parse_args(argv)
+
     # ERA5 archive usually lags a few days → cap end_date to 7 days ago
     end = date.today() - timedelta(days=7)
     start = end - timedelta(days=200)
     if start >= end:
         start = end - timedelta(days=60)
 
-    frames = []
-    for city, meta in CITY_COORDS.items():
-        try:
-            df = fetch_city_daily(city, meta["lat"], meta["lon"], meta["tz"], start, end)
-            if not df.empty:
-                frames.append(df)
-                print(f"Fetched {len(df)} rows for {city}")
-            else:
-                print(f"No data for {city}")
-        except Exception as e:
-            print(f"Error fetching {city}: {e}")
+    # Work out which days each city still needs (the pool ensures base tables exist)
+    with pooled_conn() as conn:
+        have = {} if args.full_window else stored_dates(conn, start, end)
+
+    # New cities have no stored dates and get the full backfill
+    ranges = {city: missing_ranges(have.get(city, set()), start, end) for city in CITY_COORDS}
+    todo = {city: r for city, r in ranges.items() if r}
+    if not todo:
+        print("RAW.WEATHER is up to date. Nothing to fetch.")
+        return 0
+
+    frames = fetch_all(
+        {city: CITY_COORDS[city] for city in todo}, start, end, cache=ResponseCache(), ranges=todo,
+    )
 
     if not frames:
         print("No weather data fetched. Exiting.")
-        raise SystemExit(1)
+        return 1
 
-    all_weather = pd.concat(frames, ignore_index=True)
+    from columnar import to_arrow
 
-    # Ensure base tables exist
-    conn = get_conn()
-    try:
-        ensure_tables(conn)
-    finally:
-        conn.close()
+    # Typed like RAW.WEATHER (date32, dictionary city), staged without pandas round-trips
+    all_weather = to_arrow(pd.concat(frames, ignore_index=True), "RAW.WEATHER")
 
-    # Upsert into RAW.WEATHER
-    conn = get_conn()
-    try:
-        merge_upsert(
+    # Upsert into RAW.WEATHER on the same pooled session
+    with pooled_conn() as conn:
+        result = merge_upsert(
             conn,
             "RAW.WEATHER",
             all_weather,
             key_columns=["city", "date"],
             updated_col="updated_at",
         )
-        print(f"Loaded RAW.WEATHER ({len(all_weather)} rows in this run)")
-    finally:
-        conn.close()
+        print(
+            f"Loaded RAW.WEATHER ({len(all_weather)} rows in this run, "
+            f"{result.rows_inserted} inserted, {result.rows_updated} updated)"
+        )
+    if results is not None:
+        results.append(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
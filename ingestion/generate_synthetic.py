@@ -1,21 +1,33 @@
+import argparse
 import os
 import random
+import sys
 from datetime import timedelta
+import numpy as np
 import pandas as pd
-from faker import Faker
+from instrumentation import span
 
-fake = Faker()
-random.seed(42)
+# Output directory; DATA_DIR overrides it (load_csvs.py reads the same variable)
+DATA_DIR = os.environ.get("DATA_DIR", "data")
 
-# Ensure data directory exists
-os.makedirs("data", exist_ok=True)
+_fake = None
 
 cities = ["Dubai", "Abu Dhabi", "Sharjah"]
 channels = ["app", "web", "call_center"]
 worker_types = ["live_in", "live_out"]
 
 
+def _get_fake():
+    """Shared Faker instance, built on first use so importing this module stays cheap."""
+    global _fake
+    if _fake is None:
+        from faker import Faker
+        _fake = Faker()
+    return _fake
+
+
 def gen_customers(n=500):
+    fake = _get_fake()
     rows = []
     for i in range(1, n + 1):
         cid = f"C{i:05d}"
@@ -34,6 +46,7 @@ def gen_customers(n=500):
 
 
 def gen_workers(n=200):
+    fake = _get_fake()
     rows = []
     for i in range(1, n + 1):
         wid = f"W{i:05d}"
@@ -52,6 +65,7 @@ def gen_workers(n=200):
 
 
 def gen_bookings(customers_df: pd.DataFrame, workers_df: pd.DataFrame, n=5000):
+    fake = _get_fake()
     rows = []
     for i in range(1, n + 1):
         bid = f"B{i:06d}"
@@ -104,16 +118,309 @@ def gen_bookings(customers_df: pd.DataFrame, workers_df: pd.DataFrame, n=5000):
     return pd.DataFrame(rows)
 
 
-if __name__ == "__main__":
-    customers = gen_customers(500)
-    workers = gen_workers(200)
-    bookings = gen_bookings(customers, workers, 5000)
+# --- Vectorized generators -------------------------------------------------
+# Same columns and distributions as the Faker-based generators above, built a
+# whole column at a time from a seeded numpy Generator. Names and emails are
+# drawn from a small Faker-generated pool instead of one Faker call per row.
+#
+# Frames are kept compact: ids are int64 surrogates (formatted as C00001 /
+# W00001 / B000001 only when written, see id_formats()), city / channel /
+# status / worker_type are categoricals and timestamps are datetime64[s].
+
+_POOL_SIZE = 1000
+
+
+def _ids(n: int, start: int = 1) -> np.ndarray:
+    return np.arange(start, start + n, dtype=np.int64)
+
+
+def _categorical(codes: np.ndarray, categories: list[str]) -> pd.Categorical:
+    return pd.Categorical.from_codes(codes.astype(np.int8), categories=categories)
+
+
+def id_formats() -> dict[str, tuple[str, int]]:
+    """
+    (prefix, minimum digits) of each surrogate id column, for columnar.format_ids().
+    Fixed, like the Faker generators' f"B{i:06d}", so an id never depends on
+    how many rows or shards a run generates and reruns at another scale
+    update RAW.BOOKINGS instead of inserting new keys.
+    """
+    return {"customer_id": ("C", 5), "worker_id": ("W", 5), "booking_id": ("B", 6)}
+
+
+def _timestamps_between(rng: np.random.Generator, n: int, start: pd.Timestamp, end: pd.Timestamp) -> np.ndarray:
+    """Uniform datetime64[s] values in [start, end]."""
+    seconds = rng.integers(0, int((end - start).total_seconds()) + 1, n)
+    return np.datetime64(start.floor("s"), "s") + seconds.astype("timedelta64[s]")
+
+
+def _faker_pool(method: str, seed: int, size: int = _POOL_SIZE) -> np.ndarray:
+    from faker import Faker
+
+    pool_fake = Faker()
+    pool_fake.seed_instance(seed)
+    return np.array([getattr(pool_fake, method)() for _ in range(size)], dtype=object)
+
+
+def gen_customers_vectorized(n: int = 500, rng: np.random.Generator | None = None, seed: int = 42) -> pd.DataFrame:
+    rng = rng or np.random.default_rng(seed)
+    now = pd.Timestamp.now()
+    created = _timestamps_between(rng, n, now - pd.Timedelta(days=365), now - pd.Timedelta(days=180))
+    updated = created + rng.integers(0, 181, n).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "customer_id": _ids(n),
+        "full_name": _faker_pool("name", seed)[rng.integers(0, _POOL_SIZE, n)],
+        "email": _faker_pool("email", seed)[rng.integers(0, _POOL_SIZE, n)],
+        "phone": rng.integers(10**11, 10**12, n).astype(str),
+        "city": _categorical(rng.integers(0, len(cities), n), cities),
+        "created_at": created,
+        "updated_at": updated,
+    })
+
+
+def gen_workers_vectorized(n: int = 200, rng: np.random.Generator | None = None, seed: int = 42) -> pd.DataFrame:
+    rng = rng or np.random.default_rng(seed)
+    now = pd.Timestamp.now()
+    created = _timestamps_between(rng, n, now - pd.Timedelta(days=365), now - pd.Timedelta(days=300))
+    updated = created + rng.integers(0, 301, n).astype("timedelta64[D]")
+    return pd.DataFrame({
+        "worker_id": _ids(n),
+        "worker_name": _faker_pool("name", seed + 1)[rng.integers(0, _POOL_SIZE, n)],
+        "worker_type": _categorical(rng.integers(0, len(worker_types), n), worker_types),
+        "city": _categorical(rng.integers(0, len(cities), n), cities),
+        "is_active": rng.random(n) > 0.1,
+        "created_at": created,
+        "updated_at": updated,
+    })
+
+
+def gen_bookings_vectorized(
+    customers_df: pd.DataFrame,
+    workers_df: pd.DataFrame,
+    n: int = 5000,
+    rng: np.random.Generator | None = None,
+    seed: int = 42,
+    id_start: int = 1,
+    now: pd.Timestamp | None = None,
+) -> pd.DataFrame:
+    """
+    id_start lets shards produce non-overlapping booking_id ranges;
+    now pins the time window so every shard shares the same one.
+    """
+    rng = rng or np.random.default_rng(seed)
+    now = now or pd.Timestamp.now()
+
+    c_idx = rng.integers(0, len(customers_df), n)
+    w_idx = rng.integers(0, len(workers_df), n)
+    # Both city columns are categoricals over `cities`, so their codes are interchangeable
+    c_city = customers_df["city"].cat.codes.to_numpy()[c_idx]
+    w_city = workers_df["city"].cat.codes.to_numpy()[w_idx]
+
+    requested = _timestamps_between(rng, n, now - pd.Timedelta(days=180), now)
+    # Assignment happens within 0–8 hours after request
+    assigned = requested + rng.integers(0, 8 * 60 + 1, n).astype("timedelta64[m]")
 
-    customers.to_csv("data/customers.csv", index=False)
-    workers.to_csv("data/workers.csv", index=False)
-    bookings.to_csv("data/bookings.csv", index=False)
+    statuses = ["completed", "canceled", "pending"]
+    status = rng.choice(3, size=n, p=[0.7, 0.2, 0.1])
+    nat = np.datetime64("NaT", "s")
+    # Completion 1–8 hours after assignment; cancellation within 5–120 minutes
+    completed = np.where(
+        status == 0,
+        assigned + rng.integers(60, 8 * 60 + 1, n).astype("timedelta64[m]"),
+        nat,
+    )
+    canceled = np.where(
+        status == 1,
+        assigned + rng.integers(5, 121, n).astype("timedelta64[m]"),
+        nat,
+    )
+    # Simulate late updates (up to 3 days after request)
+    updated = requested + rng.integers(0, 3 * 24 * 60 + 1, n).astype("timedelta64[m]")
+
+    return pd.DataFrame({
+        "booking_id": _ids(n, start=id_start),
+        "customer_id": customers_df["customer_id"].to_numpy()[c_idx],
+        "worker_id": workers_df["worker_id"].to_numpy()[w_idx],
+        "city": _categorical(np.where(rng.random(n) < 0.5, c_city, w_city), cities),
+        "channel": _categorical(rng.integers(0, len(channels), n), channels),
+        "status": _categorical(status, statuses),
+        "price": rng.uniform(80, 400, n).round(2),
+        "requested_at": requested,
+        "assigned_at": assigned,
+        "completed_at": completed,
+        "canceled_at": canceled,
+        "updated_at": updated,
+    })
+
+
+def write_output(
+    df: pd.DataFrame,
+    stem: str,
+    target_table: str,
+    fmt: str,
+    ids: dict[str, tuple[str, int]] | None = None,
+) -> str:
+    """
+    Writes df to data/<stem>.<fmt>; Parquet files are typed like target_table.
+    Integer id columns are formatted with ids (default id_formats()).
+    """
+    path = os.path.join(DATA_DIR, f"{stem}.{fmt}")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    _clear_outputs(stem)
+    _write(df, path, target_table, fmt, ids or id_formats())
+    return path
+
+
+def _write(df: pd.DataFrame, path: str, target_table: str, fmt: str, ids: dict[str, tuple[str, int]]) -> None:
+    if fmt == "parquet":
+        from columnar import write_parquet
+        write_parquet(df, path, target_table, ids)
+    else:
+        from columnar import with_formatted_ids
+        with_formatted_ids(df, ids).to_csv(path, index=False)
+
+
+def _clear_outputs(stem: str) -> None:
+    """
+    Removes data/<stem>.{csv,parquet} and data/<stem>/part-* left by previous
+    runs, so load_csvs.py never mixes a stale file with the new dataset.
+    """
+    for ext in ("csv", "parquet"):
+        path = os.path.join(DATA_DIR, f"{stem}.{ext}")
+        if os.path.exists(path):
+            os.remove(path)
+    shard_dir = os.path.join(DATA_DIR, stem)
+    if os.path.isdir(shard_dir):
+        for name in os.listdir(shard_dir):
+            if name.startswith("part-"):
+                os.remove(os.path.join(shard_dir, name))
+
+
+def _bookings_shard(task: tuple) -> tuple[str, int]:
+    """Process-pool worker: generates one shard of bookings and writes data/bookings/part-<k>."""
+    shard, customers_df, workers_df, n, id_start, seed, now, fmt = task
+    # +1 keeps shard 0 off the stream that generated customers/workers
+    rng = np.random.default_rng(seed + 1 + shard)
+    df = gen_bookings_vectorized(
+        customers_df, workers_df, n, rng, id_start=id_start, now=now,
+    )
+    path = os.path.join(DATA_DIR, "bookings", f"part-{shard:05d}.{fmt}")
+    _write(df, path, "RAW.BOOKINGS", fmt, id_formats())
+    return path, len(df)
+
+
+def gen_bookings_sharded(
+    customers_df: pd.DataFrame,
+    workers_df: pd.DataFrame,
+    n: int,
+    shards: int,
+    processes: int | None = None,
+    seed: int = 42,
+    fmt: str = "parquet",
+) -> list[tuple[str, int]]:
+    """
+    Generates n bookings as `shards` files under data/bookings/ using a process pool.
+    Shard k is seeded with seed + 1 + k and owns a contiguous booking_id range, so the
+    output is deterministic for a given (n, shards, seed) whatever the pool size.
+    Returns [(path, rows)] per shard.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    _clear_outputs("bookings")
+    os.makedirs(os.path.join(DATA_DIR, "bookings"), exist_ok=True)
+
+    # Workers only need ids and cities
+    customers_df = customers_df[["customer_id", "city"]]
+    workers_df = workers_df[["worker_id", "city"]]
+    now = pd.Timestamp.now()
+    base, extra = divmod(n, shards)
+    tasks, id_start = [], 1
+    for shard in range(shards):
+        size = base + (1 if shard < extra else 0)
+        tasks.append((shard, customers_df, workers_df, size, id_start, seed, now, fmt))
+        id_start += size
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_bookings_shard, tasks))
+
+
+def main(argv: list[str] | None = None) -> int:
+    """CLI entry point; also called in-process by the orchestration flow."""
+    parser = argparse.ArgumentParser(description="Generate synthetic customers, workers and bookings.")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "parquet"],
+        default=os.environ.get("DATA_FORMAT", "csv"),
+        help="Output file format (default: DATA_FORMAT or csv).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["faker", "numpy"],
+        default="faker",
+        help="faker: row-by-row Faker generation; numpy: vectorized, for large load-test datasets.",
+    )
+    parser.add_argument("--customers", type=int, default=500, help="Number of customers.")
+    parser.add_argument("--workers", type=int, default=200, help="Number of workers.")
+    parser.add_argument("--bookings", type=int, default=5000, help="Number of bookings.")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Write bookings as this many files under data/bookings/, generated in parallel (numpy engine).",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Process pool size for --shards (default: CPU count).",
+    )
+    args = parser.parse_args(argv)
+    if args.shards and args.engine != "numpy":
+        parser.error("--shards requires --engine numpy")
+
+    if args.engine == "numpy":
+        rng = np.random.default_rng(args.seed)
+        with span("generate", table="customers", engine="numpy", rows=args.customers):
+            customers = gen_customers_vectorized(args.customers, rng, seed=args.seed)
+        with span("generate", table="workers", engine="numpy", rows=args.workers):
+            workers = gen_workers_vectorized(args.workers, rng, seed=args.seed)
+        bookings = None
+        if not args.shards:
+            with span("generate", table="bookings", engine="numpy", rows=args.bookings):
+                bookings = gen_bookings_vectorized(customers, workers, args.bookings, rng)
+    else:
+        from faker import Faker
+
+        random.seed(args.seed)
+        Faker.seed(args.seed)
+        with span("generate", table="customers", engine="faker", rows=args.customers):
+            customers = gen_customers(args.customers)
+        with span("generate", table="workers", engine="faker", rows=args.workers):
+            workers = gen_workers(args.workers)
+        with span("generate", table="bookings", engine="faker", rows=args.bookings):
+            bookings = gen_bookings(customers, workers, args.bookings)
 
     print("Generated:")
-    print(f"  data/customers.csv  ({len(customers)} rows)")
-    print(f"  data/workers.csv    ({len(workers)} rows)")
-    print(f"  data/bookings.csv   ({len(bookings)} rows)")
+    outputs = [(customers, "customers", "RAW.CUSTOMERS"), (workers, "workers", "RAW.WORKERS")]
+    if bookings is not None:
+        outputs.append((bookings, "bookings", "RAW.BOOKINGS"))
+    ids = id_formats()
+    for df, stem, target in outputs:
+        with span("write_output", file=f"{stem}.{args.format}", rows=len(df)):
+            path = write_output(df, stem, target, args.format, ids)
+        print(f"  {path:<22} ({len(df)} rows)")
+
+    if args.shards:
+        with span("generate", table="bookings", engine="numpy", rows=args.bookings, shards=args.shards):
+            shards = gen_bookings_sharded(
+                customers, workers, args.bookings, args.shards,
+                processes=args.processes, seed=args.seed, fmt=args.format,
+            )
+        total = sum(rows for _, rows in shards)
+        print(f"  {os.path.join(DATA_DIR, 'bookings', ''):<22} ({total} rows in {len(shards)} shards)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Timing and row-count spans for the pipeline.
+
+    with span("merge", target="RAW.BOOKINGS") as s:
+        ...
+        s.set(rows_inserted=10, query_id=cur.sfqid)
+
+Every finished span becomes one JSON line (run_id, span_id, parent_id, name,
+started_at, duration_ms, status, error, attributes) written to PIPELINE_TRACE:
+a file path, or "-" for stderr; unset disables the output. Spans of the
+current process are also kept in memory so write_pipeline_runs() can store
+the run in OPS.PIPELINE_RUNS.
+"""
+from __future__ import annotations
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+RUN_ID = os.environ.get("PIPELINE_RUN_ID") or uuid.uuid4().hex[:16]
+TRACE_PATH = os.environ.get("PIPELINE_TRACE")
+MAX_KEPT_SPANS = 10_000
+
+_current: contextvars.ContextVar = contextvars.ContextVar("pipeline_span", default=None)
+_lock = threading.Lock()
+_finished: list[dict] = []
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "started_at", "attrs")
+
+    def __init__(self, name: str, parent_id: str | None, attrs: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.attrs = {k: v for k, v in attrs.items() if v is not None}
+
+    def set(self, **attrs) -> None:
+        """Adds attributes (row counts, query ids, ...); None values are skipped."""
+        self.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the enclosed block as a child of the enclosing span, if any."""
+    parent = _current.get()
+    s = Span(name, parent.span_id if parent else None, attrs)
+    token = _current.set(s)
+    t0 = time.perf_counter()
+    status, error = "ok", None
+    try:
+        yield s
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _finish(s, (time.perf_counter() - t0) * 1000, status, error)
+
+
+def _finish(s: Span, duration_ms: float, status: str, error: str | None) -> None:
+    record = {
+        "run_id": RUN_ID,
+        "span_id": s.span_id,
+        "parent_id": s.parent_id,
+        "name": s.name,
+        "started_at": s.started_at.isoformat(sep=" "),
+        "duration_ms": round(duration_ms, 3),
+        "status": status,
+        "error": error,
+        "attributes": s.attrs,
+    }
+    line = json.dumps(record, default=str)
+    with _lock:
+        if len(_finished) < MAX_KEPT_SPANS:
+            _finished.append(record)
+        if TRACE_PATH == "-":
+            print(line, file=sys.stderr)
+        elif TRACE_PATH:
+            with open(TRACE_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def in_current_span(fn):
+    """
+    Wraps fn so it runs under the caller's current span when handed to a
+    thread pool (worker threads do not inherit context variables).
+    """
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+def finished_spans() -> list[dict]:
+    with _lock:
+        return list(_finished)
+
+
+def write_pipeline_runs(conn=None) -> int:
+    """
+    Upserts this process's finished spans into OPS.PIPELINE_RUNS (keyed on
+    run_id, span_id) and returns how many were written.
+    """
+    import pandas as pd
+    from utils import merge_upsert, pooled_conn
+
+    spans = finished_spans()
+    if not spans:
+        return 0
+    df = pd.DataFrame(spans)
+    df["started_at"] = pd.to_datetime(df["started_at"])
+    df["attributes"] = [json.dumps(a, default=str) for a in df["attributes"]]
+    if conn is None:
+        with pooled_conn() as conn:
+            merge_upsert(conn, "OPS.PIPELINE_RUNS", df, key_columns=["run_id", "span_id"], updated_col=None)
+    else:
+        merge_upsert(conn, "OPS.PIPELINE_RUNS", df, key_columns=["run_id", "span_id"], updated_col=None)
+    return len(df)
@@ -1,54 +1,288 @@
 from __future__ import annotations
+import argparse
+import os
 from pathlib import Path
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator
 import pandas as pd
-from utils import get_conn, ensure_tables, merge_upsert
+from utils import (
+    MergeResult,
+    advance_watermarks,
+    pooled_conn,
+    merge_upsert_chunks,
+    merge_upsert_files,
+    get_watermark,
+    filter_since_watermark,
+)
+from instrumentation import in_current_span, span
 
+DATA_DIR = Path(os.environ.get("DATA_DIR") or Path(__file__).resolve().parent.parent / "data")
 
-def load_table(df: pd.DataFrame, target: str, key_cols: list[str], updated_col: str = "updated_at"):
-    conn = get_conn()
-    try:
-        merge_upsert(conn, target, df, key_columns=key_cols, updated_col=updated_col)
-    finally:
-        conn.close()
+# file stem, target table, key columns, timestamp columns (CSV only)
+SOURCES = [
+    ("customers", "RAW.CUSTOMERS", ["customer_id"], ["created_at", "updated_at"]),
+    ("workers", "RAW.WORKERS", ["worker_id"], ["created_at", "updated_at"]),
+    ("bookings", "RAW.BOOKINGS", ["booking_id"],
+     ["requested_at", "assigned_at", "completed_at", "canceled_at", "updated_at"]),
+]
 
 
-if __name__ == "__main__":
-    try:
-        data_dir = (Path(__file__).resolve().parent.parent / "data")
-        customers_fp = data_dir / "customers.csv"
-        workers_fp = data_dir / "workers.csv"
-        bookings_fp = data_dir / "bookings.csv"
-
-        if not customers_fp.exists() or not workers_fp.exists() or not bookings_fp.exists():
-            print("CSV files not found. Run: python ingestion/generate_synthetic.py", file=sys.stderr)
-            sys.exit(1)
-
-        # Read CSVs with proper datetime parsing
-        customers = pd.read_csv(customers_fp, parse_dates=["created_at", "updated_at"])
-        workers = pd.read_csv(workers_fp, parse_dates=["created_at", "updated_at"])
-        bookings = pd.read_csv(
-            bookings_fp,
-            parse_dates=["requested_at", "assigned_at", "completed_at", "canceled_at", "updated_at"]
+def source_path(stem: str, fmt: str = "auto") -> Path:
+    """
+    Returns data/<stem>.<fmt>, or the data/<stem>/ shard directory written by
+    generate_synthetic.py --shards. 'auto' prefers shards, then Parquet, then CSV.
+    """
+    shard_dir = DATA_DIR / stem
+    if shard_files(shard_dir, fmt):
+        return shard_dir
+    if fmt == "auto":
+        parquet = DATA_DIR / f"{stem}.parquet"
+        return parquet if parquet.exists() else DATA_DIR / f"{stem}.csv"
+    return DATA_DIR / f"{stem}.{fmt}"
+
+
+def shard_files(shard_dir: Path, fmt: str = "auto") -> list[Path]:
+    """Sorted part-* files in shard_dir matching fmt ('auto' accepts csv and parquet)."""
+    if not shard_dir.is_dir():
+        return []
+    suffixes = {".csv", ".parquet"} if fmt == "auto" else {f".{fmt}"}
+    return sorted(p for p in shard_dir.glob("part-*") if p.suffix in suffixes)
+
+
+def read_source(fp: Path, parse_dates: list[str], chunksize: int | None = None) -> Iterator:
+    """
+    Yields the file at fp as DataFrames (CSV) or Arrow tables (Parquet). With
+    chunksize, the file is streamed chunksize rows at a time so only one parsed
+    chunk is held client-side; staged rows live in the warehouse (on DuckDB, set
+    DUCKDB_MEMORY_LIMIT so they spill to disk). Parquet is already typed, so
+    parse_dates is only used for CSV. A shard directory is read file by file.
+    """
+    if fp.is_dir():
+        for part in shard_files(fp):
+            yield from read_source(part, parse_dates, chunksize)
+    elif fp.suffix == ".parquet":
+        from columnar import read_parquet
+        yield from read_parquet(fp, chunksize)
+    elif chunksize:
+        reader = pd.read_csv(fp, parse_dates=parse_dates, chunksize=chunksize)
+        while True:
+            # Span only the parse; the chunk is yielded outside it
+            with span("csv_parse", file=fp.name) as sp:
+                chunk = next(reader, None)
+                sp.set(rows=0 if chunk is None else len(chunk))
+            if chunk is None:
+                return
+            yield chunk
+    else:
+        with span("csv_parse", file=fp.name) as sp:
+            df = pd.read_csv(fp, parse_dates=parse_dates)
+            sp.set(rows=len(df))
+        yield df
+
+
+def load_table(
+    df: pd.DataFrame | Iterable,
+    target: str,
+    key_cols: list[str],
+    updated_col: str = "updated_at",
+    incremental: bool = True,
+    advance_watermark: bool = True,
+) -> MergeResult:
+    """
+    Upserts df (a DataFrame, an Arrow table or an iterable of either) into target with a single MERGE.
+    In incremental mode only rows changed since the last OPS.INGESTION_WATERMARKS
+    entry for target are staged. The watermark is advanced in the same
+    transaction as the MERGE unless advance_watermark is False, in which case
+    the caller advances it from the returned MergeResult.
+    """
+    from columnar import is_arrow
+
+    chunks = [df] if isinstance(df, pd.DataFrame) or is_arrow(df) else df
+    with span("load_table", target=target, incremental=incremental) as sp, pooled_conn() as conn:
+        if incremental:
+            watermark = get_watermark(conn, target)
+            print(f"  {target}: watermark {watermark}")
+            chunks = (filter_since_watermark(c, watermark, updated_col) for c in chunks)
+        result = merge_upsert_chunks(
+            conn,
+            target,
+            chunks,
+            key_columns=key_cols,
+            updated_col=updated_col,
+            watermark_source=target if advance_watermark else None,
+        )
+        print(f"  {target}: staged {result.rows_staged} rows")
+        sp.set(rows_staged=result.rows_staged, rows_inserted=result.rows_inserted, rows_updated=result.rows_updated)
+        return result
+
+
+def load_files(
+    paths: list[Path],
+    target: str,
+    key_cols: list[str],
+    updated_col: str = "updated_at",
+    incremental: bool = True,
+    advance_watermark: bool = True,
+) -> MergeResult:
+    """
+    Like load_table(), but Parquet files are bulk-copied into staging by the
+    warehouse (PUT/COPY on Snowflake) and the watermark filter runs there too.
+    """
+    with span("load_files", target=target, files=len(paths), incremental=incremental) as sp, pooled_conn() as conn:
+        watermark = get_watermark(conn, target) if incremental else None
+        if incremental:
+            print(f"  {target}: watermark {watermark}")
+        result = merge_upsert_files(
+            conn,
+            target,
+            paths,
+            key_columns=key_cols,
+            updated_col=updated_col,
+            watermark_source=target if advance_watermark else None,
+            since=watermark,
         )
+        print(f"  {target}: staged {result.rows_staged} rows")
+        sp.set(rows_staged=result.rows_staged, rows_inserted=result.rows_inserted, rows_updated=result.rows_updated)
+        return result
 
-        # Ensure base tables exist
-        conn = get_conn()
-        ensure_tables(conn)
-        conn.close()
 
-        # Upsert into RAW
-        print("Upserting RAW.CUSTOMERS ...")
-        load_table(customers, "RAW.CUSTOMERS", key_cols=["customer_id"], updated_col="updated_at")
+def load_source(
+    fp: Path,
+    target: str,
+    key_cols: list[str],
+    parse_dates: list[str],
+    incremental: bool = True,
+    chunksize: int | None = None,
+    copy_files: bool = False,
+    advance_watermark: bool = True,
+) -> MergeResult:
+    """Loads one input (file or shard directory) into target via load_files() or load_table()."""
+    files = shard_files(fp) if fp.is_dir() else [fp]
+    if copy_files and all(f.suffix == ".parquet" for f in files):
+        return load_files(
+            files, target, key_cols=key_cols, incremental=incremental, advance_watermark=advance_watermark,
+        )
+    return load_table(
+        read_source(fp, parse_dates, chunksize),
+        target,
+        key_cols=key_cols,
+        incremental=incremental,
+        advance_watermark=advance_watermark,
+    )
+
+
+def load_all(
+    paths: dict[str, Path],
+    parallelism: int = len(SOURCES),
+    incremental: bool = True,
+    chunksize: int | None = None,
+    copy_files: bool = False,
+) -> list[MergeResult]:
+    """
+    Stages and merges every source concurrently, each on its own pooled session,
+    with at most `parallelism` tables in flight. Watermarks are only advanced,
+    together in one transaction, once every table has merged: if any table fails
+    the error is raised and no watermark moves, so the next run retries the delta.
+    """
+    def one(source):
+        stem, target, key_cols, parse_dates = source
+        print(f"Upserting {target} from {paths[stem].name} ...")
+        t0 = time.perf_counter()
+        result = load_source(
+            paths[stem], target, key_cols, parse_dates,
+            incremental=incremental, chunksize=chunksize, copy_files=copy_files,
+            advance_watermark=False,
+        )
+        return result, time.perf_counter() - t0
 
-        print("Upserting RAW.WORKERS ...")
-        load_table(workers, "RAW.WORKERS", key_cols=["worker_id"], updated_col="updated_at")
+    results, failures = [], []
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        futures = {pool.submit(in_current_span(one), source): source[1] for source in SOURCES}
+        for future in as_completed(futures):
+            target = futures[future]
+            try:
+                result, seconds = future.result()
+            except Exception as e:
+                failures.append((target, e))
+                print(f"  {target}: FAILED ({e})", file=sys.stderr)
+                continue
+            results.append(result)
+            print(
+                f"  {target}: {result.rows_staged} rows staged, {result.rows_inserted} inserted, "
+                f"{result.rows_updated} updated in {seconds:.2f}s"
+            )
 
-        print("Upserting RAW.BOOKINGS ...")
-        load_table(bookings, "RAW.BOOKINGS", key_cols=["booking_id"], updated_col="updated_at")
+    if failures:
+        names = ", ".join(target for target, _ in failures)
+        raise RuntimeError(f"{len(failures)} table(s) failed: {names}; no watermarks advanced") from failures[0][1]
 
-        print("Loaded RAW tables successfully.")
+    with pooled_conn() as conn:
+        advance_watermarks(conn, {r.target: r.max_updated_at for r in results})
+    return results
+
+
+def main(argv: list[str] | None = None, results: list[MergeResult] | None = None) -> int:
+    """
+    CLI entry point; also called in-process by the orchestration flow, which
+    passes `results` to collect each table's MergeResult.
+    """
+    parser = argparse.ArgumentParser(description="Upsert generated CSV/Parquet files into RAW tables.")
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Ignore ingestion watermarks and upsert every row.",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=int(os.environ.get("CSV_CHUNKSIZE", "0")) or None,
+        help="Stream each CSV in chunks of this many rows (default: CSV_CHUNKSIZE, or whole file).",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["auto", "csv", "parquet"],
+        default="auto",
+        help="Input format; auto uses data/*.parquet when present, else data/*.csv.",
+    )
+    parser.add_argument(
+        "--copy-files",
+        action="store_true",
+        help="Stage Parquet inputs with a warehouse bulk copy (PUT/COPY) instead of client-side inserts.",
+    )
+    parser.add_argument(
+        "--parallelism",
+        type=int,
+        default=int(os.environ.get("LOAD_PARALLELISM", str(len(SOURCES)))),
+        help="Tables staged and merged concurrently (default: LOAD_PARALLELISM, or one per table).",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        paths = {stem: source_path(stem, args.format) for stem, *_ in SOURCES}
+        if not all(fp.exists() for fp in paths.values()):
+            print("Input files not found. Run: python ingestion/generate_synthetic.py", file=sys.stderr)
+            return 1
+
+        # Base tables are ensured once, by the pool, on the first session
+        t0 = time.perf_counter()
+        loaded = load_all(
+            paths,
+            parallelism=args.parallelism,
+            incremental=not args.full_refresh,
+            chunksize=args.chunksize,
+            copy_files=args.copy_files,
+        )
+        print(f"Loaded RAW tables successfully in {time.perf_counter() - t0:.2f}s.")
+        if results is not None:
+            results.extend(loaded)
 
     except Exception as e:
         print(f"Error loading CSVs: {e}", file=sys.stderr)
-        sys.exit(2)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Local columnar cache of recent metrics_daily / anomalies_daily rows.
+
+Alert checks and small reporting scripts run every few minutes; instead of a
+warehouse round-trip each time they read Parquet snapshots under
+METRICS_CACHE_DIR (default data/cache/metrics):
+
+- within METRICS_CACHE_TTL seconds of the last refresh, queries are answered
+  from disk without connecting at all;
+- after that, refresh() fetches only the dates the marts rebuilt since the
+  cached refreshed_at watermark and replaces those dates in the cache;
+- rows older than METRICS_CACHE_DAYS are evicted on every refresh.
+
+    python ingestion/metrics_cache.py anomalies --days 7 [--city Dubai]
+    python ingestion/metrics_cache.py kpis --city Dubai [--days 30]
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from resilience import atomic_write
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+CACHE_DIR = Path(os.environ.get("METRICS_CACHE_DIR", PROJECT_ROOT / "data" / "cache" / "metrics"))
+TTL_SECONDS = int(os.environ.get("METRICS_CACHE_TTL", "300"))
+RETENTION_DAYS = int(os.environ.get("METRICS_CACHE_DAYS", "90"))
+# Schema dbt builds the marts in (target schema + custom 'MARTS')
+MARTS_SCHEMA = os.environ.get("MARTS_SCHEMA", "STAGING_MARTS")
+
+# table -> (column used as refresh watermark, Arrow schema of the cached columns)
+TABLES = {
+    "METRICS_DAILY": ("REFRESHED_AT", pa.schema([
+        ("DATE", pa.date32()),
+        ("CITY", pa.string()),
+        ("BOOKINGS_TOTAL", pa.int64()),
+        ("BOOKINGS_COMPLETED", pa.int64()),
+        ("BOOKINGS_CANCELED", pa.int64()),
+        ("FILL_RATE_PCT", pa.float64()),
+        ("AVG_MINUTES_TO_ASSIGN", pa.float64()),
+        ("AVG_MINUTES_TO_COMPLETE", pa.float64()),
+        ("TEMP_MAX", pa.float64()),
+        ("TEMP_MIN", pa.float64()),
+        ("PRECIPITATION", pa.float64()),
+        ("WINDSPEED_MAX", pa.float64()),
+        ("REFRESHED_AT", pa.timestamp("us")),
+    ])),
+    "ANOMALIES_DAILY": ("REFRESHED_AT", pa.schema([
+        ("DATE", pa.date32()),
+        ("CITY", pa.string()),
+        ("BOOKINGS_TOTAL", pa.int64()),
+        ("MA30", pa.float64()),
+        ("SD30", pa.float64()),
+        ("ZSCORE", pa.float64()),
+        ("IS_ANOMALY", pa.bool_()),
+        ("METRICS_REFRESHED_AT", pa.timestamp("us")),
+        ("REFRESHED_AT", pa.timestamp("us")),
+    ])),
+}
+
+
+def _literal(value) -> str:
+    if isinstance(value, datetime):
+        return f"cast('{value.isoformat(sep=' ')}' as timestamp)"
+    return f"cast('{value.isoformat()}' as date)"
+
+
+def _plain(value):
+    # NUMBER columns come back as Decimal from Snowflake
+    return float(value) if isinstance(value, Decimal) else value
+
+
+class MetricsCache:
+    def __init__(
+        self,
+        root: Path = CACHE_DIR,
+        ttl_seconds: int = TTL_SECONDS,
+        retention_days: int = RETENTION_DAYS,
+        connect=None,
+    ):
+        """connect: zero-argument context manager yielding a warehouse connection (default utils.pooled_conn)."""
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.retention_days = retention_days
+        self._connect = connect
+        self._tables: dict[str, pa.Table] = {}
+
+    # --- storage ------------------------------------------------------------
+
+    def _meta_path(self) -> Path:
+        return self.root / "meta.json"
+
+    def _read_meta(self) -> dict:
+        try:
+            return json.loads(self._meta_path().read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _read_cached(self, name: str) -> pa.Table | None:
+        """The cached rows of name, or None if there are none or they predate a schema change."""
+        path = self.root / f"{name.lower()}.parquet"
+        if not path.exists():
+            return None
+        table = pq.read_table(path)
+        return table if table.schema.equals(TABLES[name][1]) else None
+
+    def table(self, name: str) -> pa.Table:
+        """Cached rows of a mart (METRICS_DAILY or ANOMALIES_DAILY), refreshing first if stale."""
+        self.ensure_fresh()
+        if name not in self._tables:
+            cached = self._read_cached(name)
+            self._tables[name] = cached if cached is not None else TABLES[name][1].empty_table()
+        return self._tables[name]
+
+    # --- refresh ------------------------------------------------------------
+
+    def is_fresh(self) -> bool:
+        refreshed = self._read_meta().get("refreshed_at")
+        return refreshed is not None and time.time() - refreshed < self.ttl_seconds
+
+    def ensure_fresh(self) -> None:
+        if not self.is_fresh():
+            self.refresh()
+
+    def refresh(self) -> dict[str, int]:
+        """
+        Pulls the dates rebuilt since the cached watermark of each mart, replaces
+        them in the cache and evicts rows past retention. Returns rows fetched per mart.
+        """
+        if self._connect is None:
+            from utils import pooled_conn
+            self._connect = lambda: pooled_conn(ensure_tables=False)
+
+        meta = self._read_meta()
+        watermarks = meta.get("watermarks", {})
+        cutoff = date.today() - timedelta(days=self.retention_days)
+        fetched = {}
+        with self._connect() as conn:
+            from warehouse import backend_for
+            backend = backend_for(conn)
+            for name, (ts_col, schema) in TABLES.items():
+                target = backend.qualify(name, default_schema=MARTS_SCHEMA)
+                old = self._read_cached(name)
+                # No (usable) cached rows: fetch the whole retention window again
+                wm = watermarks.get(name) if old is not None else None
+                new = self._fetch(conn, target, schema, ts_col, cutoff, wm and datetime.fromisoformat(wm))
+                fetched[name] = new.num_rows
+                table = self._merge(old, new, cutoff)
+                atomic_write(self.root / f"{name.lower()}.parquet", lambda p, t=table: pq.write_table(t, p))
+                self._tables[name] = table
+                latest = pc.max(table[ts_col]).as_py() if table.num_rows else None
+                if latest is not None:
+                    watermarks[name] = latest.isoformat()
+
+        payload = {"refreshed_at": time.time(), "watermarks": watermarks}
+        atomic_write(self._meta_path(), lambda p: p.write_text(json.dumps(payload), encoding="utf-8"))
+        return fetched
+
+    def _fetch(self, conn, target: str, schema: pa.Schema, ts_col: str, cutoff: date, watermark) -> pa.Table:
+        where = f"date >= {_literal(cutoff)}"
+        if watermark is not None:
+            # Whole dates, so rows a rebuild dropped for that date go too
+            where += f" and date in (select distinct date from {target} where {ts_col} > {_literal(watermark)})"
+        cur = conn.cursor()
+        try:
+            cur.execute(f"select {', '.join(schema.names)} from {target} where {where}")
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+        columns = list(zip(*rows)) if rows else [[] for _ in schema.names]
+        return pa.table(
+            [pa.array([_plain(v) for v in col], type=f.type) for col, f in zip(columns, schema)],
+            schema=schema,
+        )
+
+    def _merge(self, old: pa.Table | None, new: pa.Table, cutoff: date) -> pa.Table:
+        if old is None:
+            old = new.schema.empty_table()
+        keep = pc.greater_equal(old["DATE"], pa.scalar(cutoff, pa.date32()))
+        if new.num_rows:
+            keep = pc.and_(keep, pc.invert(pc.is_in(old["DATE"], value_set=pc.unique(new["DATE"]))))
+        return pa.concat_tables([old.filter(keep), new]).sort_by([("DATE", "ascending"), ("CITY", "ascending")])
+
+    # --- queries ------------------------------------------------------------
+
+    def _recent(self, name: str, days: int | None, city: str | None) -> pa.Table:
+        table = self.table(name)
+        mask = None
+        if days is not None:
+            since = pa.scalar(date.today() - timedelta(days=days), pa.date32())
+            mask = pc.greater_equal(table["DATE"], since)
+        if city is not None:
+            by_city = pc.equal(table["CITY"], city)
+            mask = by_city if mask is None else pc.and_(mask, by_city)
+        return table if mask is None else table.filter(mask)
+
+    def anomalies(self, days: int = 2, city: str | None = None) -> list[dict]:
+        """Anomalous (date, city) rows of the last `days` days, newest first, then by |zscore|."""
+        table = self._recent("ANOMALIES_DAILY", days, city)
+        table = table.filter(pc.equal(table["IS_ANOMALY"], True))
+        rows = table.to_pylist()
+        rows.sort(key=lambda r: (r["DATE"], abs(r["ZSCORE"] or 0)), reverse=True)
+        return rows
+
+    def kpis(self, city: str, days: int | None = None) -> list[dict]:
+        """metrics_daily rows for one city (optionally only the last `days` days), oldest first."""
+        return self._recent("METRICS_DAILY", days, city).to_pylist()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Query the local metrics cache.")
+    parser.add_argument("query", choices=["anomalies", "kpis", "refresh"])
+    parser.add_argument("--days", type=int, default=None)
+    parser.add_argument("--city", default=None)
+    args = parser.parse_args(argv)
+
+    cache = MetricsCache()
+    if args.query == "refresh":
+        print(json.dumps(cache.refresh()))
+        return 0
+    if args.query == "kpis" and not args.city:
+        parser.error("kpis requires --city")
+    rows = cache.anomalies(args.days or 2, args.city) if args.query == "anomalies" else cache.kpis(args.city, args.days)
+    for row in rows:
+        print(json.dumps(row, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
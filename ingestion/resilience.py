@@ -0,0 +1,40 @@
+"""
+Write and retry policy shared by the local caches and the HTTP clients
+(fetch_weather, metrics_cache, alert_dispatcher).
+"""
+from __future__ import annotations
+import os
+import random
+import threading
+from pathlib import Path
+from typing import Callable
+
+# Throttling and transient server errors; anything else is not worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def atomic_write(path: Path, write: Callable[[Path], object]) -> None:
+    """
+    Calls write(tmp) on a sibling temp file, then renames it over path so
+    concurrent readers (and interrupted runs) never see a partial file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def backoff_delay(attempt: int, backoff_seconds: float, retry_after: str | None = None) -> float:
+    """
+    Seconds to wait before retry number attempt + 1: exponential from
+    backoff_seconds, or the server's Retry-After (delta-seconds form) when
+    given, plus up to 50% jitter so concurrent clients do not retry in lockstep.
+    """
+    delay = backoff_seconds * 2 ** attempt
+    if retry_after and retry_after.strip().isdigit():
+        delay = float(retry_after)
+    return delay + random.uniform(0, delay / 2)
@@ -0,0 +1,90 @@
+"""
+Scores RAW.BOOKINGS with the streaming anomaly engine right after load_csvs
+and alerts on new anomalies, without waiting for dbt to rebuild
+metrics_daily and anomalies_daily.
+
+bookings_total per (date, city) is counted straight from RAW.BOOKINGS, which
+holds one row per booking_id as fact_bookings does, so the scores are the
+ones anomalies_daily will hold once dbt has run. Alerts go through
+AlertDispatcher with the same notified state as alert_anomalies.py, so a
+(date, city) alerted on here is not sent again from there, and anything not
+delivered here is picked up by alert_anomalies.py's next run.
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+from utils import pooled_conn, backend_for
+from anomaly_engine import score_metrics
+from alert_dispatcher import AlertDispatcher, format_line
+
+
+def daily_totals(conn):
+    """bookings_total per (date, city), as metrics_daily aggregates fact_bookings."""
+    import pandas as pd
+
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "select cast(requested_at as date) as date, city, count(*) as bookings_total "
+            f"from {backend_for(conn).qualify('RAW.BOOKINGS')} "
+            "where requested_at is not null "
+            "group by 1, 2"
+        )
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    return pd.DataFrame(rows, columns=["date", "city", "bookings_total"])
+
+
+def recent_anomalies(totals, days: int) -> list[dict]:
+    """
+    Anomalous (date, city) rows of the last `days` days, shaped and ordered
+    like MetricsCache.anomalies(). Every row is scored, as the 30-row windows
+    of recent dates reach back further than `days`.
+    """
+    scored = score_metrics(totals)
+    since = date.today() - timedelta(days=days)
+    hits = scored[scored["is_anomaly"] & (scored["date"] >= since)]
+    rows = [
+        {"DATE": r.date, "CITY": r.city, "BOOKINGS_TOTAL": int(r.bookings_total), "ZSCORE": r.zscore}
+        for r in hits.itertuples(index=False)
+    ]
+    rows.sort(key=lambda r: (r["DATE"], abs(r["ZSCORE"])), reverse=True)
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    """CLI entry point; also called in-process by the orchestration flow after load_csvs."""
+    parser = argparse.ArgumentParser(description="Score RAW.BOOKINGS for anomalies and alert on new ones.")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=int(os.environ.get("ANOMALY_LOOKBACK_DAYS", "2")),
+        help="Alert on anomalies of the last N days (default: ANOMALY_LOOKBACK_DAYS or 2).",
+    )
+    args = parser.parse_args(argv)
+
+    with pooled_conn() as conn:
+        totals = daily_totals(conn)
+    rows = recent_anomalies(totals, args.days)
+    print(f"Scored {len(totals)} city-days; {len(rows)} anomalies in the last {args.days} day(s).")
+    if not rows:
+        return 0
+    print("\n".join(format_line(r) for r in rows))
+
+    slack_webhook = os.environ.get("SLACK_WEBHOOK_URL")
+    if slack_webhook:
+        result = AlertDispatcher(slack_webhook).dispatch(rows)
+        # Undelivered rows stay unnotified, so alert_anomalies.py retries them; not a step failure
+        print(
+            f"Slack: {result.sent} new anomalies sent in {result.messages} message(s), "
+            f"{result.skipped} already notified, {result.failed} failed, {result.unknown} unconfirmed"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
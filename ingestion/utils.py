@@ -1,218 +1,597 @@
 from __future__ import annotations
+import atexit
 import os
+import threading
+import time
 import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import List, Tuple
-import pandas as pd
+from typing import TYPE_CHECKING, Iterable, List
 from dotenv import load_dotenv
-import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
+from warehouse import ROW_HASH_COLUMN, get_backend, backend_for, parse_table_identifier, table_columns
+from instrumentation import span
+
+# pandas is imported by the functions that use it, so callers that only need
+# a pooled connection (alert_anomalies.py) start without loading it.
+if TYPE_CHECKING:
+    import pandas as pd
 
 # --- Always load .env from the project root (one level up from ingestion/) ---
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(PROJECT_ROOT / ".env", override=False)
 
 
-def _require_env(keys: list[str]) -> None:
-    missing = [k for k in keys if not os.environ.get(k)]
-    if missing:
-        raise RuntimeError(
-            f"Missing env vars: {', '.join(missing)}. "
-            f"Ensure they are set in {PROJECT_ROOT / '.env'}"
-        )
-
-
 def get_conn():
     """
-    Returns an open Snowflake connection.
-    We do not force a database/schema here,
-    because ensure_tables() will create/select them explicitly.
-    """
-    _require_env([
-        "SNOWFLAKE_ACCOUNT",
-        "SNOWFLAKE_USER",
-        "SNOWFLAKE_PASSWORD",
-        "SNOWFLAKE_ROLE",
-        "SNOWFLAKE_WAREHOUSE",
-        "SNOWFLAKE_DATABASE",
-    ])
-    conn = snowflake.connector.connect(
-        account=os.environ["SNOWFLAKE_ACCOUNT"],
-        user=os.environ["SNOWFLAKE_USER"],
-        password=os.environ["SNOWFLAKE_PASSWORD"],
-        role=os.environ["SNOWFLAKE_ROLE"],
-        warehouse=os.environ["SNOWFLAKE_WAREHOUSE"],
-        client_session_keep_alive=True,
-    )
-    return conn
+    Returns an open connection for the backend selected by WAREHOUSE_BACKEND
+    (snowflake by default, or duckdb for a local embedded warehouse).
+    """
+    return get_backend().connect()
 
 
 def ensure_tables(conn):
     """
-    Creates the warehouse, database, schemas, and required tables if they don't exist.
-    Sets the current DB and schema context.
+    Creates the schemas and required tables if they don't exist
+    (plus the warehouse/database on Snowflake) and sets the session context.
+    """
+    backend_for(conn).ensure_tables(conn)
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of warehouse sessions, so ingestion scripts (and later
+    steps in the same process) reuse logins instead of reconnecting per call.
+
+    - Sessions are opened lazily, up to max_size at a time.
+    - A session idle for longer than health_check_after seconds is probed
+      with `select 1` before reuse and replaced if it has died.
+    - ensure_tables() runs once per pool, on the first session handed out to a
+      caller that asks for it; session context (USE DATABASE/SCHEMA) is then
+      set lazily by the backend.
+    """
+
+    def __init__(self, backend=None, max_size: int = 4, health_check_after: float = 60.0):
+        self.backend = backend or get_backend()
+        self.max_size = max_size
+        self.health_check_after = health_check_after
+        self._idle: list[tuple[object, float]] = []
+        self._open = 0
+        self._tables_ready = False
+        self._tables_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def _acquire(self, ensure: bool):
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn, last_used = None, None
+                    break
+                self._cond.wait()
+
+        try:
+            if conn is not None and time.monotonic() - last_used > self.health_check_after:
+                if not self.backend.is_healthy(conn):
+                    _close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self.backend.connect()
+            if ensure and not self._tables_ready:
+                with self._tables_lock:
+                    if not self._tables_ready:
+                        self.backend.ensure_tables(conn)
+                        self._tables_ready = True
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def _release(self, conn, broken: bool = False) -> None:
+        with self._cond:
+            if broken:
+                self._open -= 1
+                _close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, ensure_tables: bool = True):
+        """
+        Yields a pooled session; it is returned to the pool (or discarded if it
+        died) afterwards. Read-only callers can skip the one-off ensure_tables().
+        """
+        conn = self._acquire(ensure_tables)
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = not self.backend.is_healthy(conn)
+            raise
+        finally:
+            self._release(conn, broken)
+
+    def close_all(self) -> None:
+        with self._cond:
+            for conn, _ in self._idle:
+                _close_quietly(conn)
+            self._open -= len(self._idle)
+            self._idle.clear()
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_POOL: ConnectionPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the process-wide ConnectionPool for WAREHOUSE_BACKEND, creating it on first use."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ConnectionPool(max_size=int(os.environ.get("WAREHOUSE_POOL_SIZE", "4")))
+            atexit.register(_POOL.close_all)
+        return _POOL
+
+
+def pooled_conn(ensure_tables: bool = True):
+    """Shortcut for get_pool().connection()."""
+    return get_pool().connection(ensure_tables=ensure_tables)
+
+
+def _sql_literal(value) -> str:
+    """
+    Renders a Python value as a SQL literal for the small set of
+    bookkeeping statements we issue without bind parameters.
+    """
+    import pandas as pd
+
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return "null"
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return f"cast('{pd.Timestamp(value).isoformat(sep=' ')}' as timestamp)"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def get_watermark(conn, source_name: str) -> pd.Timestamp | None:
+    """
+    Returns the last loaded updated_at for source_name from OPS.INGESTION_WATERMARKS,
+    or None if the source has never been loaded.
     """
+    import pandas as pd
+
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"select last_updated_at from {backend_for(conn).qualify('OPS.INGESTION_WATERMARKS')} "
+            f"where source_name = {_sql_literal(source_name)}"
+        )
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    if row is None or row[0] is None:
+        return None
+    return pd.Timestamp(row[0])
+
+
+def set_watermark(conn, source_name: str, last_updated_at) -> None:
+    """
+    Stores last_updated_at as the watermark for source_name.
+    Does not open or commit a transaction; callers control that.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"delete from {backend_for(conn).qualify('OPS.INGESTION_WATERMARKS')} "
+            f"where source_name = {_sql_literal(source_name)}"
+        )
+        cur.execute(
+            f"insert into {backend_for(conn).qualify('OPS.INGESTION_WATERMARKS')} (source_name, last_updated_at) "
+            f"values ({_sql_literal(source_name)}, {_sql_literal(last_updated_at)})"
+        )
+    finally:
+        cur.close()
+
+
+def get_pending_sources(conn) -> list[str]:
+    """RAW source names in OPS.DBT_PENDING_SOURCES (changed, not yet built and tested by dbt)."""
+    cur = conn.cursor()
+    try:
+        cur.execute(f"select source_name from {backend_for(conn).qualify('OPS.DBT_PENDING_SOURCES')}")
+        return sorted(row[0] for row in cur.fetchall())
+    finally:
+        cur.close()
+
+
+def add_pending_sources(conn, source_names: Iterable[str]) -> None:
+    """Records source_names as pending; ones already pending keep their pending_since."""
+    table = backend_for(conn).qualify("OPS.DBT_PENDING_SOURCES")
+    now = _sql_literal(datetime.utcnow())
+    cur = conn.cursor()
+    try:
+        for name in source_names:
+            cur.execute(
+                f"insert into {table} (source_name, pending_since) "
+                f"select {_sql_literal(name)}, {now} "
+                f"where not exists (select 1 from {table} where source_name = {_sql_literal(name)})"
+            )
+    finally:
+        cur.close()
+
+
+def pending_source_name(target: str) -> str | None:
+    """dbt source table name (raw.<name>) a MERGE into target changes, or None outside RAW."""
+    _, schema, table = parse_table_identifier(target)
+    return table.lower() if (schema or "RAW").upper() == "RAW" else None
+
+
+def clear_pending_sources(conn, source_names: Iterable[str]) -> None:
+    source_names = list(source_names)
+    if not source_names:
+        return
     cur = conn.cursor()
-    db = os.environ["SNOWFLAKE_DATABASE"]
-    wh = os.environ["SNOWFLAKE_WAREHOUSE"]
-    role = os.environ["SNOWFLAKE_ROLE"]
     try:
-        # Role and warehouse
-        cur.execute(f"USE ROLE {role}")
         cur.execute(
-            f"CREATE WAREHOUSE IF NOT EXISTS {wh} "
-            "WAREHOUSE_SIZE = 'XSMALL' AUTO_SUSPEND = 60 AUTO_RESUME = TRUE"
+            f"delete from {backend_for(conn).qualify('OPS.DBT_PENDING_SOURCES')} "
+            f"where source_name in ({', '.join(_sql_literal(n) for n in source_names)})"
         )
-        cur.execute(f"USE WAREHOUSE {wh}")
-
-        # Database and schemas
-        cur.execute(f"CREATE DATABASE IF NOT EXISTS {db}")
-        cur.execute(f"USE DATABASE {db}")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS RAW")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS STAGING")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS MARTS")
-        cur.execute("CREATE SCHEMA IF NOT EXISTS OPS")
-        cur.execute("USE SCHEMA RAW")
-
-        # Tables
-        cur.execute("""
-            create table if not exists RAW.CUSTOMERS (
-              customer_id string primary key,
-              full_name string,
-              email string,
-              phone string,
-              city string,
-              created_at timestamp_ntz,
-              updated_at timestamp_ntz
-            );
-        """)
-        cur.execute("""
-            create table if not exists RAW.WORKERS (
-              worker_id string primary key,
-              worker_name string,
-              worker_type string,
-              city string,
-              is_active boolean,
-              created_at timestamp_ntz,
-              updated_at timestamp_ntz
-            );
-        """)
-        cur.execute("""
-            create table if not exists RAW.BOOKINGS (
-              booking_id string primary key,
-              customer_id string,
-              worker_id string,
-              city string,
-              channel string,
-              status string,
-              price number(10,2),
-              requested_at timestamp_ntz,
-              assigned_at timestamp_ntz,
-              completed_at timestamp_ntz,
-              canceled_at timestamp_ntz,
-              updated_at timestamp_ntz
-            );
-        """)
-        cur.execute("""
-            create table if not exists RAW.WEATHER (
-              city string,
-              date date,
-              temp_max float,
-              temp_min float,
-              precipitation float,
-              windspeed_max float,
-              updated_at timestamp_ntz,
-              primary key (city, date)
-            );
-        """)
-        cur.execute("""
-            create table if not exists OPS.INGESTION_WATERMARKS (
-              source_name string primary key,
-              last_updated_at timestamp_ntz
-            );
-        """)
     finally:
         cur.close()
 
 
-def _parse_table_identifier(identifier: str) -> Tuple[str | None, str | None, str]:
+def _advance_watermark(conn, source_name: str, last_updated_at: pd.Timestamp) -> None:
+    current = get_watermark(conn, source_name)
+    # Never move a watermark backwards (e.g. on a full refresh of older data)
+    if current is None or last_updated_at > current:
+        set_watermark(conn, source_name, last_updated_at)
+
+
+def advance_watermarks(conn, watermarks: dict) -> None:
     """
-    Accepts 'DB.SCHEMA.TABLE' or 'SCHEMA.TABLE' or 'TABLE'.
-    Returns (database, schema, table_name)
+    Advances several watermarks ({source_name: last_updated_at}) in one
+    transaction, e.g. once every table of a parallel load has merged.
     """
-    parts = identifier.split(".")
-    if len(parts) == 3:
-        return parts[0], parts[1], parts[2]
-    if len(parts) == 2:
-        return None, parts[0], parts[1]
-    if len(parts) == 1:
-        return None, None, parts[0]
-    raise ValueError(f"Invalid table identifier: {identifier}")
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN")
+        try:
+            for source_name, last_updated_at in watermarks.items():
+                if last_updated_at is not None:
+                    _advance_watermark(conn, source_name, last_updated_at)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+    finally:
+        cur.close()
+
+
+def filter_since_watermark(
+    df: pd.DataFrame,
+    watermark: pd.Timestamp | None,
+    updated_col: str = "updated_at",
+) -> pd.DataFrame:
+    """
+    Keeps only rows changed at or after the watermark. Ties are kept: the
+    watermark is the max updated_at already loaded, and a later file can carry
+    another row with that same (second-resolution) timestamp; re-staging an
+    already-loaded row is harmless, since the MERGE skips unchanged rows.
+    Rows with a NULL updated_at are kept, since we cannot tell whether they changed.
+    Accepts a pandas DataFrame or a pyarrow Table.
+    """
+    import pandas as pd
+    from columnar import filter_since, is_arrow
+
+    if watermark is None or df is None or len(df) == 0:
+        return df
+    if is_arrow(df):
+        return filter_since(df, watermark, updated_col)
+    updated = pd.to_datetime(df[updated_col], errors="coerce")
+    return df[(updated >= watermark) | updated.isna()]
+
+
+@dataclass
+class MergeResult:
+    """What one merge_upsert*() call moved into target."""
+
+    target: str
+    rows_staged: int = 0
+    max_updated_at: pd.Timestamp | None = None
+    rows_inserted: int = 0
+    rows_updated: int = 0
+
+    @property
+    def changed(self) -> bool:
+        """True if the MERGE inserted or updated any row."""
+        return bool(self.rows_inserted or self.rows_updated)
 
 
 def merge_upsert(
     conn,
     target_table: str,
-    df: pd.DataFrame,
+    df,
     key_columns: List[str],
-    updated_col: str | None = "updated_at"
+    updated_col: str | None = "updated_at",
+    watermark_source: str | None = None,
+    detect_changes: bool = True,
 ):
     """
-    Upsert a DataFrame into Snowflake target_table using MERGE.
+    Upsert a DataFrame (or pyarrow Table) into target_table using MERGE on the connection's backend.
 
     - Idempotent: updates only when S.updated_at >= T.updated_at (if updated_col provided)
+    - With detect_changes, matched rows are only rewritten when their content
+      (ROW_HASH) differs, for tables in warehouse.TABLES that carry one
     - Accepts target_table as 'RAW.TABLE' or 'DB.SCHEMA.TABLE'
+    - If watermark_source is given, OPS.INGESTION_WATERMARKS is advanced to the
+      max updated_col of df in the same transaction as the MERGE
     """
-    if df is None or df.empty:
-        return
+    if df is None or len(df) == 0:
+        return MergeResult(target_table)
+    return merge_upsert_chunks(
+        conn,
+        target_table,
+        [df],
+        key_columns=key_columns,
+        updated_col=updated_col,
+        watermark_source=watermark_source,
+        detect_changes=detect_changes,
+    )
+
+
+def merge_upsert_chunks(
+    conn,
+    target_table: str,
+    chunks: Iterable,
+    key_columns: List[str],
+    updated_col: str | None = "updated_at",
+    watermark_source: str | None = None,
+    detect_changes: bool = True,
+) -> MergeResult:
+    """
+    Streaming variant of merge_upsert(): appends each chunk (a pandas DataFrame
+    or a pyarrow Table) to one temp staging table, then runs a single MERGE.
+    Only one chunk is held in memory at a time.
+    """
+    from columnar import is_arrow, upper_columns
+
+    if watermark_source and not updated_col:
+        raise ValueError("watermark_source requires updated_col")
+
+    backend = backend_for(conn)
+    target = backend.qualify(target_table)
+
+    staging = None
+    columns: List[str] = []
+    staged_rows = 0
+    new_watermark = None
+
+    try:
+        for df in chunks:
+            if df is None or len(df) == 0:
+                continue
+            if is_arrow(df):
+                df = upper_columns(df)
+                chunk_columns = df.column_names
+            else:
+                # Rename without copying the data
+                df = df.set_axis([str(c).upper() for c in df.columns], axis=1, copy=False)
+                chunk_columns = list(df.columns)
+
+            if staging is None:
+                staging = _create_staging(conn, backend, target)
+                columns = chunk_columns
+            elif chunk_columns != columns:
+                raise ValueError(f"Chunk columns {chunk_columns} do not match {columns}")
+
+            with span("stage", target=target, rows=len(df), backend=backend.name):
+                backend.append_staging(conn, staging, df)
+            staged_rows += len(df)
+            if updated_col and updated_col.upper() in chunk_columns:
+                chunk_max = _max_timestamp(df, updated_col.upper())
+                if chunk_max is not None and (new_watermark is None or chunk_max > new_watermark):
+                    new_watermark = chunk_max
+
+        if staging is None:
+            return MergeResult(target_table)
+        inserted, updated = _merge_staged(
+            conn, target, staging, columns, key_columns, updated_col, watermark_source, new_watermark,
+            detect_changes,
+        )
+        return MergeResult(target_table, staged_rows, new_watermark, inserted, updated)
+    finally:
+        if staging is not None:
+            _drop_staging(conn, backend, staging)
+
 
-    df = df.copy()
-    df.columns = [str(c).upper() for c in df.columns]
+def merge_upsert_files(
+    conn,
+    target_table: str,
+    paths: Iterable[Path],
+    key_columns: List[str],
+    updated_col: str | None = "updated_at",
+    watermark_source: str | None = None,
+    since: pd.Timestamp | None = None,
+    detect_changes: bool = True,
+) -> MergeResult:
+    """
+    Upserts Parquet files into target_table without deserializing them client-side:
+    the backend copies them straight into the staging table (PUT/COPY on Snowflake).
+    Rows with updated_col < since are dropped in the warehouse before the MERGE.
+    """
+    import pandas as pd
+
+    if watermark_source and not updated_col:
+        raise ValueError("watermark_source requires updated_col")
+    paths = list(paths)
+    if not paths:
+        return MergeResult(target_table)
+
+    backend = backend_for(conn)
+    target = backend.qualify(target_table)
+    staging = _create_staging(conn, backend, target)
+    try:
+        for path in paths:
+            with span("stage_file", target=target, file=Path(path).name, backend=backend.name):
+                backend.stage_file(conn, staging, Path(path))
+
+        cur = conn.cursor()
+        try:
+            if since is not None and updated_col:
+                cur.execute(f"delete from {staging} where {updated_col.upper()} < {_sql_literal(since)}")
+            cur.execute(f"select count(*), max({updated_col.upper() if updated_col else 'null'}) from {staging}")
+            staged_rows, new_watermark = cur.fetchone()
+        finally:
+            cur.close()
+
+        if not staged_rows:
+            return MergeResult(target_table)
+        new_watermark = None if new_watermark is None else pd.Timestamp(new_watermark)
+        # Files may hold a subset of the target's columns; merge only those present
+        import pyarrow.parquet as pq
+        columns = [c.upper() for c in pq.read_schema(paths[0]).names]
+        inserted, updated = _merge_staged(
+            conn, target, staging, columns, key_columns, updated_col, watermark_source, new_watermark,
+            detect_changes,
+        )
+        return MergeResult(target_table, staged_rows, new_watermark, inserted, updated)
+    finally:
+        _drop_staging(conn, backend, staging)
+
+
+def _create_staging(conn, backend, target: str) -> str:
+    _, _, table = parse_table_identifier(target)
+    tmp_name = f"TMP_{table}_{uuid.uuid4().hex[:8].upper()}"
+    # Create temp table based on target structure
+    return backend.create_staging_table(conn, target, tmp_name)
+
+
+def _drop_staging(conn, backend, staging: str) -> None:
+    # Pooled sessions outlive the merge, and so would their temp tables
+    # (held in memory on DuckDB), so each merge drops its own
+    try:
+        backend.drop_staging_table(conn, staging)
+    except Exception as e:
+        print(f"Could not drop staging table {staging}: {e}")
+
+
+def _max_timestamp(df, column: str) -> pd.Timestamp | None:
+    import pandas as pd
+    from columnar import is_arrow, max_timestamp
 
-    env_db = os.environ["SNOWFLAKE_DATABASE"]
-    db, schema, table = _parse_table_identifier(target_table)
-    if schema is None:
-        schema = "RAW"
-    if db is None:
-        db = env_db
+    if is_arrow(df):
+        return max_timestamp(df, column)
+    value = pd.to_datetime(df[column], errors="coerce").max()
+    return None if pd.isna(value) else value
+
+
+def _merge_staged(
+    conn,
+    target: str,
+    staging: str,
+    columns: List[str],
+    key_columns: List[str],
+    updated_col: str | None,
+    watermark_source: str | None,
+    new_watermark: pd.Timestamp | None,
+    detect_changes: bool = True,
+) -> tuple[int, int]:
+    """
+    MERGEs staging into target and, in the same transaction, advances the
+    watermark and records target in OPS.DBT_PENDING_SOURCES if the MERGE
+    changed any row, so a later failure (another table's load, dbt) can't
+    lose track of it. Returns (rows inserted, rows updated).
+
+    A key staged more than once (within a batch or across chunks) is merged
+    once, from its row with the latest updated_col (NULLs last); otherwise the
+    MERGE would insert it twice or update from an arbitrary row.
+
+    With detect_changes (and a ROW_HASH column on target), the hash of each
+    staged row's non-key columns other than updated_col is computed in the
+    MERGE source and stored with the row; matched rows whose hash is unchanged
+    are skipped, so reloading the same data rewrites nothing.
+    """
+    keys = {k.upper() for k in key_columns}
+    columns = [c for c in columns if c != ROW_HASH_COLUMN]
+    hash_cols = [
+        c for c in columns
+        if c not in keys and c != (updated_col or "").upper()
+    ]
+    use_hash = detect_changes and bool(hash_cols) and ROW_HASH_COLUMN in (table_columns(target) or [])
+
+    # Build MERGE
+    on_clause = " AND ".join([f"T.{k.upper()} = S.{k.upper()}" for k in key_columns])
+    key_list = ", ".join(k.upper() for k in key_columns)
+    latest_first = (
+        f"{updated_col.upper()} desc nulls last"
+        if updated_col and updated_col.upper() in columns else key_list
+    )
+    select_list = "*"
+    if use_hash:
+        # hash() takes any number of arguments of any type on both Snowflake and DuckDB
+        select_list = (
+            f"* exclude ({ROW_HASH_COLUMN}), "
+            f"cast(hash({', '.join(hash_cols)}) as varchar) as {ROW_HASH_COLUMN}"
+        )
+        columns = columns + [ROW_HASH_COLUMN]
+    source = (
+        f"(select {select_list} from {staging} "
+        f"qualify row_number() over (partition by {key_list} order by {latest_first}) = 1)"
+    )
+    non_key_cols = [c for c in columns if c.upper() not in keys]
+    set_clause = ", ".join([f"{c} = S.{c}" for c in non_key_cols]) if non_key_cols else ""
+    insert_cols = ", ".join(columns)
+    insert_vals = ", ".join([f"S.{c}" for c in columns])
+
+    conditions = []
+    if updated_col and updated_col.upper() in columns:
+        conditions.append(f"S.{updated_col.upper()} >= T.{updated_col.upper()}")
+    if use_hash:
+        conditions.append(f"S.{ROW_HASH_COLUMN} is distinct from T.{ROW_HASH_COLUMN}")
+
+    when_matched = ""
+    if set_clause:
+        condition = f" and {' and '.join(conditions)}" if conditions else ""
+        when_matched = f"when matched{condition} then update set {set_clause}"
+
+    merge_sql = f"""
+        merge into {target} as T
+        using {source} as S
+        on {on_clause}
+        {when_matched}
+        when not matched then insert ({insert_cols}) values ({insert_vals});
+    """
 
     cur = conn.cursor()
     try:
-        # Ensure context
-        cur.execute(f"USE DATABASE {db}")
-        cur.execute(f"USE SCHEMA {schema}")
-
-        tmp_name = f"TMP_{table}_{uuid.uuid4().hex[:8].upper()}"
-
-        # Create temp table based on target structure
-        cur.execute(f"CREATE TEMPORARY TABLE {tmp_name} LIKE {db}.{schema}.{table}")
-
-        # Load into temp table
-        write_pandas(conn, df, tmp_name, schema=schema)
-
-        # Build MERGE
-        on_clause = " AND ".join([f"T.{k.upper()} = S.{k.upper()}" for k in key_columns])
-        non_key_cols = [c for c in df.columns if c.upper() not in {k.upper() for k in key_columns}]
-        set_clause = ", ".join([f"{c} = S.{c}" for c in non_key_cols]) if non_key_cols else ""
-        insert_cols = ", ".join(df.columns)
-        insert_vals = ", ".join([f"S.{c}" for c in df.columns])
-
-        when_matched = ""
-        if updated_col and updated_col.upper() in df.columns and set_clause:
-            when_matched = (
-                f"when matched and S.{updated_col.upper()} >= T.{updated_col.upper()} "
-                f"then update set {set_clause}"
-            )
-        elif set_clause:
-            when_matched = f"when matched then update set {set_clause}"
-
-        merge_sql = f"""
-            merge into {db}.{schema}.{table} as T
-            using {db}.{schema}.{tmp_name} as S
-            on {on_clause}
-            {when_matched}
-            when not matched then insert ({insert_cols}) values ({insert_vals});
-        """
-        cur.execute(merge_sql)
+        # Temp table DDL commits implicitly, so the transaction
+        # only spans the MERGE and the watermark and pending-source writes.
+        cur.execute("BEGIN")
+        try:
+            with span("merge", target=target) as sp:
+                counts = backend_for(conn).run_merge(cur, merge_sql, target)
+                sp.set(rows_inserted=counts[0], rows_updated=counts[1], query_id=getattr(cur, "sfqid", None))
+            if watermark_source and new_watermark is not None:
+                _advance_watermark(conn, watermark_source, new_watermark)
+            source = pending_source_name(target)
+            if source and any(counts):
+                add_pending_sources(conn, [source])
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
     finally:
         cur.close()
+    return counts
@@ -0,0 +1,528 @@
+from __future__ import annotations
+import os
+import re
+import tempfile
+import threading
+import uuid
+import weakref
+from pathlib import Path
+from typing import List, Tuple
+from instrumentation import span
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# name, [(column, snowflake type)], primary key columns
+TABLES: List[Tuple[str, List[Tuple[str, str]], List[str]]] = [
+    ("RAW.CUSTOMERS", [
+        ("customer_id", "string"),
+        ("full_name", "string"),
+        ("email", "string"),
+        ("phone", "string"),
+        ("city", "string"),
+        ("created_at", "timestamp_ntz"),
+        ("updated_at", "timestamp_ntz"),
+        ("row_hash", "string"),
+    ], ["customer_id"]),
+    ("RAW.WORKERS", [
+        ("worker_id", "string"),
+        ("worker_name", "string"),
+        ("worker_type", "string"),
+        ("city", "string"),
+        ("is_active", "boolean"),
+        ("created_at", "timestamp_ntz"),
+        ("updated_at", "timestamp_ntz"),
+        ("row_hash", "string"),
+    ], ["worker_id"]),
+    ("RAW.BOOKINGS", [
+        ("booking_id", "string"),
+        ("customer_id", "string"),
+        ("worker_id", "string"),
+        ("city", "string"),
+        ("channel", "string"),
+        ("status", "string"),
+        ("price", "number(10,2)"),
+        ("requested_at", "timestamp_ntz"),
+        ("assigned_at", "timestamp_ntz"),
+        ("completed_at", "timestamp_ntz"),
+        ("canceled_at", "timestamp_ntz"),
+        ("updated_at", "timestamp_ntz"),
+        ("row_hash", "string"),
+    ], ["booking_id"]),
+    ("RAW.WEATHER", [
+        ("city", "string"),
+        ("date", "date"),
+        ("temp_max", "float"),
+        ("temp_min", "float"),
+        ("precipitation", "float"),
+        ("windspeed_max", "float"),
+        ("updated_at", "timestamp_ntz"),
+        ("row_hash", "string"),
+    ], ["city", "date"]),
+    ("OPS.INGESTION_WATERMARKS", [
+        ("source_name", "string"),
+        ("last_updated_at", "timestamp_ntz"),
+    ], ["source_name"]),
+    # RAW sources changed by ingestion whose downstream dbt models have not yet
+    # been built and tested; cleared only once dbt run and test succeed
+    ("OPS.DBT_PENDING_SOURCES", [
+        ("source_name", "string"),
+        ("pending_since", "timestamp_ntz"),
+    ], ["source_name"]),
+    # One row per instrumentation span (see instrumentation.py)
+    ("OPS.PIPELINE_RUNS", [
+        ("run_id", "string"),
+        ("span_id", "string"),
+        ("parent_id", "string"),
+        ("name", "string"),
+        ("started_at", "timestamp_ntz"),
+        ("duration_ms", "float"),
+        ("status", "string"),
+        ("error", "string"),
+        ("attributes", "string"),
+    ], ["run_id", "span_id"]),
+]
+
+SCHEMAS = ["RAW", "STAGING", "MARTS", "OPS"]
+
+# Hash of a row's content columns, maintained by merge_upsert() so unchanged
+# rows are not rewritten (see utils._merge_staged)
+ROW_HASH_COLUMN = "ROW_HASH"
+
+# Columns added to TABLES after their table was first created; ensure_tables()
+# adds them to existing warehouses: (table, column, type)
+ADDED_COLUMNS: List[Tuple[str, str, str]] = [
+    ("RAW.CUSTOMERS", "row_hash", "string"),
+    ("RAW.WORKERS", "row_hash", "string"),
+    ("RAW.BOOKINGS", "row_hash", "string"),
+    ("RAW.WEATHER", "row_hash", "string"),
+]
+
+
+def require_env(keys: list[str]) -> None:
+    missing = [k for k in keys if not os.environ.get(k)]
+    if missing:
+        raise RuntimeError(
+            f"Missing env vars: {', '.join(missing)}. "
+            f"Ensure they are set in {PROJECT_ROOT / '.env'}"
+        )
+
+
+def parse_table_identifier(identifier: str) -> Tuple[str | None, str | None, str]:
+    """
+    Accepts 'DB.SCHEMA.TABLE' or 'SCHEMA.TABLE' or 'TABLE'.
+    Returns (database, schema, table_name)
+    """
+    parts = identifier.split(".")
+    if len(parts) == 3:
+        return parts[0], parts[1], parts[2]
+    if len(parts) == 2:
+        return None, parts[0], parts[1]
+    if len(parts) == 1:
+        return None, None, parts[0]
+    raise ValueError(f"Invalid table identifier: {identifier}")
+
+
+def table_columns(identifier: str) -> List[str] | None:
+    """Upper-cased column names of a table in TABLES, or None if it is not one of ours."""
+    _, schema, table = parse_table_identifier(identifier)
+    name = f"{schema or 'RAW'}.{table}".upper()
+    for table_name, columns, _ in TABLES:
+        if table_name == name:
+            return [c.upper() for c, _ in columns]
+    return None
+
+
+class WarehouseBackend:
+    """
+    The few warehouse-specific operations merge_upsert() and ensure_tables() need.
+    Everything else (MERGE, watermarks, transactions) is plain SQL shared by all backends.
+    """
+
+    name = ""
+
+    @classmethod
+    def owns(cls, conn) -> bool:
+        """True if conn is a connection object produced by this backend's driver."""
+        raise NotImplementedError
+
+    def connect(self):
+        raise NotImplementedError
+
+    def is_healthy(self, conn) -> bool:
+        """Cheap liveness probe used by the connection pool before reusing an idle session."""
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute("select 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def ensure_tables(self, conn) -> None:
+        raise NotImplementedError
+
+    def qualify(self, identifier: str, default_schema: str = "RAW") -> str:
+        """Returns the identifier to use for identifier in SQL."""
+        raise NotImplementedError
+
+    def create_staging_table(self, conn, target_table: str, tmp_name: str) -> str:
+        """Creates an empty temporary table shaped like target_table and returns its identifier."""
+        raise NotImplementedError
+
+    def append_staging(self, conn, staging_table: str, df) -> None:
+        """
+        Appends df (a DataFrame or pyarrow Table with upper-cased column names)
+        to a table from create_staging_table().
+        """
+        raise NotImplementedError
+
+    def stage_file(self, conn, staging_table: str, path: Path) -> None:
+        """Bulk-loads a Parquet file into a table from create_staging_table(), matching columns by name."""
+        raise NotImplementedError
+
+    def run_merge(self, cur, merge_sql: str, target_table: str) -> Tuple[int, int]:
+        """Executes merge_sql on cur and returns (rows inserted, rows updated)."""
+        raise NotImplementedError
+
+    def column_type(self, sql_type: str) -> str:
+        """Maps a TABLES (Snowflake) column type to this backend's type."""
+        return sql_type
+
+    def add_missing_columns(self, cur) -> None:
+        for name, column, sql_type in ADDED_COLUMNS:
+            cur.execute(f"alter table {self.qualify(name)} add column if not exists {column} {self.column_type(sql_type)}")
+
+    def drop_staging_table(self, conn, staging_table: str) -> None:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"drop table if exists {staging_table}")
+        finally:
+            cur.close()
+
+    def render_ddl(self, name: str, columns: List[Tuple[str, str]], primary_key: List[str]) -> str:
+        cols = ",\n".join(f"  {c} {t}" for c, t in columns)
+        return (
+            f"create table if not exists {self.qualify(name)} (\n"
+            f"{cols},\n"
+            f"  primary key ({', '.join(primary_key)})\n"
+            ")"
+        )
+
+
+class SnowflakeBackend(WarehouseBackend):
+    name = "snowflake"
+
+    # (database, schema) each live session was last switched to, so pooled
+    # sessions skip redundant USE DATABASE / USE SCHEMA round trips
+    _context: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def use_context(self, conn, db: str, schema: str) -> None:
+        if self._context.get(conn) == (db, schema):
+            return
+        cur = conn.cursor()
+        try:
+            cur.execute(f"USE DATABASE {db}")
+            cur.execute(f"USE SCHEMA {schema}")
+        finally:
+            cur.close()
+        self._context[conn] = (db, schema)
+
+    def is_healthy(self, conn) -> bool:
+        return not conn.is_closed() and super().is_healthy(conn)
+
+    @classmethod
+    def owns(cls, conn) -> bool:
+        return type(conn).__module__.startswith("snowflake.")
+
+    def connect(self):
+        """
+        Returns an open Snowflake connection.
+        We do not force a database/schema here,
+        because ensure_tables() will create/select them explicitly.
+        """
+        import snowflake.connector
+
+        require_env([
+            "SNOWFLAKE_ACCOUNT",
+            "SNOWFLAKE_USER",
+            "SNOWFLAKE_PASSWORD",
+            "SNOWFLAKE_ROLE",
+            "SNOWFLAKE_WAREHOUSE",
+            "SNOWFLAKE_DATABASE",
+        ])
+        return snowflake.connector.connect(
+            account=os.environ["SNOWFLAKE_ACCOUNT"],
+            user=os.environ["SNOWFLAKE_USER"],
+            password=os.environ["SNOWFLAKE_PASSWORD"],
+            role=os.environ["SNOWFLAKE_ROLE"],
+            warehouse=os.environ["SNOWFLAKE_WAREHOUSE"],
+            client_session_keep_alive=True,
+        )
+
+    def ensure_tables(self, conn) -> None:
+        """
+        Creates the warehouse, database, schemas, and required tables if they don't exist.
+        Sets the current DB and schema context.
+        """
+        cur = conn.cursor()
+        db = os.environ["SNOWFLAKE_DATABASE"]
+        wh = os.environ["SNOWFLAKE_WAREHOUSE"]
+        role = os.environ["SNOWFLAKE_ROLE"]
+        try:
+            # Role and warehouse
+            cur.execute(f"USE ROLE {role}")
+            cur.execute(
+                f"CREATE WAREHOUSE IF NOT EXISTS {wh} "
+                "WAREHOUSE_SIZE = 'XSMALL' AUTO_SUSPEND = 60 AUTO_RESUME = TRUE"
+            )
+            cur.execute(f"USE WAREHOUSE {wh}")
+
+            # Database and schemas
+            cur.execute(f"CREATE DATABASE IF NOT EXISTS {db}")
+            cur.execute(f"USE DATABASE {db}")
+            for schema in SCHEMAS:
+                cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            cur.execute("USE SCHEMA RAW")
+            self._context[conn] = (db, "RAW")
+
+            # Tables
+            for name, columns, primary_key in TABLES:
+                cur.execute(self.render_ddl(name, columns, primary_key))
+            self.add_missing_columns(cur)
+        finally:
+            cur.close()
+
+    def qualify(self, identifier: str, default_schema: str = "RAW") -> str:
+        db, schema, table = parse_table_identifier(identifier)
+        return f"{db or os.environ['SNOWFLAKE_DATABASE']}.{schema or default_schema}.{table}"
+
+    def create_staging_table(self, conn, target_table: str, tmp_name: str) -> str:
+        db, schema, _ = parse_table_identifier(self.qualify(target_table))
+        # write_pandas resolves the temp table against the session context
+        self.use_context(conn, db, schema)
+        cur = conn.cursor()
+        try:
+            cur.execute(f"CREATE TEMPORARY TABLE {tmp_name} LIKE {self.qualify(target_table)}")
+        finally:
+            cur.close()
+        return f"{db}.{schema}.{tmp_name}"
+
+    def append_staging(self, conn, staging_table: str, df) -> None:
+        import pandas as pd
+
+        if not isinstance(df, pd.DataFrame):
+            # Arrow tables already carry warehouse types; ship them as Parquet
+            # rather than round-tripping through pandas.
+            import pyarrow.parquet as pq
+
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / f"{uuid.uuid4().hex}.parquet"
+                pq.write_table(df, path)
+                self.stage_file(conn, staging_table, path)
+            return
+
+        from snowflake.connector.pandas_tools import write_pandas
+
+        db, schema, table = parse_table_identifier(staging_table)
+        with span("write_pandas", table=staging_table, rows=len(df)) as sp:
+            _, _, nrows, _ = write_pandas(conn, df, table, database=db, schema=schema)
+            sp.set(rows_written=nrows)
+
+    def stage_file(self, conn, staging_table: str, path: Path) -> None:
+        db, schema, table = parse_table_identifier(staging_table)
+        stage = f"@{db}.{schema}.%{table}"
+        cur = conn.cursor()
+        try:
+            with span("put", file=path.name) as sp:
+                cur.execute(f"PUT 'file://{path.resolve().as_posix()}' {stage} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+                sp.set(query_id=cur.sfqid)
+            with span("copy_into", table=staging_table, file=path.name) as sp:
+                cur.execute(
+                    f"COPY INTO {staging_table} FROM {stage} "
+                    f"FILES = ('{path.name}') "
+                    "FILE_FORMAT = (TYPE = PARQUET) "
+                    "MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE PURGE = TRUE"
+                )
+                sp.set(query_id=cur.sfqid)
+        finally:
+            cur.close()
+
+    def run_merge(self, cur, merge_sql: str, target_table: str) -> Tuple[int, int]:
+        # MERGE returns one row: "number of rows inserted", "number of rows updated"
+        cur.execute(merge_sql)
+        row = cur.fetchone()
+        counts = {d[0].lower(): v for d, v in zip(cur.description, row)}
+        return int(counts.get("number of rows inserted", 0)), int(counts.get("number of rows updated", 0))
+
+
+class DuckDBConnection:
+    """
+    DB-API style wrapper around a duckdb connection.
+
+    duckdb's own cursor() opens a *separate* connection with its own temp tables
+    and transaction, whereas Snowflake cursors share the session. Cursors from
+    this wrapper all run on the one underlying connection, so code written
+    against Snowflake (BEGIN on one cursor, writes on another) behaves the same.
+    """
+
+    def __init__(self, con):
+        self.raw = con
+
+    def cursor(self) -> "_DuckDBCursor":
+        return _DuckDBCursor(self.raw)
+
+    def commit(self) -> None:
+        self.raw.commit()
+
+    def rollback(self) -> None:
+        self.raw.rollback()
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+class _DuckDBCursor:
+    def __init__(self, con):
+        self._con = con
+
+    def execute(self, sql: str, params=None):
+        self._con.execute(sql, params)
+        return self
+
+    def fetchone(self):
+        return self._con.fetchone()
+
+    def fetchall(self):
+        return self._con.fetchall()
+
+    @property
+    def description(self):
+        return self._con.description
+
+    def close(self) -> None:
+        pass
+
+
+class DuckDBBackend(WarehouseBackend):
+    """
+    Embedded local engine for benchmarks, tests and offline development.
+    Uses DUCKDB_PATH (default data/warehouse.duckdb; ':memory:' is allowed).
+    DUCKDB_MEMORY_LIMIT (e.g. '512MB') caps DuckDB's buffer pool; past it,
+    staging tables and MERGE joins spill to DUCKDB_TEMP_DIR (DuckDB's default
+    is '<DUCKDB_PATH>.tmp') instead of growing the process.
+    Database qualifiers are ignored: 'ANALYTICS.RAW.X' maps to 'RAW.X'.
+    """
+
+    name = "duckdb"
+
+    _TYPE_MAP = [
+        (re.compile(r"^timestamp_ntz$", re.I), "timestamp"),
+        (re.compile(r"^number\(", re.I), "decimal("),
+    ]
+
+    @classmethod
+    def owns(cls, conn) -> bool:
+        return isinstance(conn, DuckDBConnection)
+
+    # One database instance per path for the whole process. Connections are
+    # duckdb cursors on it, so ':memory:' is shared by every pooled session
+    # and concurrent sessions are safe.
+    _instances: dict = {}
+    _lock = threading.Lock()
+
+    def connect(self) -> DuckDBConnection:
+        import duckdb
+
+        path = os.environ.get("DUCKDB_PATH", str(PROJECT_ROOT / "data" / "warehouse.duckdb"))
+        with self._lock:
+            if path not in self._instances:
+                if path != ":memory:":
+                    Path(path).parent.mkdir(parents=True, exist_ok=True)
+                config = {
+                    key: os.environ[env]
+                    for key, env in (("memory_limit", "DUCKDB_MEMORY_LIMIT"), ("temp_directory", "DUCKDB_TEMP_DIR"))
+                    if os.environ.get(env)
+                }
+                self._instances[path] = duckdb.connect(path, config=config)
+            return DuckDBConnection(self._instances[path].cursor())
+
+    def ensure_tables(self, conn) -> None:
+        cur = conn.cursor()
+        try:
+            for schema in SCHEMAS:
+                cur.execute(f"create schema if not exists {schema}")
+            for name, columns, primary_key in TABLES:
+                cur.execute(self.render_ddl(name, columns, primary_key))
+            self.add_missing_columns(cur)
+        finally:
+            cur.close()
+
+    def column_type(self, sql_type: str) -> str:
+        for pattern, repl in self._TYPE_MAP:
+            sql_type = pattern.sub(repl, sql_type)
+        return sql_type
+
+    def render_ddl(self, name: str, columns: List[Tuple[str, str]], primary_key: List[str]) -> str:
+        # Snowflake does not enforce primary keys; leave them off so DuckDB
+        # accepts the same data (and MERGE stays an unindexed join like upstream).
+        cols = [f"  {c} {self.column_type(t)}" for c, t in columns]
+        return f"create table if not exists {self.qualify(name)} (\n" + ",\n".join(cols) + "\n)"
+
+    def qualify(self, identifier: str, default_schema: str = "RAW") -> str:
+        _, schema, table = parse_table_identifier(identifier)
+        return f"{schema or default_schema}.{table}"
+
+    def create_staging_table(self, conn, target_table: str, tmp_name: str) -> str:
+        cur = conn.cursor()
+        try:
+            cur.execute(f"create temporary table {tmp_name} as select * from {self.qualify(target_table)} limit 0")
+        finally:
+            cur.close()
+        return tmp_name
+
+    def append_staging(self, conn, staging_table: str, df) -> None:
+        # duckdb scans both pandas and Arrow objects in place
+        view = f"{staging_table}_SRC"
+        conn.raw.register(view, df)
+        try:
+            conn.raw.execute(f"insert into {staging_table} by name select * from {view}")
+        finally:
+            conn.raw.unregister(view)
+
+    def stage_file(self, conn, staging_table: str, path: Path) -> None:
+        literal = str(path.resolve()).replace("'", "''")
+        conn.raw.execute(f"insert into {staging_table} by name select * from read_parquet('{literal}')")
+
+    def run_merge(self, cur, merge_sql: str, target_table: str) -> Tuple[int, int]:
+        # duckdb only reports the total rows touched; the target never loses
+        # rows in a MERGE, so its growth is the insert count.
+        count_sql = f"select count(*) from {target_table}"
+        before = cur.execute(count_sql).fetchone()[0]
+        touched = cur.execute(merge_sql).fetchone()[0]
+        inserted = cur.execute(count_sql).fetchone()[0] - before
+        return inserted, touched - inserted
+
+
+BACKENDS = {b.name: b for b in (SnowflakeBackend, DuckDBBackend)}
+
+
+def get_backend(name: str | None = None) -> WarehouseBackend:
+    """Returns the backend named by name, or by WAREHOUSE_BACKEND (default 'snowflake')."""
+    name = (name or os.environ.get("WAREHOUSE_BACKEND") or "snowflake").lower()
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown WAREHOUSE_BACKEND '{name}'. Expected one of: {', '.join(BACKENDS)}"
+        ) from None
+
+
+def backend_for(conn) -> WarehouseBackend:
+    """Returns the backend that produced conn, falling back to WAREHOUSE_BACKEND."""
+    for cls in BACKENDS.values():
+        if cls.owns(conn):
+            return cls()
+    return get_backend()
@@ -1,56 +1,109 @@
 import os
 import sys
-import subprocess
+import time
 from datetime import timedelta
 from pathlib import Path
 
 from dotenv import load_dotenv
 from prefect import flow, task
+from prefect.task_runners import ConcurrentTaskRunner
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 
-# Load Snowflake creds for child processes (dbt, scripts)
+# Load Snowflake creds for the in-process steps (dbt, scripts)
 load_dotenv(BASE_DIR / ".env")
 
-
-def run(cmd: list[str], cwd: Path | None = None, env: dict | None = None):
-    print(f"Running: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True, cwd=cwd, env=env)
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from steps import mark_built, pending_sources, record_run, run_dbt, run_script, source_selector  # noqa: E402
+from instrumentation import span  # noqa: E402
 
 
 @task(retries=2, retry_delay_seconds=60, timeout_seconds=600)
 def generate_data():
-    run([sys.executable, str(BASE_DIR / "ingestion" / "generate_synthetic.py")])
+    return run_script("generate_synthetic")
 
 
 @task(retries=2, retry_delay_seconds=60, timeout_seconds=900)
 def load_csvs():
-    run([sys.executable, str(BASE_DIR / "ingestion" / "load_csvs.py")])
+    return run_script("load_csvs", collect=True)
 
 
 @task(retries=2, retry_delay_seconds=60, timeout_seconds=900)
 def fetch_weather():
-    run([sys.executable, str(BASE_DIR / "ingestion" / "fetch_weather.py")])
+    return run_script("fetch_weather", collect=True)
 
 
-@task(retries=1, timeout_seconds=1800)
-def dbt_run():
-    # Use module entrypoint so it works reliably on Windows
-    run([sys.executable, "-m", "dbt.cli.main", "run", "--project-dir", str(BASE_DIR / "dbt_project")])
+@task(timeout_seconds=600)
+def score_anomalies():
+    return run_script("score_anomalies")
 
 
-@task(retries=1, timeout_seconds=900)
-def dbt_test():
-    run([sys.executable, "-m", "dbt.cli.main", "test", "--project-dir", str(BASE_DIR / "dbt_project")])
+@task(retries=1, timeout_seconds=1800)
+def dbt_run(select: list[str] | None = None):
+    return run_dbt(["run", *(select or [])])
 
 
-@flow(name="elt_pipeline")
-def elt_pipeline():
-    generate_data()
-    load_csvs()
-    fetch_weather()
-    dbt_run()
-    dbt_test()
+@task(retries=1, timeout_seconds=900)
+def dbt_test(select: list[str] | None = None):
+    return run_dbt(["test", *(select or [])])
+
+
+@flow(name="elt_pipeline", task_runner=ConcurrentTaskRunner())
+def elt_pipeline(
+    full_build: bool = os.getenv("DBT_FULL_BUILD", "").lower() in ("1", "true"),
+    early_alerts: bool = os.getenv("EARLY_ANOMALY_ALERTS", "").lower() in ("1", "true"),
+) -> dict[str, float]:
+    """
+    generate_data -> load_csvs --+--> (score_anomalies)
+                                 +--> dbt_run -> dbt_test
+    fetch_weather ---------------+
+
+    dbt only builds and tests models downstream of the RAW sources whose MERGE
+    inserted or updated rows (source:raw.<name>+), plus sources a failed run
+    left pending in OPS.DBT_PENDING_SOURCES, and is skipped when there are
+    none. full_build (or DBT_FULL_BUILD=1) runs the whole project instead.
+    early_alerts (or EARLY_ANOMALY_ALERTS=1) scores the loaded bookings with
+    the streaming anomaly engine and alerts right after load_csvs.
+    """
+    started = time.perf_counter()
+    try:
+        with span("elt_pipeline", full_build=full_build, early_alerts=early_alerts):
+            generated = generate_data.submit()
+            loaded = load_csvs.submit(wait_for=[generated])
+            # Steps run in this process and share one pool (and one DuckDB instance),
+            # so both branches can write concurrently on either backend.
+            weather = fetch_weather.submit()
+
+            futures = {"generate_data": generated, "load_csvs": loaded, "fetch_weather": weather}
+            if early_alerts:
+                futures["score_anomalies"] = score_anomalies.submit(wait_for=[loaded])
+            # Each load records the RAW sources it changed as its MERGEs commit,
+            # so they stay pending even if the other branch fails here
+            loaded.result()
+            weather.result()
+            pending = pending_sources()
+            select = None
+            if not full_build:
+                select = source_selector(pending) if pending else None
+
+            if full_build or select:
+                built = dbt_run.submit(select, wait_for=[loaded, weather])
+                futures["dbt_run"] = built
+                futures["dbt_test"] = dbt_test.submit(select, wait_for=[built])
+            else:
+                print("No RAW changes; skipping dbt.")
+
+            durations = {name: round(f.result().seconds, 2) for name, f in futures.items()}
+            # Only reached when dbt run and test succeeded (result() re-raises)
+            mark_built(pending)
+    finally:
+        # Failed runs are recorded too
+        record_run()
+
+    durations["total"] = round(time.perf_counter() - started, 2)
+    for name, seconds in durations.items():
+        print(f"{name:<14} {seconds:>8.2f}s")
+    return durations
 
 
 if __name__ == "__main__":
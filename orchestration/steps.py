@@ -0,0 +1,109 @@
+"""
+In-process pipeline steps shared by elt_flow.py and run_all.py.
+
+The ingestion scripts expose main(argv) and dbt is driven through dbtRunner,
+so a run pays interpreter startup and the pandas/connector/dbt imports once,
+and every step shares the ingestion connection pool in utils.
+
+dbt can be limited to the models downstream of the RAW sources that actually
+changed. Each MERGE that changes a RAW table records it in
+OPS.DBT_PENDING_SOURCES in the same transaction, and it stays there until dbt
+run and test succeed, so a failed step (another load, or dbt) is picked up
+again by the next run even though ingestion (whose watermarks already moved)
+finds nothing new.
+"""
+from __future__ import annotations
+import importlib
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DBT_PROJECT_DIR = BASE_DIR / "dbt_project"
+
+# Ingestion modules import each other flatly (from utils import ...)
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+from instrumentation import span  # noqa: E402
+
+
+@dataclass
+class StepResult:
+    seconds: float
+    merges: list = field(default_factory=list)  # utils.MergeResult per RAW table
+
+
+def run_script(module: str, argv: list[str] | None = None, collect: bool = False) -> StepResult:
+    """
+    Calls ingestion/<module>.py's main(argv) and returns its duration, plus
+    its MergeResults if collect is set (main must accept `results`).
+    A non-zero exit code raises RuntimeError.
+    """
+    argv = list(argv or [])
+    print(f"Running: {module} {' '.join(argv)}".rstrip())
+    merges: list = []
+    started = time.perf_counter()
+    with span("step", step=module, argv=" ".join(argv) or None) as sp:
+        main = importlib.import_module(module).main
+        code = main(argv, results=merges) if collect else main(argv)
+        sp.set(
+            exit_code=code,
+            rows_inserted=sum(m.rows_inserted for m in merges),
+            rows_updated=sum(m.rows_updated for m in merges),
+        )
+        if code:
+            raise RuntimeError(f"{module} exited with code {code}")
+    return StepResult(time.perf_counter() - started, merges)
+
+
+def pending_sources() -> list[str]:
+    """
+    dbt source table names (raw.<name>) in OPS.DBT_PENDING_SOURCES: changed by
+    this run's loads or left over by an earlier run that failed.
+    """
+    from utils import get_pending_sources, pooled_conn
+
+    with pooled_conn() as conn:
+        pending = get_pending_sources(conn)
+    print(f"Pending RAW sources: {', '.join(pending) or 'none'}")
+    return pending
+
+
+def mark_built(sources: list[str]) -> None:
+    """Clears sources from OPS.DBT_PENDING_SOURCES; call once dbt run and test both succeeded."""
+    from utils import clear_pending_sources, pooled_conn
+
+    with pooled_conn() as conn:
+        clear_pending_sources(conn, sources)
+
+
+def source_selector(sources: list[str]) -> list[str]:
+    """dbt args selecting the given raw sources and everything downstream of them."""
+    return ["--select", *(f"source:raw.{name}+" for name in sources)]
+
+
+def run_dbt(args: list[str]) -> StepResult:
+    """Invokes dbt in-process (dbtRunner) against dbt_project and returns its duration."""
+    from dbt.cli.main import dbtRunner
+
+    cmd = [*args, "--project-dir", str(DBT_PROJECT_DIR)]
+    print(f"Running: dbt {' '.join(cmd)}")
+    started = time.perf_counter()
+    with span("dbt", command=" ".join(args)) as sp:
+        res = dbtRunner().invoke(cmd)
+        # run/test return a RunExecutionResult with one entry per node
+        nodes = getattr(res.result, "results", None) or []
+        sp.set(success=res.success, nodes=len(nodes))
+        if not res.success:
+            raise RuntimeError(f"dbt {args[0]} failed") from res.exception
+    return StepResult(time.perf_counter() - started)
+
+
+def record_run() -> None:
+    """Writes this run's spans to OPS.PIPELINE_RUNS when PIPELINE_RUNS_WRITE=1."""
+    if os.environ.get("PIPELINE_RUNS_WRITE", "").lower() not in ("1", "true"):
+        return
+    from instrumentation import RUN_ID, write_pipeline_runs
+
+    print(f"Recorded {write_pipeline_runs()} spans for run {RUN_ID} in OPS.PIPELINE_RUNS")
@@ -1,17 +1,55 @@
-import os, sys, subprocess
+import argparse
+import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
 BASE = Path(__file__).resolve().parent
 load_dotenv(BASE / ".env")
 
-def run(cmd, cwd=None):
-    print("Running:", " ".join(cmd))
-    subprocess.run(cmd, check=True, cwd=cwd)
+# Run every step in this process: one interpreter, one set of imports, one pool
+sys.path.insert(0, str(BASE / "orchestration"))
+from steps import mark_built, pending_sources, record_run, run_dbt, run_script, source_selector  # noqa: E402
+from instrumentation import span  # noqa: E402
+
+
+def run(full_build: bool, early_alerts: bool) -> None:
+    run_script("generate_synthetic")
+    run_script("load_csvs", collect=True)
+    if early_alerts:
+        run_script("score_anomalies")
+    run_script("fetch_weather", collect=True)
+    # Recorded by each load's MERGEs; includes sources whose dbt step failed on an earlier run
+    pending = pending_sources()
+    if full_build:
+        select = []
+    else:
+        if not pending:
+            print("No RAW changes; skipping dbt.")
+            return
+        select = source_selector(pending)
+    run_dbt(["run", *select])
+    run_dbt(["test", *select])
+    mark_built(pending)
+
 
 if __name__ == "__main__":
-    run([sys.executable, str(BASE / "ingestion" / "generate_synthetic.py")])
-    run([sys.executable, str(BASE / "ingestion" / "load_csvs.py")])
-    run([sys.executable, str(BASE / "ingestion" / "fetch_weather.py")])
-    run([sys.executable, "-m", "dbt.cli.main", "run", "--project-dir", str(BASE / "dbt_project")])
-    run([sys.executable, "-m", "dbt.cli.main", "test", "--project-dir", str(BASE / "dbt_project")])
+    parser = argparse.ArgumentParser(description="Run the whole ELT pipeline once.")
+    parser.add_argument(
+        "--full-build",
+        action="store_true",
+        help="Run and test every dbt model instead of only those downstream of changed RAW sources.",
+    )
+    parser.add_argument(
+        "--early-alerts",
+        action="store_true",
+        default=os.getenv("EARLY_ANOMALY_ALERTS", "").lower() in ("1", "true"),
+        help="Score the loaded bookings for anomalies and alert before dbt runs (default: EARLY_ANOMALY_ALERTS).",
+    )
+    args = parser.parse_args()
+
+    try:
+        with span("run_all", full_build=args.full_build, early_alerts=args.early_alerts):
+            run(args.full_build, args.early_alerts)
+    finally:
+        record_run()
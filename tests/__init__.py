@@ -0,0 +1,19 @@
+"""
+Correctness tests; the bench_* scripts under benchmarks/ only measure timing.
+
+    python -m unittest discover -s tests -t .
+
+They run offline: HTTP clients talk to local stub servers (tests/stubs.py)
+and warehouse code to an in-memory DuckDB (WAREHOUSE_BACKEND=duckdb).
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+
+# Ingestion modules import each other flatly (from utils import ...)
+sys.path.insert(0, str(BASE_DIR / "ingestion"))
+
+os.environ.setdefault("WAREHOUSE_BACKEND", "duckdb")
+os.environ.setdefault("DUCKDB_PATH", ":memory:")
@@ -0,0 +1,139 @@
+"""
+Local HTTP stand-ins for the Open-Meteo archive API and a Slack webhook.
+
+Both take a `script`: a queue of responses to give before answering normally.
+  ("status", code[, retry_after])   answer code, optionally with Retry-After
+  ("hang", seconds)                 wait, then close without answering
+  ("slow", seconds)                 wait, then answer normally
+"""
+from __future__ import annotations
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+from datetime import date, timedelta
+
+
+class _Stub:
+    path = "/"
+
+    def __init__(self):
+        self.attempts = 0
+        self.script: list[tuple] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self, None)
+
+            def do_POST(self):
+                stub._handle(self, self.rfile.read(int(self.headers["Content-Length"])))
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}{self.path}"
+
+    def reset(self, script=()) -> None:
+        with self.lock:
+            self.attempts, self.script, self.max_in_flight = 0, list(script), 0
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle(self, handler, body: bytes | None) -> None:
+        with self.lock:
+            self.attempts += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            action = self.script.pop(0) if self.script else ("ok",)
+        try:
+            if action[0] in ("hang", "slow"):
+                time.sleep(action[1])
+                if action[0] == "hang":
+                    return
+            if action[0] == "status":
+                handler.send_response(action[1])
+                if len(action) > 2:
+                    handler.send_header("Retry-After", action[2])
+                handler.end_headers()
+                return
+            payload = self.answer(handler, body)
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # a "slow" answer the client stopped waiting for
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def answer(self, handler, body: bytes | None) -> bytes:
+        raise NotImplementedError
+
+
+class ArchiveStub(_Stub):
+    """
+    Answers daily weather for the requested range after `latency` seconds.
+    Days from `unpublished_from` on come back with null values, like ERA5's
+    trailing edge. `requests` lists the (start_date, end_date) answered.
+    """
+
+    path = "/v1/era5"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.unpublished_from: date | None = None
+        self.requests: list[tuple[str, str]] = []
+        super().__init__()
+
+    def reset(self, script=()) -> None:
+        super().reset(script)
+        with self.lock:
+            self.requests = []
+
+    def answer(self, handler, body) -> bytes:
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(handler.path).query))
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests.append((query["start_date"], query["end_date"]))
+        start, end = date.fromisoformat(query["start_date"]), date.fromisoformat(query["end_date"])
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        published = [self.unpublished_from is None or d < self.unpublished_from for d in days]
+        return json.dumps({"daily": {
+            "time": [d.isoformat() for d in days],
+            "temperature_2m_max": [35.0 if p else None for p in published],
+            "temperature_2m_min": [25.0 if p else None for p in published],
+            "precipitation_sum": [0.0 if p else None for p in published],
+            "windspeed_10m_max": [12.0 if p else None for p in published],
+        }}).encode("utf-8")
+
+
+class WebhookStub(_Stub):
+    """Accepts Slack messages; `received` lists (monotonic time, text) in arrival order."""
+
+    path = "/hook"
+
+    def __init__(self):
+        self.received: list[tuple[float, str]] = []
+        super().__init__()
+
+    def reset(self, script=()) -> None:
+        super().reset(script)
+        with self.lock:
+            self.received = []
+
+    def answer(self, handler, body) -> bytes:
+        with self.lock:
+            self.received.append((time.monotonic(), json.loads(body)["text"]))
+        return b"ok"
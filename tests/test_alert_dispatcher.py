@@ -0,0 +1,100 @@
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from pathlib import Path
+
+from tests.stubs import WebhookStub
+
+from alert_dispatcher import MAX_CHARS, MAX_LINES, AlertDispatcher, NotifiedState, chunk_rows, format_line
+
+
+def make_rows(cities: int, days_ago: int = 0) -> list[dict]:
+    day = date.today() - timedelta(days=days_ago)
+    return [
+        {"DATE": day, "CITY": f"city_{i:05d}", "BOOKINGS_TOTAL": 100 + i, "ZSCORE": 3.0 + i / 100}
+        for i in range(cities)
+    ]
+
+
+class DispatcherTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = WebhookStub()
+        cls.addClassCleanup(cls.stub.close)
+
+    def setUp(self):
+        self.stub.reset()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.state_path = Path(tmp.name) / "notified.json"
+
+    def dispatcher(self, **kw) -> AlertDispatcher:
+        opts = dict(rate_per_second=50, backoff_seconds=0.01, timeout_seconds=2, deadline_seconds=10)
+        opts.update(kw)
+        return AlertDispatcher(self.stub.url, state=NotifiedState(self.state_path), **opts)
+
+    def test_burst_is_chunked_in_order_within_rate_limit(self):
+        rows = make_rows(300)
+        result = self.dispatcher(rate_per_second=20).dispatch(rows)
+        self.assertEqual((result.sent, result.failed), (len(rows), 0))
+        texts = [t for _, t in self.stub.received]
+        self.assertEqual(len(texts), result.messages)
+        self.assertLessEqual(max(map(len, texts)), MAX_CHARS)
+        lines = [line for t in texts for line in t.splitlines()[1:]]
+        self.assertEqual(lines, [format_line(r) for r in rows])
+        # Over the whole burst: arrival times at the stub jitter message to message
+        stamps = [at for at, _ in self.stub.received]
+        self.assertGreaterEqual(stamps[-1] - stamps[0], (len(stamps) - 1) / 20 * 0.9)
+
+    def test_already_notified_rows_are_not_sent_again(self):
+        rows = make_rows(10)
+        self.dispatcher().dispatch(rows)
+        self.stub.reset()
+        result = self.dispatcher().dispatch(rows)
+        self.assertEqual((result.sent, result.skipped, self.stub.attempts), (0, len(rows), 0))
+
+    def test_throttling_and_server_errors_are_retried(self):
+        self.stub.reset([("status", 429, "0"), ("status", 503), ("status", 500)])
+        result = self.dispatcher().dispatch(make_rows(5))
+        self.assertEqual((result.sent, result.failed, self.stub.attempts), (5, 0, 4))
+
+    def test_client_error_is_not_retried_and_stays_pending(self):
+        rows = make_rows(3)
+        self.stub.reset([("status", 400)])
+        result = self.dispatcher().dispatch(rows)
+        self.assertEqual((result.failed, self.stub.attempts), (3, 1))
+        self.stub.reset()
+        self.assertEqual(self.dispatcher().dispatch(rows).sent, 3)
+
+    def test_slow_webhook_is_abandoned_at_deadline_and_not_resent(self):
+        # Answers after 1.5s; the deadline (0.5s) is shorter than the request timeout (10s)
+        rows = make_rows(2)
+        self.stub.reset([("slow", 1.5)])
+        started = time.perf_counter()
+        result = self.dispatcher(timeout_seconds=10, deadline_seconds=0.5, max_retries=10).dispatch(rows)
+        elapsed = time.perf_counter() - started
+        self.assertEqual((result.unknown, result.failed, self.stub.attempts), (2, 0, 1))
+        self.assertLess(elapsed, 1.0)
+
+        time.sleep(1.5)
+        self.assertEqual(len(self.stub.received), 1, "the slow webhook never accepted the message")
+        self.stub.reset()
+        result = self.dispatcher().dispatch(rows)
+        self.assertEqual((result.skipped, self.stub.attempts), (2, 0))
+
+    def test_messages_past_the_deadline_are_not_sent_and_stay_pending(self):
+        # 4 messages/s and a 0.6s deadline leave room for 3 of 5
+        rows = make_rows(5 * MAX_LINES)
+        self.assertEqual(len(chunk_rows(rows)), 5)
+        started = time.perf_counter()
+        result = self.dispatcher(rate_per_second=4, deadline_seconds=0.6).dispatch(rows)
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual((self.stub.attempts, result.sent, result.failed), (3, 3 * MAX_LINES, 2 * MAX_LINES))
+        self.stub.reset()
+        result = self.dispatcher().dispatch(rows)
+        self.assertEqual((result.sent, result.skipped), (2 * MAX_LINES, 3 * MAX_LINES))
+
+
+if __name__ == "__main__":
+    unittest.main()
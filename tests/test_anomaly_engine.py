@@ -0,0 +1,117 @@
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_pipeline import DUCKDB_COMPAT, MODELS, build_model, render_model
+from anomaly_engine import score_metrics
+from load_csvs import load_table
+from score_anomalies import daily_totals, recent_anomalies
+from utils import pooled_conn
+
+SCORE_COLUMNS = ["date", "city", "bookings_total", "ma30", "sd30", "zscore", "is_anomaly"]
+
+
+def rows(df: pd.DataFrame) -> list[tuple]:
+    df = df[SCORE_COLUMNS].sort_values(["city", "date"])
+    return [
+        tuple(None if isinstance(v, float) and np.isnan(v) else round(v, 9) if isinstance(v, float) else v for v in r)
+        for r in df.itertuples(index=False)
+    ]
+
+
+def fetch_df(con, sql: str) -> pd.DataFrame:
+    cur = con.execute(sql)
+    return pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+
+
+def bookings(totals: dict[str, list[int]], last_day: date) -> pd.DataFrame:
+    """totals[city][i] bookings on last_day - (len - 1 - i) days."""
+    out = []
+    for city, counts in totals.items():
+        for i, n in enumerate(counts):
+            day = pd.Timestamp(last_day - timedelta(days=len(counts) - 1 - i))
+            for _ in range(n):
+                requested = day + pd.Timedelta(hours=9)
+                out.append({
+                    "booking_id": f"B{len(out) + 1:06d}",
+                    "customer_id": "C00001",
+                    "worker_id": "W00001",
+                    "city": city,
+                    "channel": "app",
+                    "status": "completed",
+                    "price": 100.0,
+                    "requested_at": requested,
+                    "assigned_at": requested + pd.Timedelta(minutes=20),
+                    "completed_at": requested + pd.Timedelta(hours=3),
+                    "canceled_at": None,
+                    "updated_at": requested + pd.Timedelta(hours=4),
+                })
+    return pd.DataFrame(out)
+
+
+class ModelParityTest(unittest.TestCase):
+    """score_metrics() agrees with anomalies_daily.sql (full refresh) row for row."""
+
+    def test_matches_rendered_model(self):
+        rng = np.random.default_rng(7)
+        days = pd.date_range("2024-01-01", periods=120, freq="D").date
+        totals = rng.poisson(20, size=(len(days), 4))
+        totals[rng.random(totals.shape) < 0.03] *= 5
+        totals[:45, 0] = 6  # flat run: sd30 == 0
+        metrics = pd.DataFrame({
+            "date": np.repeat(days, 4),
+            "city": np.tile(["a", "b", "c", "d"], len(days)),
+            "bookings_total": totals.ravel(),
+        })
+        metrics = metrics[~((metrics["city"] == "d") & (rng.random(len(metrics)) < 0.5))]  # sparse city
+
+        with pooled_conn() as conn:
+            con = conn.raw
+            for stmt in DUCKDB_COMPAT:
+                con.execute(stmt)
+            con.execute("create schema if not exists MARTS")
+            con.register("metrics", metrics)
+            con.execute("create or replace table MARTS.metrics_daily as select *, localtimestamp as refreshed_at from metrics")
+            con.unregister("metrics")
+            sql_out = fetch_df(con, render_model("anomalies_daily", incremental=False))
+        self.assertTrue(sql_out["is_anomaly"].any())
+        self.assertEqual(rows(score_metrics(metrics)), rows(sql_out))
+
+
+class ScoreAnomaliesTest(unittest.TestCase):
+    """Scores computed from RAW.BOOKINGS right after a load match what dbt builds."""
+
+    def setUp(self):
+        with pooled_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("delete from RAW.BOOKINGS")
+            cur.execute("delete from OPS.INGESTION_WATERMARKS")
+            cur.close()
+        rng = np.random.default_rng(3)
+        self.today = date.today()
+        totals = {city: list(rng.integers(3, 7, size=40)) for city in ("Dubai", "Sharjah")}
+        totals["Dubai"][-1] = 25
+        load_table(bookings(totals, self.today), "RAW.BOOKINGS", key_cols=["booking_id"])
+
+    def test_recent_anomalies(self):
+        with pooled_conn() as conn:
+            totals = daily_totals(conn)
+        hits = recent_anomalies(totals, days=2)
+        self.assertEqual([(r["DATE"], r["CITY"], r["BOOKINGS_TOTAL"]) for r in hits], [(self.today, "Dubai", 25)])
+
+    def test_matches_anomalies_daily_after_dbt(self):
+        with pooled_conn() as conn:
+            for stmt in DUCKDB_COMPAT:
+                conn.raw.execute(stmt)
+            conn.raw.execute("create schema if not exists MARTS")
+            for name, materialized, unique_key in MODELS:
+                build_model(conn.raw, name, materialized, unique_key, incremental=False)
+            built = fetch_df(conn.raw, "select * from MARTS.anomalies_daily")
+            totals = daily_totals(conn)
+        self.assertEqual(rows(score_metrics(totals)), rows(built))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import tempfile
+import time
+import unittest
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from tests.stubs import ArchiveStub
+
+import fetch_weather
+from fetch_weather import ResponseCache, fetch_all, fetch_city_daily
+
+PARAMS = {
+    "latitude": 25.28,
+    "longitude": 55.30,
+    "start_date": "2024-01-01",
+    "end_date": "2024-01-07",
+    "daily": fetch_weather.DAILY_PARAMS,
+    "timezone": "Asia/Dubai",
+}
+
+
+class StubTestCase(unittest.TestCase):
+    latency = 0.0
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = ArchiveStub(latency=cls.latency)
+        cls.addClassCleanup(cls.stub.close)
+
+    def setUp(self):
+        self.stub.reset()
+        for name, value in (("ARCHIVE_URL", self.stub.url), ("BACKOFF_SECONDS", 0.01)):
+            patcher = mock.patch.object(fetch_weather, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class GetJsonTest(StubTestCase):
+    def test_retries_throttling_and_server_errors(self):
+        self.stub.reset([("status", 429, "0"), ("status", 503), ("status", 500), ("status", 502)])
+        j = fetch_weather._get_json(PARAMS)
+        self.assertEqual(len(j["daily"]["time"]), 7)
+        self.assertEqual(self.stub.attempts, 5)
+
+    def test_client_error_is_not_retried(self):
+        self.stub.reset([("status", 400)])
+        with self.assertRaises(requests.HTTPError):
+            fetch_weather._get_json(PARAMS)
+        self.assertEqual(self.stub.attempts, 1)
+
+    def test_raises_once_retries_are_exhausted(self):
+        self.stub.reset([("status", 503)] * (fetch_weather.MAX_RETRIES + 1))
+        with self.assertRaises(requests.HTTPError):
+            fetch_weather._get_json(PARAMS)
+        self.assertEqual(self.stub.attempts, fetch_weather.MAX_RETRIES + 1)
+
+    def test_retry_after_wins_over_backoff(self):
+        self.stub.reset([("status", 429, "1")])
+        started = time.perf_counter()
+        fetch_weather._get_json(PARAMS)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(self.stub.attempts, 2)
+        # 1s plus at most 50% jitter, far above the 0.01s backoff
+        self.assertGreaterEqual(elapsed, 1.0)
+        self.assertLess(elapsed, 2.0)
+
+
+class MonthCacheTest(StubTestCase):
+    START, END = date(2024, 1, 15), date(2024, 4, 10)
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = ResponseCache(Path(tmp.name))
+
+    def fetch(self):
+        return fetch_city_daily("Dubai", 25.28, 55.30, "Asia/Dubai", self.START, self.END, cache=self.cache)
+
+    def test_one_request_per_month_then_none(self):
+        df = self.fetch()
+        self.assertEqual(len(df), (self.END - self.START).days + 1)
+        self.assertEqual(self.stub.requests, [
+            ("2024-01-15", "2024-01-31"),
+            ("2024-02-01", "2024-02-29"),
+            ("2024-03-01", "2024-03-31"),
+            ("2024-04-01", "2024-04-10"),
+        ])
+
+        self.stub.reset()
+        again = self.fetch()
+        self.assertEqual(self.stub.attempts, 0)
+        self.assertTrue(again.drop(columns="updated_at").equals(df.drop(columns="updated_at")))
+
+    def test_unpublished_month_is_not_cached(self):
+        self.stub.unpublished_from = date(2024, 4, 5)
+        self.addCleanup(setattr, self.stub, "unpublished_from", None)
+        self.fetch()
+        self.stub.reset()
+        self.fetch()
+        self.assertEqual(self.stub.requests, [("2024-04-01", "2024-04-10")])
+
+
+class ConcurrencyTest(StubTestCase):
+    # Slow enough that unbounded fetching would overlap every request
+    latency = 0.2
+
+    def test_requests_in_flight_stay_within_max_workers(self):
+        cities = {f"city_{i}": {"lat": 25.0, "lon": 55.0, "tz": "Asia/Dubai"} for i in range(8)}
+        for max_workers in (1, 3):
+            with self.subTest(max_workers=max_workers):
+                self.stub.reset()
+                frames = fetch_all(cities, date(2024, 1, 1), date(2024, 1, 7), max_workers=max_workers)
+                self.assertEqual(len(frames), len(cities))
+                self.assertEqual(self.stub.attempts, len(cities))
+                self.assertEqual(self.stub.max_in_flight, max_workers)
+
+
+if __name__ == "__main__":
+    unittest.main()
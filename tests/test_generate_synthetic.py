@@ -0,0 +1,28 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from columnar import with_formatted_ids
+from generate_synthetic import gen_bookings_vectorized, gen_customers_vectorized, gen_workers_vectorized, id_formats
+
+
+class BookingIdTest(unittest.TestCase):
+    def test_ids_match_the_faker_baseline_at_every_scale(self):
+        ids = pd.DataFrame({"booking_id": [1, 42, 999_999, 1_000_000, 12_345_678]})
+        formatted = with_formatted_ids(ids, id_formats())["booking_id"].tolist()
+        self.assertEqual(formatted, [f"B{i:06d}" for i in ids["booking_id"]])
+
+    def test_shard_ranges_format_like_a_single_run(self):
+        rng = np.random.default_rng(42)
+        customers = gen_customers_vectorized(20, rng, seed=42)
+        workers = gen_workers_vectorized(10, rng, seed=42)
+        whole = gen_bookings_vectorized(customers, workers, 100, rng)
+        tail = gen_bookings_vectorized(customers, workers, 40, rng, id_start=61)
+        whole_ids = with_formatted_ids(whole, id_formats())["booking_id"].tolist()
+        tail_ids = with_formatted_ids(tail, id_formats())["booking_id"].tolist()
+        self.assertEqual(tail_ids, whole_ids[60:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from columnar import to_arrow, write_parquet
+from load_csvs import load_files, load_table
+from utils import filter_since_watermark, get_watermark, pooled_conn, set_watermark
+
+WATERMARK = pd.Timestamp("2024-03-01 12:00:00")
+
+
+def weather(city: str, updated_at: pd.Timestamp) -> pd.DataFrame:
+    return pd.DataFrame({
+        "city": [city],
+        "date": [pd.Timestamp("2024-03-01")],
+        "temp_max": [30.0],
+        "temp_min": [20.0],
+        "precipitation": [0.0],
+        "windspeed_max": [10.0],
+        "updated_at": [updated_at],
+    })
+
+
+class FilterSinceWatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "id": [1, 2, 3, 4],
+            "updated_at": [WATERMARK - pd.Timedelta(seconds=1), WATERMARK, WATERMARK + pd.Timedelta(seconds=1), None],
+        })
+
+    def test_pandas_keeps_ties_and_nulls(self):
+        self.assertEqual(filter_since_watermark(self.df, WATERMARK)["id"].tolist(), [2, 3, 4])
+
+    def test_arrow_keeps_ties_and_nulls(self):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(self.df, preserve_index=False)
+        self.assertEqual(filter_since_watermark(table, WATERMARK)["id"].to_pylist(), [2, 3, 4])
+
+
+class WatermarkTieTest(unittest.TestCase):
+    """A row stamped exactly at the stored watermark, arriving in a later batch, is still loaded."""
+
+    def setUp(self):
+        with pooled_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("delete from RAW.WEATHER")
+            cur.execute("delete from OPS.INGESTION_WATERMARKS where source_name = 'RAW.WEATHER'")
+            cur.close()
+
+    def stored_cities(self) -> list[str]:
+        with pooled_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("select city from RAW.WEATHER order by city")
+            cities = [r[0] for r in cur.fetchall()]
+            cur.close()
+        return cities
+
+    def test_load_table(self):
+        load_table(weather("Dubai", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        load_table(weather("Sharjah", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        self.assertEqual(self.stored_cities(), ["Dubai", "Sharjah"])
+
+    def test_load_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for city in ("Dubai", "Sharjah"):
+                paths.append(Path(tmp) / f"{city}.parquet")
+                write_parquet(weather(city, WATERMARK), paths[-1], "RAW.WEATHER")
+            load_files(paths[:1], "RAW.WEATHER", key_cols=["city", "date"])
+            result = load_files(paths[1:], "RAW.WEATHER", key_cols=["city", "date"])
+        self.assertEqual(result.rows_inserted, 1)
+        self.assertEqual(self.stored_cities(), ["Dubai", "Sharjah"])
+
+    def test_reloading_a_tie_changes_nothing(self):
+        load_table(weather("Dubai", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        result = load_table(to_arrow(weather("Dubai", WATERMARK), "RAW.WEATHER"), "RAW.WEATHER", key_cols=["city", "date"])
+        self.assertEqual((result.rows_staged, result.rows_inserted, result.rows_updated), (1, 0, 0))
+        with pooled_conn() as conn:
+            self.assertEqual(get_watermark(conn, "RAW.WEATHER"), WATERMARK)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+
+import pandas as pd
+
+from benchmarks.bench_pipeline import DUCKDB_COMPAT, MODELS, build_model
+from load_csvs import load_table
+from utils import pooled_conn
+
+CITIES = ["Abu Dhabi", "Dubai", "Sharjah"]
+FIRST_DAY = pd.Timestamp("2024-01-01")
+CHANGED_AT = pd.Timestamp("2024-03-10")
+# Columns stamped with the build time, so they differ between any two builds
+BUILD_STAMPS = {"refreshed_at", "metrics_refreshed_at"}
+
+
+def bookings(n_days: int = 60) -> pd.DataFrame:
+    """
+    A few bookings per city and day, with counts that vary so z-scores do too,
+    each last updated the day it was requested: only the last few dates fall
+    inside the marts' lookback.
+    """
+    rows = []
+    for day in range(n_days):
+        for c, city in enumerate(CITIES):
+            for k in range(1 + (day * (c + 2)) % 5):
+                requested = FIRST_DAY + pd.Timedelta(days=day, hours=8 + k)
+                rows.append({
+                    "booking_id": f"B{len(rows) + 1:06d}",
+                    "customer_id": "C00001",
+                    "worker_id": "W00001",
+                    "city": city,
+                    "channel": "app",
+                    "status": "completed" if k % 3 else "canceled",
+                    "price": 100.0,
+                    "requested_at": requested,
+                    "assigned_at": requested + pd.Timedelta(minutes=20),
+                    "completed_at": requested + pd.Timedelta(hours=3) if k % 3 else None,
+                    "canceled_at": None if k % 3 else requested + pd.Timedelta(hours=1),
+                    "updated_at": requested + pd.Timedelta(hours=4),
+                })
+    return pd.DataFrame(rows)
+
+
+class MartsIncrementalTest(unittest.TestCase):
+    """An incremental build of the marts after changes in RAW matches a full rebuild."""
+
+    def setUp(self):
+        with pooled_conn() as conn:
+            cur = conn.cursor()
+            for table in ("RAW.BOOKINGS", "RAW.WEATHER"):
+                cur.execute(f"delete from {table}")
+            cur.execute("delete from OPS.INGESTION_WATERMARKS")
+            cur.close()
+            for stmt in DUCKDB_COMPAT:
+                conn.raw.execute(stmt)
+            conn.raw.execute("create schema if not exists MARTS")
+        self.bookings = bookings()
+        load_table(self.bookings, "RAW.BOOKINGS", key_cols=["booking_id"])
+
+    def build(self, incremental: bool) -> None:
+        with pooled_conn() as conn:
+            for name, materialized, unique_key in MODELS:
+                if materialized == "view" and incremental:
+                    continue
+                build_model(conn.raw, name, materialized, unique_key, incremental)
+
+    def mart(self, name: str) -> list[tuple]:
+        with pooled_conn() as conn:
+            stamps = ", ".join(sorted(BUILD_STAMPS & set(self.columns(conn, name))))
+            rows = conn.raw.execute(f"select * exclude ({stamps}) from MARTS.{name} order by date, city").fetchall()
+        return [tuple(round(v, 9) if isinstance(v, float) else v for v in row) for row in rows]
+
+    def columns(self, conn, name: str) -> list[str]:
+        return [d[0] for d in conn.raw.execute(f"select * from MARTS.{name} limit 0").description]
+
+    def change(self, updates: pd.DataFrame) -> None:
+        load_table(updates.assign(updated_at=CHANGED_AT), "RAW.BOOKINGS", key_cols=["booking_id"])
+
+    def assert_incremental_matches_full_rebuild(self) -> None:
+        self.build(incremental=True)
+        incremental = {name: self.mart(name) for name in ("metrics_daily", "anomalies_daily")}
+        self.build(incremental=False)
+        for name, rows in incremental.items():
+            with self.subTest(mart=name):
+                self.assertEqual(rows, self.mart(name))
+
+    def moved(self, rows: pd.DataFrame, days: int = 0, city: str | None = None) -> pd.DataFrame:
+        rows = rows.copy()
+        for col in ("requested_at", "assigned_at", "completed_at", "canceled_at"):
+            rows[col] = rows[col] + pd.Timedelta(days=days)
+        return rows.assign(city=city) if city else rows
+
+    def on(self, day: int, city: str | None = None) -> pd.DataFrame:
+        b = self.bookings
+        mask = b["requested_at"].dt.normalize() == FIRST_DAY + pd.Timedelta(days=day)
+        return b[mask & (b["city"] == city)] if city else b[mask]
+
+    def test_booking_moved_to_another_date(self):
+        self.build(incremental=False)
+        self.change(self.moved(self.on(10, "Dubai").head(1), days=25))
+        self.assert_incremental_matches_full_rebuild()
+
+    def test_last_booking_of_a_city_moved_away_leaves_no_row(self):
+        self.build(incremental=False)
+        # Day 0 has one booking per city
+        self.change(self.moved(self.on(0, "Sharjah"), days=3, city="Dubai"))
+        self.assert_incremental_matches_full_rebuild()
+
+    def test_every_booking_of_a_date_moved_away(self):
+        self.build(incremental=False)
+        self.change(self.moved(self.on(20), days=1))
+        self.assert_incremental_matches_full_rebuild()
+
+    def test_city_changed_and_new_bookings(self):
+        self.build(incremental=False)
+        new = self.moved(self.on(59), days=1).assign(booking_id=lambda d: "N" + d["booking_id"])
+        self.change(pd.concat([self.moved(self.on(40, "Abu Dhabi"), city="Sharjah"), new]))
+        self.assert_incremental_matches_full_rebuild()
+
+    def test_status_change(self):
+        self.build(incremental=False)
+        self.change(self.on(30).assign(status="canceled"))
+        self.assert_incremental_matches_full_rebuild()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+import pandas as pd
+
+from load_csvs import load_table
+from utils import clear_pending_sources, get_pending_sources, pooled_conn
+
+from tests.test_incremental_load import WATERMARK, weather
+
+
+def pending() -> list[str]:
+    with pooled_conn() as conn:
+        return get_pending_sources(conn)
+
+
+class PendingSourcesTest(unittest.TestCase):
+    """A MERGE that changes a RAW table records it as pending in the same transaction."""
+
+    def setUp(self):
+        with pooled_conn() as conn:
+            cur = conn.cursor()
+            for table in ("RAW.WEATHER", "OPS.DBT_PENDING_SOURCES"):
+                cur.execute(f"delete from {table}")
+            cur.execute("delete from OPS.INGESTION_WATERMARKS")
+            cur.close()
+
+    def test_changed_table_is_pending_until_built(self):
+        load_table(weather("Dubai", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        self.assertEqual(pending(), ["weather"])
+        with pooled_conn() as conn:
+            clear_pending_sources(conn, ["weather"])
+        self.assertEqual(pending(), [])
+
+    def test_unchanged_reload_is_not_pending(self):
+        load_table(weather("Dubai", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        with pooled_conn() as conn:
+            clear_pending_sources(conn, ["weather"])
+        load_table(weather("Dubai", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        self.assertEqual(pending(), [])
+
+    def test_stays_pending_when_a_later_load_fails(self):
+        load_table(weather("Dubai", WATERMARK), "RAW.WEATHER", key_cols=["city", "date"])
+        broken = weather("Sharjah", WATERMARK + pd.Timedelta(hours=1)).assign(temp_max="not a number")
+        with self.assertRaises(Exception):
+            load_table(broken, "RAW.WEATHER", key_cols=["city", "date"])
+        self.assertEqual(pending(), ["weather"])
+
+
+if __name__ == "__main__":
+    unittest.main()